@@ -0,0 +1,295 @@
+"""Analisis batch rekaman sesi dari command line (tanpa GUI)
+
+Menjalankan deteksi detak + statistik HR/HRV hr_engine atas banyak rekaman
+(direktori arsip sesi atau file .npy) secara paralel dengan ProcessPoolExecutor:
+
+    python -m hr_batch analyze sessions/ -o hasil.csv
+    python -m hr_batch analyze rekaman/*.npy -o hasil.parquet --db -j 8
+
+Setiap rekaman dipecah menjadi chunk waktu (BATCH_CHUNK_SECONDS) dengan
+overlap di kedua sisi, sehingga satu rekaman panjang pun memakai semua core.
+Worker hanya mengembalikan waktu detak di bagian inti chunk-nya; statistik
+dihitung sekali per rekaman dari gabungan detak, jadi RR di batas chunk tetap
+terhitung dan hasilnya sama dengan analisis satu file utuh.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import psycopg2
+import hr_engine as engine
+
+BATCH_CHUNK_SECONDS = 3600.0  # Rekaman lebih panjang dipecah per chunk (detik)
+BATCH_CHUNK_OVERLAP = 30.0  # Detik tambahan di kedua sisi chunk (transien filter + jarak puncak)
+
+RESULT_COLUMNS = [
+    'file', 'subject', 'session_start', 'total_samples', 'duration_seconds', 'sampling_rate',
+    'beats_detected', 'valid_beats', 'avg_hr', 'min_hr', 'max_hr', 'std_hr',
+    'rmssd', 'sdnn', 'avg_rr', 'classification', 'condition', 'error',
+]
+
+def expand_paths(patterns):
+    """Rekaman dari argumen: file .npy, direktori arsip, direktori berisi arsip, atau glob"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]  # Glob juga di shell tanpa ekspansi (Windows)
+        for path in matches:
+            if os.path.isdir(path) and not os.path.exists(os.path.join(path, "meta.json")):
+                # Mis. ARCHIVE_DIR: ambil semua arsip sesi + file .npy di dalamnya
+                paths.extend(sorted(
+                    os.path.join(path, name) for name in os.listdir(path)
+                    if name.endswith(".npy") or os.path.exists(os.path.join(path, name, "meta.json"))
+                ))
+            else:
+                paths.append(path)
+    return list(dict.fromkeys(paths))  # Buang duplikat, urutan tetap
+
+def recording_meta(path):
+    """meta.json arsip sesi (dict kosong untuk file .npy tunggal)"""
+    if not os.path.isdir(path):
+        return {}
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+def plan_shards(count, chunk_samples):
+    """Rentang inti [start, stop) per chunk; rekaman pendek = satu chunk"""
+    chunk_samples = max(1, int(chunk_samples))
+    return [(start, min(start + chunk_samples, count)) for start in range(0, count, chunk_samples)]
+
+def analyze_shard(path, start, stop, overlap, fs, min_height=None, min_distance=None):
+    """Worker: waktu detak di inti [start, stop) satu rekaman
+    
+    Sinyal dibaca dari memmap dengan overlap di kedua sisi agar filter
+    zero-phase dan jarak minimum puncak di tepi chunk sama dengan analisis
+    utuh; detak di overlap menjadi milik chunk tetangga.
+    """
+    samples = engine.load_recorded_samples(path)
+    count = len(samples)
+    window = samples[max(0, start - overlap):min(count, stop + overlap)]
+    time_data = np.asarray(window['time'], dtype=float)
+    ppg_data = np.asarray(window['ac'], dtype=float)
+    
+    peak_times, _, _ = engine.detect_heartbeats(ppg_data, time_data, min_height, min_distance, fs=fs)
+    
+    core_start = float(samples[start]['time'])
+    core_end = float(samples[stop]['time']) if stop < count else np.inf
+    return peak_times[(peak_times >= core_start) & (peak_times < core_end)]
+
+def recording_span(samples):
+    """(jumlah sampel, waktu pertama, waktu terakhir); memmap tidak perlu disimpan"""
+    return len(samples), float(samples[0]['time']), float(samples[-1]['time'])
+
+def summarize_recording(path, meta, span, peak_times):
+    """Baris tabel hasil + AnalysisResult (untuk laporan teks) dari detak gabungan"""
+    stats = engine.BeatStats()
+    stats.update(np.diff(peak_times))
+    summary = engine.summarize_beats(stats.summary(), len(peak_times))
+    
+    total, first_time, last_time = span
+    measured_rate = meta.get('measured_rate') or (
+        (total - 1) / (last_time - first_time) if last_time > first_time else meta['sampling_rate'])
+    
+    result = engine.AnalysisResult(
+        summary=summary,
+        peak_times=peak_times,
+        total_samples=total,
+        duration=last_time,
+        measured_rate=measured_rate,
+        drift_ppm=(measured_rate / meta['sampling_rate'] - 1.0) * 1e6,
+        aggregate_count=meta.get('aggregates', total // engine.BUFFER_SIZE),
+        raw_downsampled_count=total // engine.DOWNSAMPLE_RATE,
+        finished_at=time.time(),
+    )
+    
+    row = empty_result_row(path, meta)
+    row.update({
+        'total_samples': total,
+        'duration_seconds': last_time,
+        'sampling_rate': measured_rate,
+        **{name: summary[name] for name in (
+            'beats_detected', 'valid_beats', 'avg_hr', 'min_hr', 'max_hr', 'std_hr',
+            'rmssd', 'sdnn', 'avg_rr', 'classification', 'condition')},
+    })
+    if summary['valid_beats'] < 2:
+        row['error'] = f"Perlu setidaknya 2 detak jantung valid (terdeteksi {len(peak_times)})"
+    return row, result
+
+def empty_result_row(path, meta):
+    row = dict.fromkeys(RESULT_COLUMNS)
+    epoch = meta.get('session_epoch')
+    if epoch is None and os.path.exists(path):
+        epoch = os.path.getmtime(path)
+    row.update({
+        'file': path,
+        'subject': meta.get('subject') or os.path.splitext(os.path.basename(os.path.normpath(path)))[0],
+        'session_start': pd.Timestamp(epoch, unit='s') if epoch is not None else None,
+    })
+    return row
+
+def analyze_recordings(paths, jobs=None, chunk_seconds=BATCH_CHUNK_SECONDS,
+                       overlap_seconds=BATCH_CHUNK_OVERLAP, min_height=None, min_distance=None):
+    """Analisis paralel banyak rekaman; kembalikan list (row, AnalysisResult atau None)
+    
+    Urutan hasil sama dengan urutan paths. Rekaman yang gagal dibuka atau
+    terlalu pendek tetap punya baris dengan kolom 'error'.
+    """
+    results = [None] * len(paths)
+    pending = {}  # indeks rekaman -> [meta, span, detak per chunk, chunk tersisa]
+    
+    def finish(index):
+        meta, span, chunks, _ = pending.pop(index)
+        results[index] = summarize_recording(paths[index], meta, span, np.concatenate(chunks))
+        row = results[index][0]
+        done = sum(result is not None for result in results)
+        if row['error']:
+            print(f"⚠️ [{done}/{len(paths)}] {paths[index]}: {row['error']}")
+        else:
+            print(f"✅ [{done}/{len(paths)}] {paths[index]}: {row['avg_hr']:.1f} BPM, "
+                  f"{row['beats_detected']} detak, RMSSD {row['rmssd']:.1f} ms")
+    
+    def fail(index, error):
+        pending.pop(index, None)
+        meta = {}
+        try:
+            meta = recording_meta(paths[index])
+        except (OSError, ValueError):
+            pass
+        row = empty_result_row(paths[index], meta)
+        row['error'] = str(error)
+        results[index] = (row, None)
+        print(f"❌ [{sum(result is not None for result in results)}/{len(paths)}] {paths[index]}: {error}")
+    
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for index, path in enumerate(paths):
+            try:
+                meta = recording_meta(path)
+                samples = engine.load_recorded_samples(path)
+                if len(samples) < engine.MIN_ANALYSIS_SAMPLES:
+                    raise ValueError(f"Tidak cukup data untuk analisis "
+                                     f"({len(samples)} < {engine.MIN_ANALYSIS_SAMPLES} titik)")
+                span = recording_span(samples)
+                # Laju nominal dari meta arsip; file .npy lepas ditaksir dari waktunya
+                meta.setdefault('sampling_rate', engine.recorded_rate(samples))
+                del samples  # Worker membuka memmap sendiri; jangan tahan ribuan file terbuka
+            except (OSError, ValueError, KeyError) as e:
+                fail(index, e)
+                continue
+            
+            fs = meta['sampling_rate']
+            shards = plan_shards(span[0], chunk_seconds * fs)
+            overlap = int(overlap_seconds * fs)
+            pending[index] = [meta, span, [None] * len(shards), len(shards)]
+            for shard, (start, stop) in enumerate(shards):
+                future = executor.submit(analyze_shard, path, start, stop, overlap, fs, min_height, min_distance)
+                futures[future] = (index, shard)
+        
+        for future in as_completed(futures):
+            index, shard = futures[future]
+            if index not in pending:
+                continue  # Chunk lain rekaman ini sudah gagal
+            try:
+                peak_times = future.result()
+            except Exception as e:
+                fail(index, e)
+                continue
+            state = pending[index]
+            state[2][shard] = peak_times
+            state[3] -= 1
+            if state[3] == 0:
+                finish(index)
+    return results
+
+def write_results(rows, output):
+    """Tulis semua baris ke satu tabel CSV atau Parquet (dari ekstensi file)"""
+    frame = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    # Baris gagal berisi None: pakai integer nullable agar kolom hitungan tidak jadi float
+    frame = frame.astype({'total_samples': 'Int64', 'beats_detected': 'Int64', 'valid_beats': 'Int64'})
+    if output.lower().endswith(".parquet"):
+        frame.to_parquet(output, index=False)
+    else:
+        frame.to_csv(output, index=False)
+
+def store_results(results):
+    """Simpan rekaman yang berhasil ke measurements + analysis_results (massal)"""
+    records = []
+    for row, result in results:
+        if result is None or row['error']:
+            continue
+        measurement = (row['subject'], row['duration_seconds'], row['total_samples'], row['sampling_rate'],
+                       f"Analisis batch - {os.path.abspath(row['file'])}")
+        records.append((measurement, result.summary, engine.format_analysis_report(result, row['subject'])))
+    if not records:
+        return []
+    
+    conn = psycopg2.connect(**engine.DB_CONFIG)
+    try:
+        with conn:  # Satu transaksi: semua tersimpan atau tidak sama sekali
+            engine.create_tables(conn)
+            return engine.store_analyses(conn, records)
+    finally:
+        conn.close()
+
+def run_analyze(args):
+    paths = expand_paths(args.paths)
+    if not paths:
+        print("❌ Tidak ada rekaman ditemukan")
+        return 2
+    if not args.output and not args.db:
+        print("❌ Pilih tujuan hasil: --output FILE dan/atau --db")
+        return 2
+    if args.output and args.output.lower().endswith(".parquet") and engine.pyarrow is None:
+        print("❌ Ekspor Parquet memerlukan paket 'pyarrow' (pip install pyarrow)")
+        return 2
+    
+    print(f"🔬 Analisis {len(paths)} rekaman dengan {args.jobs or os.cpu_count()} proses "
+          f"(chunk {args.chunk_seconds:.0f} s, overlap {args.overlap:.0f} s)")
+    started = time.perf_counter()
+    results = analyze_recordings(paths, args.jobs, args.chunk_seconds, args.overlap,
+                                 args.min_height, args.min_distance)
+    rows = [row for row, _ in results]
+    failed = sum(1 for row in rows if row['error'])
+    print(f"⏱️ Selesai dalam {time.perf_counter() - started:.1f} detik: "
+          f"{len(rows) - failed} berhasil, {failed} gagal")
+    
+    if args.output:
+        write_results(rows, args.output)
+        print(f"📄 Hasil ditulis ke {args.output}")
+    if args.db:
+        try:
+            ids = store_results(results)
+        except psycopg2.Error as e:
+            print(f"❌ Gagal menyimpan ke database: {e}")
+            return 1
+        print(f"🗄️ {len(ids)} hasil analisis disimpan ke database")
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m hr_batch",
+                                     description="Analisis batch rekaman detak jantung (tanpa GUI)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    analyze = commands.add_parser("analyze", help="Analisis rekaman sesi secara paralel")
+    analyze.add_argument("paths", nargs="+",
+                         help="Direktori arsip sesi, file .npy, direktori berisi arsip, atau pola glob")
+    analyze.add_argument("-o", "--output", help="Tabel hasil (.csv atau .parquet)")
+    analyze.add_argument("--db", action="store_true", help="Simpan hasil ke tabel analysis_results (massal)")
+    analyze.add_argument("-j", "--jobs", type=int, default=None, help="Jumlah proses (default: semua core)")
+    analyze.add_argument("--chunk-seconds", type=float, default=BATCH_CHUNK_SECONDS,
+                         help="Panjang chunk per tugas worker (detik)")
+    analyze.add_argument("--overlap", type=float, default=BATCH_CHUNK_OVERLAP,
+                         help="Overlap di kedua sisi chunk (detik)")
+    analyze.add_argument("--min-height", type=float, default=None, help="Tinggi minimum puncak")
+    analyze.add_argument("--min-distance", type=int, default=None, help="Jarak minimum puncak (sampel)")
+    analyze.set_defaults(handler=run_analyze)
+    
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3153 @@
+"""Engine pemrosesan PPG / detak jantung tanpa GUI
+
+Ingest (sumber data → parser/DSP → sample store), deteksi detak, statistik,
+arsip sesi dan database sebagai API biasa dengan objek hasil. Modul ini tidak
+mengimpor Tk maupun matplotlib sehingga bisa dipakai dari service atau CLI;
+one_file_main.py adalah salah satu klien (GUI Tk) di atasnya.
+
+State sesi (collecting, start_time, is_settling, active_source, ...) di-rebind
+oleh fungsi engine, jadi klien membacanya lewat hr_engine.<nama>, bukan salinan
+hasil import. Callback ke klien (hasil job database, sumber habis) dijalankan
+lewat client_dispatch; tanpa dispatcher, callback dipanggil langsung dari
+thread engine.
+"""
+import pandas as pd
+from scipy.signal import butter, find_peaks, sosfilt, sosfilt_zi, sosfiltfilt
+import numpy as np
+import time
+import serial
+import serial.tools.list_ports
+import threading
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
+import queue
+import socket
+import io
+import struct
+import datetime
+import csv
+import json
+import os
+import atexit
+import tempfile
+import warnings
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from functools import lru_cache
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Ekspor Parquet opsional
+    pyarrow = None
+
+try:
+    import websockets.exceptions
+    import websockets.sync.client
+except ImportError:  # Sumber WebSocket opsional
+    websockets = None
+
+# Global variables (state sesi)
+collecting = False
+start_time = None
+
+# Sumber data (serial, jaringan, simulator, replay)
+active_source = None  # DataSource yang sedang dibaca thread reader
+parked_source = None  # Sumber realtime yang tetap terbuka selama replay, dibaca lagi setelahnya
+serial_thread = None
+serial_running = False
+
+# Serial Configuration - EDIT DI SINI!
+DEFAULT_PORT = "COM3"  # ← GANTI SESUAI PORT KAMU
+DEFAULT_BAUDRATE = 115200
+READ_CHUNK_SIZE = 4096  # Byte maksimum per pembacaan bulk
+SERIAL_PROTOCOL = "ascii"  # "ascii" (baris "AC THRESHOLD BEAT") atau "binary" (frame biner)
+SERIAL_READ_TIMEOUT = 0.1  # Detik; read blocking tanpa busy loop
+NETWORK_DEFAULT_URI = "ws://10.103.215.83:81"  # ESP32 WebSocket (lihat practice/main.py); tcp://host:port juga bisa
+
+# PostgreSQL Configuration - EDIT DI SINI!
+DB_CONFIG = {
+    "host": "localhost",
+    "port": 5432,
+    "database": "heart_rate_db",
+    "user": "postgres",
+    "password": "marcellganteng"
+}
+
+# Database connection (pool + thread writer, lihat DatabaseWriter)
+DB_POOL_MIN = 1
+DB_POOL_MAX = 4
+DB_RETRY_ATTEMPTS = 4  # Percobaan per job saat koneksi putus
+DB_RETRY_BACKOFF = 0.5  # Detik, dikali 2 setiap percobaan ulang
+db_writer = None
+
+# Streaming time-series ke database (opt-in, lihat TimeSeriesStreamer)
+DB_STREAM_ENABLED = False  # True = agregat (dan sampel) dikirim selama pengukuran
+DB_STREAM_SAMPLES = "downsampled"  # None, "downsampled" (1/DOWNSAMPLE_RATE) atau "raw"
+DB_STREAM_FLUSH_INTERVAL = 2.0  # Detik antar batch COPY
+DB_STREAM_MAX_PENDING_ROWS = 500000  # Batas antrean saat database lambat (baris tertua dibuang)
+DB_STREAM_MAX_INFLIGHT = 8  # Batch COPY maksimum yang menunggu di thread writer
+SENSOR_ID = 0  # Identitas sensor untuk baris time-series (multi-sensor)
+
+# Bandpass filter parameters (dipakai bersama oleh semua jalur DSP)
+filter_lowcut = 0.5   # Hz
+filter_highcut = 5.0  # Hz
+filter_order = 4
+FILTER_DESIGN_CACHE_SIZE = 16  # Jumlah desain filter yang disimpan (LRU)
+
+# Heart rate detection parameters
+min_peak_height = 80  # Minimum peak height for AC signal
+min_peak_distance = 15  # Minimum distance between peaks (data points @ SAMPLING_RATE) ~0.4s
+min_peak_prominence = 10  # Minimum prominence of a peak
+PEAK_LOOKBACK_SAMPLES = 100  # Jendela lookback detektor online (sampel @ SAMPLING_RATE, ~2 detik)
+max_heart_rate = 200  # Maximum realistic heart rate (BPM)
+min_heart_rate = 40   # Minimum realistic heart rate (BPM)
+
+# Settling detection - ESP32 butuh 4 detik settling
+SETTLING_DURATION = 4.0  # detik
+is_settling = False
+settling_start_time = None
+
+# Klien engine (GUI/CLI)
+client_dispatch = None  # fn(callback, *args) yang menjalankan callback di thread klien (GUI: root.after)
+source_finished_hook = None  # Dipanggil lewat dispatch saat sumber habis; default stop_session() + release_finished_source()
+latest_analysis = None  # AnalysisResult terakhir dari analyze_session()
+
+def dispatch(callback, *args):
+    """Jalankan callback di thread klien, atau langsung jika tidak ada dispatcher"""
+    if client_dispatch is not None:
+        client_dispatch(callback, *args)
+    else:
+        callback(*args)
+
+# ============= SAMPLE STORE (RING BUFFER NUMPY) =============
+SAMPLING_RATE = 50  # Hz nominal ESP32
+sample_rate = SAMPLING_RATE  # Laju nominal sumber aktif (Hz), lihat set_sample_rate()
+session_rate = SAMPLING_RATE  # Laju nominal sesi berjalan/terakhir (analisis akhir, arsip, database)
+LIVE_WINDOW_SECONDS = 600  # Jendela live di memori (10 menit)
+SPILL_TO_DISK = True  # Simpan riwayat lengkap ke file untuk analisis akhir
+SPILL_DIR = tempfile.gettempdir()
+
+# Satu record per sampel: waktu, AC, threshold, beat marker ESP32
+SAMPLE_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('ac', 'f4'),
+    ('threshold', 'f4'),
+    ('beat', 'u1'),
+    ('filtered', 'f4'),  # Output bandpass streaming (kausal)
+])
+SAMPLE_VALUE_MAX = float(np.finfo(SAMPLE_DTYPE['ac']).max)  # Batas AC/threshold dari serial
+SAMPLE_BEAT_MAX = int(np.iinfo(SAMPLE_DTYPE['beat']).max)
+
+class NpyAppendWriter:
+    """File .npy 1-D yang bisa di-append selama akuisisi.
+
+    Header dipad ke ukuran tetap dan ditulis ulang (dengan jumlah record
+    terbaru) setiap flush(), sehingga setelah flush file selalu valid untuk
+    np.load(path, mmap_mode='r') tanpa konversi atau salinan.
+    """
+    
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        # Ruang untuk shape terpanjang, dibulatkan ke kelipatan 64 byte
+        longest = len(self._header_text(2 ** 63)) + 11
+        self.header_size = -(-longest // 64) * 64
+        self._file = open(path, 'wb')
+        self._file.write(self._header())
+    
+    def _header_text(self, count):
+        header = {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (count,),
+        }
+        return repr(header).encode('latin1')
+    
+    def _header(self):
+        body_size = self.header_size - 10  # magic (6) + versi (2) + panjang (2)
+        body = self._header_text(self.count).ljust(body_size - 1) + b'\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', body_size) + body
+    
+    def write(self, records):
+        records = np.ascontiguousarray(records, dtype=self.dtype)
+        self._file.write(records.tobytes())
+        self.count += len(records)
+    
+    def flush(self):
+        """Tulis ulang header dengan jumlah record terkini"""
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+    
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+class SampleStore:
+    """Ring buffer NumPy berkapasitas tetap untuk sampel live.
+
+    Setiap record ditulis dua kali (posisi i dan i + capacity), sehingga
+    jendela terbaru selalu kontigu dan view() tidak pernah menyalin data.
+    Jika spill_path diberikan, semua record juga di-append ke file .npy
+    agar riwayat lengkap tetap tersedia lewat history(). File baru dibuat
+    saat pertama ditulis, jadi sekadar import engine tidak menyentuh disk.
+    """
+    
+    def __init__(self, capacity, spill_path=None):
+        self.capacity = int(capacity)
+        self.spill_path = spill_path
+        self._buf = np.zeros(2 * self.capacity, dtype=SAMPLE_DTYPE)
+        self._head = 0  # Posisi tulis berikutnya, selalu < capacity
+        self.total_count = 0  # Jumlah sampel sejak reset terakhir
+        self._spill_file = None  # Dibuka oleh _spill() saat pertama ditulis
+    
+    def __len__(self):
+        return min(self.total_count, self.capacity)
+    
+    def _close_spill(self):
+        """Tutup writer spill; write berikutnya membuka (dan memotong) file lagi"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+    
+    def _spill(self):
+        """Writer spill, dibuat saat pertama dibutuhkan"""
+        if self._spill_file is None:
+            self._spill_file = NpyAppendWriter(self.spill_path, SAMPLE_DTYPE)
+        return self._spill_file
+    
+    def extend(self, block):
+        """Tambah banyak sampel sekaligus (structured array SAMPLE_DTYPE)"""
+        block = np.asarray(block, dtype=SAMPLE_DTYPE)
+        n = len(block)
+        if n == 0:
+            return
+        
+        if self.spill_path:
+            self._spill().write(block)
+        
+        self.total_count += n
+        if n >= self.capacity:
+            block = block[-self.capacity:]
+            self._head = (self._head + n) % self.capacity
+            # Blok menutupi seluruh ring: tulis ulang dengan head sebagai awal
+            ordered = np.roll(block, self._head)
+            self._buf[:self.capacity] = ordered
+            self._buf[self.capacity:] = ordered
+            return
+        
+        first = min(n, self.capacity - self._head)
+        self._buf[self._head:self._head + first] = block[:first]
+        self._buf[self._head + self.capacity:self._head + self.capacity + first] = block[:first]
+        if first < n:
+            rest = n - first
+            self._buf[:rest] = block[first:]
+            self._buf[self.capacity:self.capacity + rest] = block[first:]
+        self._head = (self._head + n) % self.capacity
+    
+    def view(self, last=None):
+        """View zero-copy dari n sampel terakhir (default: seluruh jendela live)"""
+        n = len(self) if last is None else min(int(last), len(self))
+        end = self._head + self.capacity
+        return self._buf[end - n:end]
+    
+    def column(self, name, last=None):
+        """View zero-copy satu kolom ('time', 'ac', 'threshold', 'beat', 'filtered')"""
+        return self.view(last)[name]
+    
+    def last_time(self):
+        """Waktu sampel terbaru (0 jika kosong)"""
+        if self.total_count == 0:
+            return 0.0
+        return float(self._buf[self._head - 1 + self.capacity]['time'])
+    
+    def history(self):
+        """Seluruh riwayat sesi: memmap dari file spill, atau jendela live.
+        
+        Jangan simpan referensi memmap melewati reset() (file spill dipotong).
+        """
+        if not self.spill_path or self.total_count <= self.capacity:
+            return self.view()
+        
+        self._spill().flush()
+        return np.load(self.spill_path, mmap_mode='r')
+    
+    def first_index(self):
+        """Indeks absolut sampel tertua yang masih bisa dibaca"""
+        if self.spill_path:
+            return 0
+        return self.total_count - len(self)
+    
+    def rows(self, start, stop):
+        """Sampel dengan indeks absolut [start, stop), dari jendela live atau spill"""
+        start = max(int(start), self.first_index())
+        stop = min(int(stop), self.total_count)
+        if stop <= start:
+            return self._buf[:0]
+        
+        live_start = self.total_count - len(self)
+        if start >= live_start:
+            return self.view(self.total_count - start)[:stop - start]
+        return self.history()[start:stop]
+    
+    def flush(self):
+        """Pastikan file spill valid dan lengkap di disk"""
+        if self.spill_path:
+            self._spill().flush()
+    
+    def reset(self, spill_path=None):
+        """Reset O(1): cukup pindahkan kursor, buffer tidak dialokasi ulang.
+        
+        spill_path opsional memindahkan file spill (mis. ke arsip sesi);
+        string kosong mematikan spill.
+        """
+        self._head = 0
+        self.total_count = 0
+        if spill_path is not None:
+            self.spill_path = spill_path
+        self._close_spill()
+    
+    def close(self):
+        """Tutup file spill; sampel berikutnya (jika ada) tidak lagi ditulis ke disk"""
+        self._close_spill()
+        self.spill_path = ""
+
+DEFAULT_SPILL_PATH = os.path.join(SPILL_DIR, f"ppg_history_{os.getpid()}.npy") if SPILL_TO_DISK else ""
+sample_store = SampleStore(LIVE_WINDOW_SECONDS * SAMPLING_RATE, spill_path=DEFAULT_SPILL_PATH)
+
+def remove_default_spill():
+    """Hapus file spill sementara saat proses selesai (spill arsip sesi tetap disimpan)"""
+    if sample_store.spill_path == DEFAULT_SPILL_PATH:
+        sample_store.close()
+    if DEFAULT_SPILL_PATH and os.path.exists(DEFAULT_SPILL_PATH):
+        try:
+            os.remove(DEFAULT_SPILL_PATH)
+        except OSError as e:
+            print(f"⚠️ File spill sementara tidak bisa dihapus: {e}")
+
+atexit.register(remove_default_spill)
+
+# ============= SISTEM BUFFERING & AGREGASI DATA =============
+# Konfigurasi buffering
+BUFFER_SIZE = 50  # Buffer 50 data points sebelum agregasi (~1 detik @ 50Hz)
+DOWNSAMPLE_RATE = 10  # Ambil 1 dari setiap 10 data untuk raw data
+
+class ColumnarTable:
+    """Tabel kolomar yang bisa tumbuh: satu array NumPy kontigu per kolom
+    
+    columns() mengembalikan view tanpa salinan, sehingga pd.DataFrame(..., copy=False)
+    bisa langsung dibangun di atasnya.
+    """
+    
+    def __init__(self, fields, initial_capacity=1024):
+        self.fields = dict(fields)
+        self._columns = {name: np.empty(initial_capacity, dtype=dtype) for name, dtype in self.fields.items()}
+        self.count = 0
+    
+    def __len__(self):
+        return self.count
+    
+    def append(self, **columns):
+        """Tambah n baris sekaligus (setiap kolom array sepanjang n)"""
+        n = len(next(iter(columns.values())))
+        if n == 0:
+            return
+        capacity = len(self._columns[next(iter(self.fields))])
+        if self.count + n > capacity:
+            while capacity < self.count + n:
+                capacity *= 2
+            for name, old in self._columns.items():
+                new = np.empty(capacity, dtype=old.dtype)
+                new[:self.count] = old[:self.count]
+                self._columns[name] = new
+        
+        for name in self.fields:
+            self._columns[name][self.count:self.count + n] = columns[name]
+        self.count += n
+    
+    def columns(self):
+        """Dict nama kolom -> view array (tanpa salinan)"""
+        return {name: column[:self.count] for name, column in self._columns.items()}
+    
+    def clear(self):
+        self.count = 0
+
+AGGREGATE_FIELDS = {
+    'time_start': 'f8',
+    'time_end': 'f8',
+    'time_avg': 'f8',
+    'duration': 'f8',
+    'ac_avg': 'f8',
+    'ac_min': 'f8',
+    'ac_max': 'f8',
+    'ac_std': 'f8',
+    'threshold_avg': 'f8',
+    'beat_count': 'i4',
+    'sample_count': 'i4',
+}
+RAW_DOWNSAMPLED_FIELDS = {
+    'time': 'f8',
+    'ac': 'f4',
+    'threshold': 'f4',
+    'beat': 'u1',
+}
+
+class AggregationBuffer:
+    """Blok NumPy praalokasi berisi sampel yang belum genap BUFFER_SIZE"""
+    
+    def __init__(self, size=BUFFER_SIZE):
+        self.block = np.zeros(size, dtype=SAMPLE_DTYPE)
+        self.fill = 0
+    
+    def __len__(self):
+        return self.fill
+    
+    @property
+    def full(self):
+        return self.fill == len(self.block)
+    
+    def fill_from(self, samples):
+        """Salin sampel sebanyak sisa ruang; kembalikan jumlah yang terpakai"""
+        take = min(len(self.block) - self.fill, len(samples))
+        self.block[self.fill:self.fill + take] = samples[:take]
+        self.fill += take
+        return take
+    
+    def clear(self):
+        self.fill = 0
+
+# Data buffer untuk agregasi
+data_buffer = AggregationBuffer()
+
+# Data teragregasi (lebih ringkas untuk save), kolomar
+aggregated_data = ColumnarTable(AGGREGATE_FIELDS, initial_capacity=1024)
+raw_downsampled = ColumnarTable(RAW_DOWNSAMPLED_FIELDS, initial_capacity=8192)  # Raw data yang di-downsample
+
+# Piramida agregat: level 0 = aggregated_data (BUFFER_SIZE sampel, ~1 s),
+# tiap level berikutnya menggabungkan PYRAMID_FACTORS record level di bawahnya
+PYRAMID_FACTORS = (10, 6, 10)  # ~1 s -> 10 s -> 1 menit -> 10 menit
+EXPORT_SUMMARY_RESOLUTION = 60  # Detik; resolusi sheet ringkasan di Excel
+EXCEL_MAX_ROWS = 100000  # Batas baris per sheet Excel; data lengkap ada di arsip sesi
+
+def rollup_aggregates(columns, groups, factor):
+    """Gabungkan groups x factor record agregat menjadi groups record (vektorisasi)"""
+    c = {name: column[:groups * factor].reshape(groups, factor) for name, column in columns.items()}
+    n = c['sample_count'].astype(np.float64)
+    total = n.sum(axis=1)
+    ac_avg = (n * c['ac_avg']).sum(axis=1) / total
+    # Varians gabungan (Chan): jumlah M2 tiap record + sebaran mean antar record
+    m2 = (n * c['ac_std'] ** 2).sum(axis=1) + (n * (c['ac_avg'] - ac_avg[:, np.newaxis]) ** 2).sum(axis=1)
+    
+    return {
+        'time_start': c['time_start'][:, 0],
+        'time_end': c['time_end'][:, -1],
+        'time_avg': (n * c['time_avg']).sum(axis=1) / total,
+        'duration': c['time_end'][:, -1] - c['time_start'][:, 0],
+        'ac_avg': ac_avg,
+        'ac_min': c['ac_min'].min(axis=1),
+        'ac_max': c['ac_max'].max(axis=1),
+        'ac_std': np.sqrt(m2 / total),
+        'threshold_avg': (n * c['threshold_avg']).sum(axis=1) / total,
+        'beat_count': c['beat_count'].sum(axis=1),
+        'sample_count': total,
+    }
+
+class AggregatePyramid:
+    """Rollup agregat multi-resolusi, diperbarui inkremental setiap blok ditutup
+    
+    Semua level memakai kolom AGGREGATE_FIELDS yang sama, sehingga plot, ekspor
+    dan query cukup memilih level terkasar yang masih memenuhi resolusi.
+    """
+    
+    def __init__(self, base, factors=PYRAMID_FACTORS):
+        self.factors = tuple(factors)
+        self.levels = [base] + [ColumnarTable(AGGREGATE_FIELDS, initial_capacity=256) for _ in self.factors]
+        self._rolled = [0] * len(self.factors)  # Record level bawah yang sudah digabung
+    
+    @property
+    def bucket_seconds(self):
+        """Lebar bucket nominal tiap level (detik)"""
+        base = BUFFER_SIZE / session_rate
+        return [base * int(np.prod(self.factors[:k])) for k in range(len(self.levels))]
+    
+    def update(self):
+        """Rollup record level bawah yang sudah genap satu grup, berjenjang ke atas"""
+        for k, factor in enumerate(self.factors):
+            child = self.levels[k]
+            groups = (len(child) - self._rolled[k]) // factor
+            if groups == 0:
+                break
+            start = self._rolled[k]
+            columns = {name: column[start:] for name, column in child.columns().items()}
+            self.levels[k + 1].append(**rollup_aggregates(columns, groups, factor))
+            self._rolled[k] += groups * factor
+    
+    def level_for(self, resolution):
+        """Indeks level terkasar dengan bucket <= resolution (detik)"""
+        level = 0
+        for k, seconds in enumerate(self.bucket_seconds):
+            if seconds <= resolution:
+                level = k
+        return level
+    
+    def columns(self, level, include_partial=True):
+        """Kolom satu level; bucket terakhir yang belum genap ikut dihitung bila diminta"""
+        columns = self.levels[level].columns()
+        if level == 0 or not include_partial:
+            return columns
+        
+        # Bucket berjalan: record level bawah (termasuk bucket berjalannya) yang belum di-rollup
+        child = self.columns(level - 1)
+        pending = len(child['time_start']) - self._rolled[level - 1]
+        if pending <= 0:
+            return columns
+        tail = {name: column[-pending:] for name, column in child.items()}
+        partial = rollup_aggregates(tail, 1, pending)
+        return {name: np.concatenate([columns[name], partial[name].astype(columns[name].dtype)]) for name in columns}
+    
+    def query(self, resolution, t_start=None, t_end=None):
+        """(lebar bucket, kolom) pada level terkasar yang memenuhi resolusi, dalam rentang waktu"""
+        level = self.level_for(resolution)
+        columns = self.columns(level)
+        mask = np.ones(len(columns['time_start']), dtype=bool)
+        if t_start is not None:
+            mask &= columns['time_end'] >= t_start
+        if t_end is not None:
+            mask &= columns['time_start'] <= t_end
+        return self.bucket_seconds[level], {name: column[mask] for name, column in columns.items()}
+    
+    def clear(self):
+        for table in self.levels:
+            table.clear()
+        self._rolled = [0] * len(self.factors)
+
+aggregate_pyramid = AggregatePyramid(aggregated_data)
+
+def aggregate_blocks(blocks):
+    """Agregasi k blok sekaligus (array SAMPLE_DTYPE 2-D: k x n), semua kanal dalam satu pass"""
+    if blocks.size == 0:
+        return
+    
+    times = blocks['time']
+    ac = blocks['ac'].astype(np.float64)
+    
+    columns = dict(
+        time_start=times[:, 0],
+        time_end=times[:, -1],
+        time_avg=times.mean(axis=1),
+        duration=times[:, -1] - times[:, 0],
+        ac_avg=ac.mean(axis=1),
+        ac_min=ac.min(axis=1),
+        ac_max=ac.max(axis=1),
+        ac_std=ac.std(axis=1),
+        threshold_avg=blocks['threshold'].mean(axis=1, dtype=np.float64),
+        beat_count=np.count_nonzero(blocks['beat'] > 0, axis=1),
+        sample_count=np.full(len(blocks), blocks.shape[1]),
+    )
+    aggregated_data.append(**columns)
+    aggregate_pyramid.update()
+    timeseries_streamer.add('measurement_aggregates', columns)
+    
+    # Simpan beberapa raw data (downsampled) untuk referensi: slicing, tanpa loop
+    raw = blocks[:, ::DOWNSAMPLE_RATE].reshape(-1)
+    raw_columns = {name: raw[name] for name in RAW_DOWNSAMPLED_FIELDS}
+    raw_downsampled.append(**raw_columns)
+    if DB_STREAM_SAMPLES == "downsampled":
+        timeseries_streamer.add('measurement_samples', raw_columns)
+
+def aggregate_buffer():
+    """Agregasi data dari buffer menjadi summary per interval"""
+    if len(data_buffer) == 0:
+        return
+    
+    aggregate_blocks(data_buffer.block[np.newaxis, :data_buffer.fill])
+    
+    # Kosongkan buffer
+    data_buffer.clear()
+
+def add_to_buffer(samples):
+    """Tambahkan blok sampel ke buffer; setiap BUFFER_SIZE sampel diagregasi"""
+    used = data_buffer.fill_from(samples)
+    if data_buffer.full:
+        aggregate_buffer()
+    
+    # Blok penuh langsung direduksi tanpa lewat buffer
+    rest = samples[used:]
+    full_blocks = len(rest) // BUFFER_SIZE
+    if full_blocks:
+        aggregate_blocks(rest[:full_blocks * BUFFER_SIZE].reshape(full_blocks, BUFFER_SIZE))
+    data_buffer.fill_from(rest[full_blocks * BUFFER_SIZE:])
+
+# ===================== DATABASE FUNCTIONS =====================
+
+class DatabaseWriter:
+    """Thread writer PostgreSQL: antrean job, pool koneksi, retry dan reconnect otomatis
+    
+    Job adalah callable job(conn) yang dijalankan di thread writer dalam satu
+    transaksi (commit setelah sukses, rollback saat error). Koneksi yang putus
+    dibuang dari pool dan job diulang dengan backoff. Hasil atau error dikirim
+    balik ke thread klien lewat dispatch() (GUI: root.after), sehingga klien
+    tidak pernah menunggu jaringan.
+    """
+    
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.pool = None
+        self._thread = None
+    
+    @property
+    def connected(self):
+        return self.pool is not None and not self.pool.closed
+    
+    @property
+    def pending(self):
+        return self.jobs.qsize()
+    
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="db-writer")
+        self._thread.start()
+    
+    def stop(self, timeout=5.0):
+        """Selesaikan job yang sudah antre, lalu tutup pool"""
+        if self._thread is not None and self._thread.is_alive():
+            self.jobs.put(None)
+            self._thread.join(timeout)
+        self._close_pool()
+    
+    def submit(self, job, on_success=None, on_error=None, description="job", use_pool=True):
+        """Antrekan job; callback dipanggil di thread GUI dengan hasil / exception"""
+        self.start()
+        self.jobs.put((job, on_success, on_error, description, use_pool))
+    
+    def connect(self, config, setup_job, on_success=None, on_error=None):
+        """(Re)buat pool di thread writer, lalu jalankan setup_job(conn)"""
+        def open_pool():
+            self._close_pool()
+            self.pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **config)
+            return self._execute(setup_job)
+        self.submit(open_pool, on_success, on_error, "koneksi", use_pool=False)
+    
+    def run_detached(self, job, on_success=None, on_error=None, description="job"):
+        """Jalankan job(conn) di thread terpisah (mis. ekspor panjang) agar antrean writer tidak tertahan"""
+        def run():
+            try:
+                result = self._execute(job)
+            except Exception as e:
+                print(f"❌ Database {description} gagal: {e}")
+                self._notify(on_error, e)
+            else:
+                self._notify(on_success, result)
+        threading.Thread(target=run, daemon=True, name=f"db-{description}").start()
+    
+    def disconnect(self, on_success=None, on_error=None):
+        self.submit(self._close_pool, on_success, on_error, "pemutusan", use_pool=False)
+    
+    def _close_pool(self):
+        if self.connected:
+            self.pool.closeall()
+        self.pool = None
+    
+    def _execute(self, job):
+        """Jalankan job dengan koneksi dari pool; retry + backoff jika koneksi putus"""
+        delay = DB_RETRY_BACKOFF
+        for attempt in range(1, DB_RETRY_ATTEMPTS + 1):
+            if not self.connected:
+                raise psycopg2.InterfaceError("Database tidak terhubung")
+            
+            conn = None
+            try:
+                conn = self.pool.getconn()
+                if conn.closed:
+                    raise psycopg2.InterfaceError("Koneksi di pool sudah tertutup")
+                result = job(conn)
+                conn.commit()
+                self.pool.putconn(conn)
+                return result
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Koneksi putus / server tidak tersedia: buang koneksi, pool membuat yang baru
+                if conn is not None and self.connected:
+                    self.pool.putconn(conn, close=True)
+                if attempt == DB_RETRY_ATTEMPTS:
+                    raise
+                print(f"⚠️ Database error: {e}. Reconnect {attempt}/{DB_RETRY_ATTEMPTS - 1} dalam {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+            except Exception:
+                if conn is not None:
+                    conn.rollback()
+                    self.pool.putconn(conn)
+                raise
+    
+    def _notify(self, callback, value):
+        if callback is not None:
+            dispatch(callback, value)
+    
+    def _run(self):
+        while True:
+            item = self.jobs.get()
+            if item is None:
+                break
+            job, on_success, on_error, description, use_pool = item
+            try:
+                result = self._execute(job) if use_pool else job()
+            except Exception as e:
+                print(f"❌ Database {description} gagal: {e}")
+                self._notify(on_error, e)
+            else:
+                self._notify(on_success, result)
+
+db_writer = DatabaseWriter()
+
+def setup_database(conn):
+    """Job koneksi awal: cek versi server lalu buat tabel"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT version();")
+        version = cur.fetchone()
+    create_tables(conn)
+    return version
+
+def create_tables(conn):
+    """Create database tables - SIMPLIFIED (no raw data tables!)
+    
+    Dijalankan di thread writer; commit/rollback diurus DatabaseWriter.
+    """
+    with conn.cursor() as cur:
+        # Table for measurements (metadata pengukuran)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS measurements (
+                id SERIAL PRIMARY KEY,
+                subject_name VARCHAR(100) NOT NULL,
+                measurement_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                duration_seconds FLOAT,
+                total_data_points INTEGER,
+                sampling_rate FLOAT,
+                notes TEXT
+            )
+        """)
+    
+        # Table for analysis results (HANYA HASIL AKHIR!)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                id SERIAL PRIMARY KEY,
+                measurement_id INTEGER REFERENCES measurements(id) ON DELETE CASCADE,
+                subject_name VARCHAR(100) NOT NULL,
+                avg_heart_rate FLOAT,
+                min_heart_rate FLOAT,
+                max_heart_rate FLOAT,
+                std_heart_rate FLOAT,
+                beats_detected INTEGER,
+                valid_beats INTEGER,
+                hrv_rmssd FLOAT,
+                hrv_sdnn FLOAT,
+                avg_rr_interval FLOAT,
+                classification VARCHAR(100),
+                condition VARCHAR(100),
+                analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                full_analysis_text TEXT
+            )
+        """)
+    
+        # Create index for better performance
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analysis_measurement 
+            ON analysis_results(measurement_id)
+        """)
+    
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_measurements_date 
+            ON measurements(measurement_date DESC)
+        """)
+        
+        # Indeks untuk browser riwayat (keyset pagination + filter subjek)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_measurements_date_id 
+            ON measurements(measurement_date DESC, id DESC)
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_measurements_subject_date 
+            ON measurements(subject_name, measurement_date DESC, id DESC)
+        """)
+        
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_analysis_measurement_date 
+            ON analysis_results(measurement_id, analysis_date DESC)
+        """)
+        
+        # Tabel time-series hanya dibuat jika streaming diaktifkan
+        if DB_STREAM_ENABLED:
+            create_stream_tables(cur)
+    
+    print("✅ Database tables created/verified (ANALYSIS ONLY - NO RAW DATA)")
+
+def store_analysis(conn, measurement, analysis, analysis_text, streamed_id=None):
+    """Job writer: simpan HANYA hasil analisis (NO RAW DATA!), kembalikan measurement_id
+    
+    measurement = (subjek, durasi, total titik, sampling rate, catatan); jika
+    sesi sudah di-stream, baris measurements streamed_id dilengkapi.
+    """
+    with conn.cursor() as cur:
+        # 1. Insert measurement record (metadata saja)
+        if streamed_id is not None:
+            cur.execute("""
+                UPDATE measurements
+                SET subject_name = %s, duration_seconds = %s, total_data_points = %s,
+                    sampling_rate = %s, notes = %s
+                WHERE id = %s
+            """, measurement[:4] + ("Pengukuran detak jantung - HASIL ANALISIS + TIME-SERIES", streamed_id))
+            measurement_id = streamed_id
+        else:
+            cur.execute("""
+                INSERT INTO measurements 
+                (subject_name, duration_seconds, total_data_points, sampling_rate, notes)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+            """, measurement)
+            
+            measurement_id = cur.fetchone()[0]
+        
+        # 2. Insert HANYA analysis results (NO RAW DATA!)
+        cur.execute(f"""
+            INSERT INTO analysis_results ({ANALYSIS_COLUMNS})
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, analysis_row(measurement_id, measurement[0], analysis, analysis_text))
+    return measurement_id
+
+ANALYSIS_COLUMNS = """measurement_id, subject_name, avg_heart_rate, min_heart_rate,
+    max_heart_rate, std_heart_rate, beats_detected, valid_beats,
+    hrv_rmssd, hrv_sdnn, avg_rr_interval, classification,
+    condition, full_analysis_text"""
+
+def analysis_row(measurement_id, subject, analysis, analysis_text):
+    """Nilai satu baris analysis_results (urutan ANALYSIS_COLUMNS)"""
+    return (
+        measurement_id,
+        subject,
+        analysis.get('avg_hr', 0),
+        analysis.get('min_hr', 0),
+        analysis.get('max_hr', 0),
+        analysis.get('std_hr', 0),
+        analysis.get('beats_detected', 0),
+        analysis.get('valid_beats', 0),
+        analysis.get('rmssd', 0),
+        analysis.get('sdnn', 0),
+        analysis.get('avg_rr', 0),
+        analysis.get('classification', ''),
+        analysis.get('condition', ''),
+        analysis_text
+    )
+
+def store_analyses(conn, records, page_size=1000):
+    """Job writer massal: banyak (measurement, analysis, analysis_text) sekaligus
+    
+    Dua INSERT multi-VALUES (measurements lalu analysis_results) per
+    page_size baris, bukan dua round-trip per rekaman. Kembalikan list
+    measurement_id sesuai urutan records.
+    """
+    records = list(records)
+    with conn.cursor() as cur:
+        measurement_ids = []
+        for start in range(0, len(records), page_size):
+            page = records[start:start + page_size]
+            # Insert berurutan (ORDER BY ord) memberi id SERIAL naik, jadi ORDER BY id = urutan records
+            rows = psycopg2.extras.execute_values(cur, """
+                WITH new_rows (subject_name, duration_seconds, total_data_points,
+                               sampling_rate, notes, ord) AS (VALUES %s),
+                     inserted AS (
+                         INSERT INTO measurements
+                         (subject_name, duration_seconds, total_data_points, sampling_rate, notes)
+                         SELECT subject_name, duration_seconds, total_data_points, sampling_rate, notes
+                         FROM new_rows ORDER BY ord
+                         RETURNING id
+                     )
+                SELECT id FROM inserted ORDER BY id
+            """, [tuple(measurement) + (k,) for k, (measurement, _, _) in enumerate(page)],
+                template="(%s, %s::double precision, %s::integer, %s::double precision, %s, %s::integer)",
+                page_size=page_size, fetch=True)
+            measurement_ids.extend(row[0] for row in rows)
+        
+        psycopg2.extras.execute_values(cur, f"""
+            INSERT INTO analysis_results ({ANALYSIS_COLUMNS}) VALUES %s
+        """, [analysis_row(measurement_id, measurement[0], analysis, analysis_text)
+              for measurement_id, (measurement, analysis, analysis_text) in zip(measurement_ids, records)],
+            page_size=page_size)
+    return measurement_ids
+
+HISTORY_PAGE_SIZE = 50  # Baris per halaman di browser riwayat
+
+def parse_history_date(text):
+    """'YYYY-MM-DD' -> datetime.date, kosong -> None (ValueError jika format salah)"""
+    text = text.strip()
+    return datetime.date.fromisoformat(text) if text else None
+
+def history_conditions(subject=None, date_from=None, date_to=None):
+    """Kondisi WHERE (sql.Composable) + parameter untuk filter subjek dan rentang tanggal"""
+    conditions = [sql.SQL("m.measurement_date IS NOT NULL")]
+    params = []
+    if subject:
+        conditions.append(sql.SQL("m.subject_name = %s"))
+        params.append(subject)
+    if date_from:
+        conditions.append(sql.SQL("m.measurement_date >= %s"))
+        params.append(date_from)
+    if date_to:
+        conditions.append(sql.SQL("m.measurement_date < %s"))
+        params.append(date_to + datetime.timedelta(days=1))
+    return conditions, params
+
+def fetch_history_page(conn, subject=None, date_from=None, date_to=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """Job writer: satu halaman riwayat, keyset pagination pada (measurement_date, id)
+    
+    after = (measurement_date, id) baris terakhir halaman sebelumnya. Tanpa OFFSET,
+    sehingga halaman ke-N sama cepatnya dengan halaman pertama. full_analysis_text
+    tidak ikut diambil (lihat fetch_analysis_text).
+    """
+    conditions, params = history_conditions(subject, date_from, date_to)
+    if after:
+        conditions.append(sql.SQL("(m.measurement_date, m.id) < (%s, %s)"))
+        params.extend(after)
+    
+    query = sql.SQL("""
+        SELECT 
+            m.id,
+            m.subject_name,
+            m.measurement_date,
+            m.duration_seconds,
+            m.total_data_points,
+            a.avg_heart_rate,
+            a.beats_detected,
+            a.classification,
+            a.condition,
+            a.id
+        FROM measurements m
+        LEFT JOIN LATERAL (
+            SELECT id, avg_heart_rate, beats_detected, classification, condition
+            FROM analysis_results
+            WHERE measurement_id = m.id
+            ORDER BY analysis_date DESC
+            LIMIT 1
+        ) a ON TRUE
+        WHERE {conditions}
+        ORDER BY m.measurement_date DESC, m.id DESC
+        LIMIT %s
+    """).format(conditions=sql.SQL(" AND ").join(conditions))
+    
+    with conn.cursor() as cur:
+        cur.execute(query, params + [limit])
+        return cur.fetchall()
+
+def fetch_analysis_text(conn, analysis_id):
+    """Job writer: full_analysis_text satu hasil analisis (dimuat saat baris dibuka)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT full_analysis_text FROM analysis_results WHERE id = %s", (analysis_id,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+# ============= EKSPOR MASSAL (SERVER-SIDE CURSOR) =============
+EXPORT_ITERSIZE = 2000  # Baris per round-trip cursor server-side (dan per chunk file)
+EXPORT_INCLUDE_TEXT = False  # True = ikutkan full_analysis_text di ekspor
+
+EXPORT_COLUMNS = [  # (nama kolom, ekspresi SQL, tipe Parquet)
+    ('measurement_id', 'm.id', 'int64'),
+    ('subject_name', 'm.subject_name', 'string'),
+    ('measurement_date', 'm.measurement_date', 'timestamp'),
+    ('duration_seconds', 'm.duration_seconds', 'float64'),
+    ('total_data_points', 'm.total_data_points', 'int64'),
+    ('sampling_rate', 'm.sampling_rate', 'float64'),
+    ('analysis_id', 'a.id', 'int64'),
+    ('analysis_date', 'a.analysis_date', 'timestamp'),
+    ('avg_heart_rate', 'a.avg_heart_rate', 'float64'),
+    ('min_heart_rate', 'a.min_heart_rate', 'float64'),
+    ('max_heart_rate', 'a.max_heart_rate', 'float64'),
+    ('std_heart_rate', 'a.std_heart_rate', 'float64'),
+    ('beats_detected', 'a.beats_detected', 'int64'),
+    ('valid_beats', 'a.valid_beats', 'int64'),
+    ('hrv_rmssd', 'a.hrv_rmssd', 'float64'),
+    ('hrv_sdnn', 'a.hrv_sdnn', 'float64'),
+    ('avg_rr_interval', 'a.avg_rr_interval', 'float64'),
+    ('classification', 'a.classification', 'string'),
+    ('condition', 'a.condition', 'string'),
+]
+
+def export_analyses(conn, file_path, fmt="csv", subject=None, date_from=None, date_to=None):
+    """Job database: stream measurements + analysis_results ke CSV/Parquet, memori konstan
+    
+    Cursor bernama (server-side) mengambil EXPORT_ITERSIZE baris per round-trip;
+    setiap chunk langsung ditulis ke file lalu dibuang. Kembalikan jumlah baris.
+    """
+    columns = EXPORT_COLUMNS + ([('full_analysis_text', 'a.full_analysis_text', 'string')] if EXPORT_INCLUDE_TEXT else [])
+    names = [name for name, _, _ in columns]
+    conditions, params = history_conditions(subject, date_from, date_to)
+    query = sql.SQL("""
+        SELECT {columns}
+        FROM measurements m
+        JOIN analysis_results a ON a.measurement_id = m.id
+        WHERE {conditions}
+        ORDER BY m.measurement_date, m.id, a.id
+    """).format(columns=sql.SQL(", ").join(sql.SQL(expr) for _, expr, _ in columns),
+                conditions=sql.SQL(" AND ").join(conditions))
+    
+    total = 0
+    with conn.cursor(name=f"hr_export_{os.getpid()}_{threading.get_ident()}") as cur:
+        cur.itersize = EXPORT_ITERSIZE
+        cur.execute(query, params)
+        
+        if fmt == "parquet":
+            # Skema eksplisit: chunk yang kolomnya kebetulan NULL semua tetap konsisten
+            arrow_types = {'int64': pyarrow.int64(), 'float64': pyarrow.float64(),
+                           'string': pyarrow.string(), 'timestamp': pyarrow.timestamp('us')}
+            schema = pyarrow.schema([(name, arrow_types[kind]) for name, _, kind in columns])
+            with pyarrow.parquet.ParquetWriter(file_path, schema) as writer:
+                while True:
+                    rows = cur.fetchmany(EXPORT_ITERSIZE)
+                    if not rows:
+                        break
+                    frame = pd.DataFrame(rows, columns=names)
+                    writer.write_table(pyarrow.Table.from_pandas(frame, schema=schema, preserve_index=False))
+                    total += len(rows)
+        else:
+            with open(file_path, 'w', newline='', encoding='utf-8') as f:
+                out = csv.writer(f)
+                out.writerow(names)
+                while True:
+                    rows = cur.fetchmany(EXPORT_ITERSIZE)
+                    if not rows:
+                        break
+                    out.writerows(rows)
+                    total += len(rows)
+    return total
+
+# ============= PENYIMPANAN TIME-SERIES (COPY, OPT-IN) =============
+STREAM_TABLES = {
+    # Tabel -> kolom data (urutan kolom COPY setelah measurement_id, sensor_id, ts)
+    'measurement_aggregates': list(AGGREGATE_FIELDS),
+    'measurement_samples': list(RAW_DOWNSAMPLED_FIELDS),
+}
+STREAM_COLUMN_TYPES = {'f8': 'DOUBLE PRECISION', 'f4': 'REAL', 'i4': 'INTEGER', 'u1': 'SMALLINT'}
+
+def create_stream_tables(cur):
+    """Tabel time-series: append-only, BRIN pada waktu (murah, cocok untuk insert berurutan)"""
+    for table, fields in (('measurement_aggregates', AGGREGATE_FIELDS),
+                          ('measurement_samples', RAW_DOWNSAMPLED_FIELDS)):
+        columns = ",\n                ".join(f"{name} {STREAM_COLUMN_TYPES[dtype]}" for name, dtype in fields.items())
+        cur.execute(sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {table} (
+                measurement_id INTEGER NOT NULL REFERENCES measurements(id) ON DELETE CASCADE,
+                sensor_id SMALLINT NOT NULL DEFAULT 0,
+                ts TIMESTAMPTZ NOT NULL,
+                {columns}
+            )
+        """).format(table=sql.Identifier(table), columns=sql.SQL(columns)))
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} USING BRIN (ts)").format(
+            index=sql.Identifier(f"idx_{table}_ts_brin"), table=sql.Identifier(table)))
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} USING BRIN (measurement_id)").format(
+            index=sql.Identifier(f"idx_{table}_measurement_brin"), table=sql.Identifier(table)))
+
+def copy_rows(conn, table, measurement_id, sensor_id, session_epoch, columns):
+    """Job writer: satu batch COPY ... FROM STDIN (CSV) untuk kolom-kolom NumPy"""
+    time_column = columns['time_start'] if 'time_start' in columns else columns['time']
+    frame = pd.DataFrame(columns, copy=False)
+    frame.insert(0, 'ts', pd.to_datetime(session_epoch + time_column, unit='s', utc=True))
+    frame.insert(0, 'sensor_id', sensor_id)
+    frame.insert(0, 'measurement_id', measurement_id)
+    
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    
+    copy = sql.SQL("COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)").format(
+        table=sql.Identifier(table),
+        columns=sql.SQL(", ").join(sql.Identifier(name) for name in frame.columns))
+    with conn.cursor() as cur:
+        cur.copy_expert(copy.as_string(conn), buffer)
+    return len(frame)
+
+class TimeSeriesStreamer:
+    """Kirim agregat/sampel ke database selama pengukuran tanpa menahan thread ingest
+    
+    Stage DSP hanya menaruh potongan array ke antrean (di bawah lock singkat).
+    flush() dari thread GUI menggabungkannya menjadi satu job COPY per tabel
+    untuk DatabaseWriter. Semua baris memakai measurement_id dari baris
+    measurements yang dibuat saat pengukuran dimulai; sebelum id diketahui,
+    baris ditahan di antrean.
+    """
+    
+    def __init__(self, sensor_id=SENSOR_ID):
+        self.sensor_id = sensor_id
+        self._lock = threading.Lock()
+        self._pending = deque()  # (tabel, potongan kolom), urut waktu masuk
+        self._pending_rows = 0
+        self.active = False
+        self.measurement_id = None
+        self.session_epoch = 0.0
+        self.inflight = 0
+        self.rows_written = 0
+        self.dropped_rows = 0
+        self._last_flush = 0.0
+    
+    def start(self, subject, session_epoch):
+        """Buat baris measurements (async); baris time-series menyusul setelah id ada"""
+        self.stop()
+        # id sesi sebelumnya tidak boleh terbawa: save_to_database akan meng-UPDATE baris itu
+        self.measurement_id = None
+        if not (DB_STREAM_ENABLED and db_writer.connected):
+            return
+        
+        with self._lock:
+            self._pending.clear()
+            self._pending_rows = 0
+        self.active = True
+        self.session_epoch = session_epoch
+        self.rows_written = 0
+        self.dropped_rows = 0
+        
+        def insert_measurement(conn):
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO measurements (subject_name, sampling_rate, notes)
+                    VALUES (%s, %s, %s)
+                    RETURNING id
+                """, (subject, session_rate, "Pengukuran detak jantung - STREAMING time-series"))
+                return cur.fetchone()[0]
+        
+        def on_created(measurement_id):
+            self.measurement_id = measurement_id
+            print(f"📡 Streaming time-series ke database (measurement ID: {measurement_id})")
+            if not self.active:
+                self.flush(force=True)  # Pengukuran sudah berhenti sebelum id tersedia
+        
+        def on_failed(e):
+            self.active = False
+            print(f"❌ Streaming time-series dinonaktifkan: {e}")
+        
+        db_writer.submit(insert_measurement, on_success=on_created, on_error=on_failed,
+                         description="buat measurement streaming")
+    
+    def stop(self):
+        """Kirim sisa antrean; measurement_id tetap disimpan untuk save_to_database"""
+        if self.active:
+            self.flush(force=True)
+        self.active = False
+    
+    def reset(self):
+        self.stop()
+        with self._lock:
+            self._pending.clear()
+            self._pending_rows = 0
+        self.measurement_id = None
+    
+    def add(self, table, columns):
+        """Dipanggil stage DSP: O(1), tidak pernah menunggu database"""
+        if not self.active:
+            return
+        n = len(next(iter(columns.values())))
+        if n == 0:
+            return
+        with self._lock:
+            # Salinan: kolom sumber bisa berupa view buffer yang akan ditimpa
+            self._pending.append((table, {name: np.array(columns[name]) for name in STREAM_TABLES[table]}))
+            self._pending_rows += n
+            while self._pending_rows > DB_STREAM_MAX_PENDING_ROWS:
+                # Buang potongan tertua (lintas tabel) sampai batas terpenuhi
+                _, dropped = self._pending.popleft()
+                lost = len(next(iter(dropped.values())))
+                self._pending_rows -= lost
+                self.dropped_rows += lost
+    
+    def flush(self, force=False):
+        """Dipanggil thread GUI: satu job COPY per tabel setiap DB_STREAM_FLUSH_INTERVAL"""
+        now = time.monotonic()
+        if self.measurement_id is None or self._pending_rows == 0:
+            return
+        if not force and (now - self._last_flush < DB_STREAM_FLUSH_INTERVAL
+                          or self.inflight >= DB_STREAM_MAX_INFLIGHT):
+            return
+        self._last_flush = now
+        
+        with self._lock:
+            pending, self._pending = self._pending, deque()
+            self._pending_rows = 0
+        
+        batches = {}
+        for table, chunk in pending:
+            batches.setdefault(table, []).append(chunk)
+        
+        for table, chunks in batches.items():
+            columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in STREAM_TABLES[table]}
+            self.inflight += 1
+            db_writer.submit(
+                # Semua state sesi diikat sekarang: job bisa jalan setelah sesi baru dimulai
+                lambda conn, table=table, columns=columns, measurement_id=self.measurement_id,
+                       sensor_id=self.sensor_id, session_epoch=self.session_epoch:
+                    copy_rows(conn, table, measurement_id, sensor_id, session_epoch, columns),
+                on_success=self._on_written, on_error=self._on_failed,
+                description=f"COPY {table}")
+    
+    def _on_written(self, rows):
+        self.inflight -= 1
+        self.rows_written += rows
+    
+    def _on_failed(self, e):
+        self.inflight -= 1
+        print(f"❌ Batch time-series gagal disimpan: {e}")
+
+timeseries_streamer = TimeSeriesStreamer()
+
+# ============= ARSIP SESI (NPY KOLOMAR, MEMORY-MAPPED) =============
+ARCHIVE_SESSIONS = True  # Tulis arsip lengkap setiap sesi selama akuisisi
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+ARCHIVE_FLUSH_INTERVAL = 5.0  # Detik antar flush header/meta ke disk
+
+AGGREGATE_DTYPE = np.dtype(list(AGGREGATE_FIELDS.items()))
+PEAK_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('value', 'f8'),
+    ('rr', 'f8'),  # Detik; NaN untuk detak pertama
+])
+
+class SessionArchive:
+    """Arsip satu sesi: direktori berisi file .npy per tabel + meta.json
+
+    samples.npy adalah file spill SampleStore (semua kanal, resolusi penuh),
+    aggregates.npy dan peaks.npy di-append bertahap dari aggregated_data dan
+    peak_index. Semua file dibuka ulang instan dengan open_session_archive().
+    """
+    
+    def __init__(self, root_dir, subject, epoch):
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(epoch))
+        self.path = os.path.join(root_dir, f"session_{subject.replace(' ', '_')}_{stamp}")
+        os.makedirs(self.path, exist_ok=True)
+        
+        self.samples_path = os.path.join(self.path, "samples.npy")
+        self._aggregates = NpyAppendWriter(os.path.join(self.path, "aggregates.npy"), AGGREGATE_DTYPE)
+        self._peaks = NpyAppendWriter(os.path.join(self.path, "peaks.npy"), PEAK_DTYPE)
+        self._peak_generation = peak_index.generation
+        self._last_flush = 0.0
+        self.meta = {
+            'format': 1,
+            'subject': subject,
+            'session_epoch': epoch,
+            'sampling_rate': session_rate,
+            'files': {'samples': "samples.npy", 'aggregates': "aggregates.npy", 'peaks': "peaks.npy"},
+            'complete': False,
+        }
+        self._write_meta()
+    
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f, indent=2, default=float)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+    
+    def sync(self, force=False):
+        """Append agregat/detak baru dan flush header (dipanggil dari thread GUI)"""
+        now = time.monotonic()
+        if not force and now - self._last_flush < ARCHIVE_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        
+        # Salin baris baru di bawah lock; tulis ke disk di luar lock
+        with dsp_lock:
+            columns = aggregated_data.columns()
+            start = self._aggregates.count
+            aggregates = np.empty(len(aggregated_data) - start, dtype=AGGREGATE_DTYPE)
+            for name in AGGREGATE_DTYPE.names:
+                aggregates[name] = columns[name][start:]
+            
+            if peak_index.generation != self._peak_generation:
+                # Indeks dibangun ulang (analisis offline): tulis ulang dari awal
+                self._peaks.close()
+                self._peaks = NpyAppendWriter(self._peaks.path, PEAK_DTYPE)
+                self._peak_generation = peak_index.generation
+            start = self._peaks.count
+            peaks = np.empty(peak_index.count - start, dtype=PEAK_DTYPE)
+            peaks['time'] = peak_index.times[start:]
+            peaks['value'] = peak_index.values[start:]
+            peaks['rr'] = peak_index._rr[start:peak_index.count]
+        
+        self._aggregates.write(aggregates)
+        self._peaks.write(peaks)
+        self._aggregates.flush()
+        self._peaks.flush()
+        sample_store.flush()
+        
+        self.meta.update({
+            'samples': sample_store.total_count,
+            'aggregates': self._aggregates.count,
+            'peaks': self._peaks.count,
+            'duration': sample_store.last_time(),
+            'measured_rate': sample_clock.measured_rate,
+            'analysis': latest_analysis.summary if latest_analysis is not None else {},
+        })
+        self._write_meta()
+    
+    def close(self):
+        """Sync terakhir lalu tandai arsip lengkap"""
+        self.sync(force=True)
+        self._aggregates.close()
+        self._peaks.close()
+        self.meta['complete'] = True
+        self._write_meta()
+
+session_archive = None  # SessionArchive aktif (None jika tidak ada sesi)
+
+def open_session_archive(path):
+    """Buka arsip sesi sebagai memmap read-only (tanpa memuat ke RAM)
+
+    Mengembalikan dict: meta, samples, aggregates, peaks. Arsip yang belum
+    ditutup tetap terbaca sampai flush terakhir.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    archive = {'meta': meta}
+    for name, filename in meta['files'].items():
+        archive[name] = np.load(os.path.join(path, filename), mmap_mode='r')
+    return archive
+
+def start_session_archive(subject):
+    """Mulai arsip baru; spill SampleStore dipindah ke direktori arsip"""
+    global session_archive
+    
+    if not ARCHIVE_SESSIONS or session_archive is not None or sample_store.total_count > 0:
+        return
+    try:
+        session_archive = SessionArchive(ARCHIVE_DIR, subject, start_time)
+        with dsp_lock:
+            sample_store.reset(spill_path=session_archive.samples_path)
+        print(f"🗄️ Arsip sesi: {session_archive.path}")
+    except OSError as e:
+        session_archive = None
+        print(f"⚠️ Arsip sesi tidak bisa dibuat: {e}")
+
+def close_session_archive():
+    """Tutup arsip aktif; spill dikembalikan ke file sementara default"""
+    global session_archive
+    
+    if session_archive is None:
+        return
+    archive, session_archive = session_archive, None
+    try:
+        archive.close()
+        print(f"🗄️ Arsip sesi ditutup: {archive.path}")
+    except OSError as e:
+        print(f"⚠️ Gagal menutup arsip sesi: {e}")
+
+# ============= SUMBER DATA (DATASOURCE) =============
+SIMULATOR_DEFAULTS = {
+    'heart_rate': 72.0,  # BPM
+    'hrv_ms': 40.0,  # Std RR interval
+    'noise': 5.0,  # Std noise Gaussian (satuan AC)
+    'motion_per_minute': 0.0,  # Rata-rata artefak gerak per menit
+    'rate': float(SAMPLING_RATE),  # Hz
+}
+SIMULATOR_TICK = 0.02  # Detik antar pembacaan generator berpacing
+
+class DataSource(ABC):
+    """Antarmuka sumber data yang dibaca thread reader
+    
+    read() boleh blocking maks ~SERIAL_READ_TIMEOUT dan mengembalikan:
+    bytes (protocol "ascii"/"binary", diparse stage DSP dan diberi waktu oleh
+    SampleClock), blok SAMPLE_DTYPE yang waktunya sudah terisi (protocol
+    "samples"), b'' jika belum ada data, atau None jika sumber sudah habis.
+    Sumber dengan realtime=False tidak pernah dibuang saat antrian penuh;
+    pipeline menunggu (mis. replay secepat mungkin). rate adalah laju nominal
+    sumber; filter, jarak puncak dan time base DSP live mengikutinya.
+    """
+    
+    protocol = SERIAL_PROTOCOL
+    realtime = True
+    rate = SAMPLING_RATE  # Hz
+    
+    @abstractmethod
+    def open(self):
+        """Buka koneksi/generator; exception diteruskan ke pemanggil"""
+    
+    @abstractmethod
+    def close(self):
+        """Tutup sumber; read() yang sedang menunggu harus segera kembali"""
+    
+    @property
+    @abstractmethod
+    def is_open(self):
+        """True selama sumber bisa dibaca"""
+    
+    @abstractmethod
+    def read(self):
+        """Satu pembacaan (lihat docstring kelas untuk nilai kembali)"""
+    
+    def describe(self):
+        return type(self).__name__
+
+class SerialSource(DataSource):
+    """ESP32 lewat port serial (pyserial), dibaca bulk"""
+    
+    def __init__(self, port=DEFAULT_PORT, baudrate=DEFAULT_BAUDRATE, protocol=SERIAL_PROTOCOL):
+        self.port = port
+        self.baudrate = baudrate
+        self.protocol = protocol
+        self._ser = None
+        self._buffer = bytearray(READ_CHUNK_SIZE)  # Dipakai ulang, tanpa alokasi per baris
+    
+    def open(self):
+        self._ser = serial.Serial(self.port, self.baudrate, timeout=SERIAL_READ_TIMEOUT)
+        time.sleep(2)  # Wait for Arduino to reset
+        self._ser.reset_input_buffer()
+    
+    def close(self):
+        if self._ser is not None:
+            self._ser.close()
+    
+    @property
+    def is_open(self):
+        return self._ser is not None and self._ser.is_open
+    
+    def read(self):
+        # Blocking sampai ada minimal 1 byte (maks timeout), lalu ambil
+        # semua yang sudah tersedia dalam satu pembacaan
+        view = memoryview(self._buffer)
+        wanted = max(1, min(self._ser.in_waiting, READ_CHUNK_SIZE))
+        n = self._ser.readinto(view[:wanted])
+        return bytes(view[:n]) if n else b''
+    
+    def describe(self):
+        return f"{self.port} @ {self.baudrate} baud"
+
+class TcpSource(DataSource):
+    """Stream byte mentah lewat socket TCP (format sama dengan serial)"""
+    
+    def __init__(self, host, port, protocol=SERIAL_PROTOCOL):
+        self.host = host
+        self.port = int(port)
+        self.protocol = protocol
+        self._sock = None
+    
+    def open(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=5.0)
+        self._sock.settimeout(SERIAL_READ_TIMEOUT)
+    
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+    
+    @property
+    def is_open(self):
+        return self._sock is not None
+    
+    def read(self):
+        try:
+            data = self._sock.recv(READ_CHUNK_SIZE)
+        except socket.timeout:
+            return b''
+        return data if data else None  # b'' dari recv = koneksi ditutup
+    
+    def describe(self):
+        return f"tcp://{self.host}:{self.port}"
+
+class WebSocketSource(DataSource):
+    """ESP32 sebagai server WebSocket (lihat practice/main.py)
+    
+    Pesan teks diperlakukan sebagai baris ASCII, pesan biner sebagai frame.
+    """
+    
+    def __init__(self, uri, protocol=SERIAL_PROTOCOL):
+        self.uri = uri
+        self.protocol = protocol
+        self._ws = None
+    
+    def open(self):
+        if websockets is None:
+            raise RuntimeError("Paket 'websockets' belum terpasang (pip install websockets)")
+        self._ws = websockets.sync.client.connect(self.uri, open_timeout=5.0)
+    
+    def close(self):
+        if self._ws is not None:
+            self._ws.close()
+            self._ws = None
+    
+    @property
+    def is_open(self):
+        return self._ws is not None
+    
+    def read(self):
+        try:
+            message = self._ws.recv(timeout=SERIAL_READ_TIMEOUT)
+        except TimeoutError:
+            return b''
+        except websockets.exceptions.ConnectionClosed:
+            return None
+        
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+            if not message.endswith(b'\n'):
+                message += b'\n'  # Satu pesan = satu baris sampel
+        return message
+    
+    def describe(self):
+        return self.uri
+
+class SyntheticPPGSource(DataSource):
+    """Generator PPG sintetis untuk uji tanpa hardware
+    
+    Pulsa sistolik + gelombang dicrotic per detak, RR acak (HRV), noise
+    Gaussian dan artefak gerak acak (burst frekuensi rendah berenvelope).
+    Keluaran dikodekan sebagai frame biner (default) atau baris ASCII agar
+    parser dan time base ikut teruji. paced=False menghasilkan data secepat
+    mungkin (uji beban); pipeline menunggu, tidak membuang. rate diteruskan
+    ke DSP live lewat set_sample_rate(); state engine global sehingga hanya
+    satu sumber (satu simulator) yang dibaca per proses.
+    """
+    
+    def __init__(self, heart_rate=72.0, hrv_ms=40.0, noise=5.0, motion_per_minute=0.0,
+                 rate=SAMPLING_RATE, amplitude=400.0, protocol="binary", paced=True, seed=None):
+        if not 20 <= heart_rate <= 250:
+            raise ValueError("Detak jantung harus 20-250 BPM")
+        if rate <= 0 or hrv_ms < 0 or noise < 0 or motion_per_minute < 0:
+            raise ValueError("Sampling rate harus > 0; HRV, noise dan artefak tidak boleh negatif")
+        
+        self.heart_rate = float(heart_rate)
+        self.hrv_ms = float(hrv_ms)
+        self.noise = float(noise)
+        self.motion_per_minute = float(motion_per_minute)
+        self.rate = float(rate)
+        self.amplitude = float(amplitude)
+        self.protocol = protocol
+        self.realtime = paced
+        self._rng = np.random.default_rng(seed)
+        self._open = False
+    
+    def open(self):
+        self._sample = 0
+        self._last_time = -np.inf
+        first_rr = self._next_rr()
+        self._beat_onsets = np.array([-self._rng.uniform(0, first_rr)])
+        self._artefacts = []  # (mulai, durasi, amplitudo, frekuensi)
+        self._wall_start = time.perf_counter()
+        self._open = True
+    
+    def close(self):
+        self._open = False
+    
+    @property
+    def is_open(self):
+        return self._open
+    
+    def _next_rr(self):
+        return max(0.25, 60.0 / self.heart_rate + self._rng.normal(0, self.hrv_ms / 1000))
+    
+    def generate(self, n):
+        """n sampel berikutnya: (waktu, ac, threshold, beat)"""
+        t = (self._sample + np.arange(n)) / self.rate
+        self._sample += n
+        
+        # Onset detak sampai melewati akhir blok (untuk RR detak terakhir)
+        onsets = [self._beat_onsets]
+        last = self._beat_onsets[-1]
+        while last <= t[-1]:
+            last += self._next_rr()
+            onsets.append([last])
+        onsets = np.concatenate(onsets)
+        
+        beat_index = np.searchsorted(onsets, t, side='right') - 1
+        onset = onsets[beat_index]
+        rr = onsets[beat_index + 1] - onset
+        phase = (t - onset) / rr
+        pulse = np.exp(-((phase - 0.2) / 0.08) ** 2) + 0.35 * np.exp(-((phase - 0.5) / 0.1) ** 2)
+        ac = self.amplitude * (pulse - 0.3) + self._rng.normal(0, self.noise, n) + self._motion(t)
+        
+        # Marker beat ala ESP32: sampel pertama setelah puncak sistolik
+        beat = np.zeros(n, dtype=np.uint8)
+        peaks = onsets[:-1] + 0.2 * np.diff(onsets)
+        peaks = peaks[(peaks > self._last_time) & (peaks <= t[-1])]
+        beat[np.searchsorted(t, peaks)] = 1
+        
+        self._beat_onsets = onsets[beat_index[-1]:]
+        self._last_time = t[-1]
+        threshold = np.full(n, 0.3 * self.amplitude)
+        return t, ac, threshold, beat
+    
+    def _motion(self, t):
+        """Artefak gerak: kejadian Poisson, sinus 0.3-2 Hz berenvelope setengah sinus"""
+        expected = self.motion_per_minute / 60.0 * len(t) / self.rate
+        for _ in range(self._rng.poisson(expected)):
+            self._artefacts.append((self._rng.uniform(t[0], t[-1]), self._rng.uniform(1.0, 3.0),
+                                    self.amplitude * self._rng.uniform(2.0, 5.0), self._rng.uniform(0.3, 2.0)))
+        
+        motion = np.zeros(len(t))
+        for start, duration, amplitude, frequency in self._artefacts:
+            local = t - start
+            active = (local >= 0) & (local < duration)
+            motion[active] += (amplitude * np.sin(2 * np.pi * frequency * local[active])
+                               * np.sin(np.pi * local[active] / duration))
+        self._artefacts = [a for a in self._artefacts if a[0] + a[1] > t[-1]]
+        return motion
+    
+    def read(self):
+        if self.realtime:
+            time.sleep(SIMULATOR_TICK)
+            n = int((time.perf_counter() - self._wall_start) * self.rate) - self._sample
+        else:
+            n = max(1, int(REPLAY_FAST_BLOCK_SECONDS * self.rate))
+        if n <= 0:
+            return b''
+        
+        sample_numbers = self._sample + np.arange(n)
+        t, ac, threshold, beat = self.generate(n)
+        ac = np.round(ac).astype(np.int64)
+        
+        if self.protocol == "samples":
+            block = np.zeros(n, dtype=SAMPLE_DTYPE)
+            block['time'] = t
+            block['ac'] = ac
+            block['threshold'] = threshold
+            block['beat'] = beat
+            return block
+        if self.protocol == "binary":
+            return encode_frames(sample_numbers, np.round(t * 1e6).astype(np.int64), ac, threshold, beat)
+        
+        lines = np.column_stack([ac, threshold.astype(np.int64), beat])
+        return ("\n".join(" ".join(map(str, row)) for row in lines.tolist()) + "\n").encode('ascii')
+    
+    def describe(self):
+        return f"Simulator {self.heart_rate:g} BPM @ {self.rate:g} Hz"
+
+def list_serial_ports():
+    """List all available serial ports"""
+    ports = serial.tools.list_ports.comports()
+    available_ports = []
+    for port in ports:
+        available_ports.append(port.device)
+    return available_ports
+
+def open_source(source, park_current=False):
+    """Tutup sumber lama, buka sumber baru lalu jalankan thread ingest
+    
+    park_current=True (replay): sumber realtime lama tidak ditutup, hanya
+    berhenti dibaca sampai release_finished_source(). Exception dari
+    source.open() diteruskan ke pemanggil.
+    """
+    global active_source, parked_source, serial_running
+    
+    if park_current and active_source is not None and active_source.is_open and active_source.realtime:
+        source.open()
+        serial_running = False
+        parked_source = active_source
+        time.sleep(0.5)  # Beri waktu thread reader lama berhenti
+    else:
+        if (active_source is not None and active_source.is_open) or parked_source is not None:
+            close_active_source()
+            time.sleep(0.5)  # Beri waktu thread reader lama berhenti
+        source.open()
+    active_source = source
+    set_sample_rate(source.rate)
+    
+    # Start reader + parser/DSP threads
+    start_ingest_threads()
+
+def set_sample_rate(rate):
+    """Sesuaikan DSP live (filter, detektor puncak, time base) dengan laju sumber"""
+    global sample_rate, live_filter, peak_detector
+    
+    rate = float(rate)
+    if rate == sample_rate:
+        return
+    with dsp_lock:
+        sample_rate = rate
+        live_filter = StreamingBandpass(fs=rate)
+        peak_detector = OnlinePeakDetector(peak_index, fs=rate)
+        sample_clock.nominal_rate = rate
+        sample_clock.reset()
+    print(f"📐 DSP live disesuaikan ke {rate:g} Hz")
+
+def close_active_source():
+    """Hentikan thread reader dan tutup sumber aktif (juga sumber yang ditahan)"""
+    global serial_running, parked_source
+    
+    serial_running = False
+    if active_source is not None and active_source.is_open:
+        active_source.close()
+    if parked_source is not None:
+        parked_source.close()
+        parked_source = None
+
+def release_finished_source():
+    """Tutup sumber non-realtime yang sudah habis, lanjutkan sumber yang ditahan
+    
+    Kembalikan sumber aktif sesudahnya, atau None jika tidak ada yang terbuka.
+    """
+    global active_source, parked_source, serial_running
+    
+    if active_source is None or active_source.realtime:
+        return active_source  # Sumber sudah diganti sebelum penanda akhir diproses
+    
+    serial_running = False
+    active_source.close()
+    if parked_source is None:
+        return None
+    
+    if dsp_thread is not None and dsp_thread is not threading.current_thread():
+        dsp_thread.join(timeout=1.0)  # Thread DSP lama harus berhenti sebelum diganti
+    active_source, parked_source = parked_source, None
+    set_sample_rate(active_source.rate)
+    start_ingest_threads()
+    print(f"🔌 Kembali ke {active_source.describe()}")
+    return active_source
+
+# ============= PIPELINE INGEST (READER → PARSER/DSP → GUI) =============
+RAW_QUEUE_SIZE = 256    # Batch byte mentah menunggu parser
+BLOCK_QUEUE_SIZE = 256  # Blok sampel menunggu GUI
+
+class BoundedQueue:
+    """Antrian berbatas single-producer/single-consumer tanpa lock
+    
+    Memakai deque (append/popleft atomik di CPython). Jika penuh, item baru
+    dibuang dan dihitung di dropped, sehingga terlihat saat konsumen tertinggal.
+    """
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = 0  # Jumlah item yang dibuang karena antrian penuh
+        self.high_water = 0  # Panjang antrian tertinggi yang pernah terjadi
+        self._items = deque()
+        self._ready = threading.Event()
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def put(self, item):
+        """Masukkan item tanpa blocking; False jika dibuang (backpressure)"""
+        if self.full():
+            self.dropped += 1
+            return False
+        self._items.append(item)
+        self.high_water = max(self.high_water, len(self._items))
+        self._ready.set()
+        return True
+    
+    def full(self):
+        return len(self._items) >= self.maxsize
+    
+    def put_wait(self, item, should_continue, poll=0.005):
+        """Masukkan item, tunggu selama antrian penuh (sumber non-realtime)"""
+        while self.full():
+            if not should_continue():
+                return False
+            time.sleep(poll)
+        return self.put(item)
+    
+    def drain(self):
+        """Ambil semua item yang tersedia (non-blocking)"""
+        items = []
+        while True:
+            try:
+                items.append(self._items.popleft())
+            except IndexError:
+                return items
+    
+    def wait_drain(self, timeout):
+        """Tunggu sampai ada item (maks timeout detik), lalu ambil semuanya"""
+        self._ready.wait(timeout)
+        self._ready.clear()
+        return self.drain()
+    
+    def reset_counters(self):
+        self.dropped = 0
+        self.high_water = 0
+
+raw_queue = BoundedQueue(RAW_QUEUE_SIZE)
+block_queue = BoundedQueue(BLOCK_QUEUE_SIZE)
+dropped_samples = 0  # Sampel yang dibuang (sebelum DSP) karena block_queue penuh
+dsp_lock = threading.Lock()  # Melindungi state DSP saat reset dari GUI
+dsp_thread = None
+settling_done_pending = False  # Diset stage DSP, dikonsumsi GUI
+last_esp32_beat_time = np.nan  # Waktu beat ESP32 terakhir (untuk BPM)
+serial_pending = bytearray()  # Sisa baris parsial antar chunk serial
+
+def start_ingest_threads():
+    """Start reader thread dan parser/DSP thread"""
+    global serial_running, serial_thread, dsp_thread
+    
+    serial_running = True
+    serial_thread = threading.Thread(target=read_source_data, args=(active_source,), daemon=True)
+    serial_thread.start()
+    
+    if dsp_thread is None or not dsp_thread.is_alive():
+        dsp_thread = threading.Thread(target=process_serial_data, daemon=True)
+        dsp_thread.start()
+
+def read_source_data(source):
+    """Stage 1: baca dari sumber data ke raw_queue (tanpa parsing)"""
+    print(f"🔄 Reader thread started ({source.describe()})")
+    
+    while serial_running and source.is_open:
+        if not collecting and not source.realtime:
+            time.sleep(0.05)  # Sumber non-realtime (replay) menunggu pengukuran dimulai
+            continue
+        
+        try:
+            data = source.read()
+        except Exception as e:
+            print(f"❌ Source read error: {e}")
+            if not serial_running:
+                break
+            time.sleep(0.01)
+            continue
+        
+        if data is None:
+            # Sumber habis: penanda akhir diproses stage DSP setelah semua data
+            raw_queue.put_wait((time.time(), source, None), lambda: serial_running)
+            break
+        if len(data) == 0 or not collecting:
+            continue
+        
+        item = (time.time(), source, data)
+        if source.realtime:
+            if not raw_queue.put(item):
+                print(f"⚠️ Parser tertinggal, batch dibuang (total {raw_queue.dropped})")
+        else:
+            raw_queue.put_wait(item, lambda: serial_running)
+    
+    print("🛑 Reader thread stopped")
+
+def split_serial_lines(pending, chunk):
+    """Tambah chunk ke pending; kembalikan semua baris lengkap, sisa parsial tetap di pending"""
+    pending += chunk
+    cut = pending.rfind(b'\n') + 1
+    if cut == 0:
+        return b''
+    
+    complete = bytes(pending[:cut])
+    del pending[:cut]
+    return complete
+
+def tokens_per_line_are(data, count):
+    """True jika setiap baris lengkap berisi tepat count token
+    
+    Jumlah total token saja tidak cukup: baris "1 2" diikuti "3 4 5 6" punya
+    6 token untuk 2 baris, tetapi nilainya tergeser ke baris yang salah.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    space = (buf == ord(' ')) | (buf == ord('\t')) | (buf == ord('\r')) | (buf == ord('\n'))
+    starts = np.flatnonzero(~space & np.concatenate(([True], space[:-1])))
+    newlines = np.flatnonzero(buf == ord('\n'))
+    per_line = np.bincount(np.searchsorted(newlines, starts), minlength=len(newlines) + 1)
+    return per_line[-1] == 0 and bool(np.all(per_line[:-1] == count))
+
+def parse_serial_chunk(data):
+    """Parse banyak baris "AC THRESHOLD BEAT_MARKER" sekaligus menjadi blok SAMPLE_DTYPE
+    
+    Jalur cepat: seluruh chunk diparse oleh np.fromstring dalam satu panggilan.
+    Jika ada baris yang tidak berisi tepat 3 angka (atau beat di luar rentang
+    uint8), jatuh ke parse per baris yang membuang baris rusak.
+    """
+    if not data:
+        return np.empty(0, dtype=SAMPLE_DTYPE)
+    
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            values = np.fromstring(data.decode('ascii'), dtype=np.int64, sep=' ')
+        
+        if len(values) == 3 * data.count(b'\n') and tokens_per_line_are(data, 3):
+            values = values.reshape(-1, 3)
+            if values[:, 2].min() < 0 or values[:, 2].max() > SAMPLE_BEAT_MAX:
+                raise ValueError("beat di luar rentang")
+            block = np.zeros(len(values), dtype=SAMPLE_DTYPE)
+            block['ac'] = values[:, 0]
+            block['threshold'] = values[:, 1]
+            block['beat'] = values[:, 2]
+            return block
+    except (ValueError, DeprecationWarning, UnicodeDecodeError):
+        pass
+    
+    return parse_serial_lines(data.split(b'\n'))
+
+# ============= PROTOKOL FRAME BINER ESP32 (OPSIONAL) =============
+# Layout frame (little-endian, 18 byte), sisi firmware:
+#   struct __attribute__((packed)) {
+#     uint16_t sync;       // 0xA55A (byte di kabel: 5A A5)
+#     uint16_t seq;        // nomor urut, wrap di 65536
+#     uint32_t t_us;       // micros() device, wrap ~71 menit
+#     int32_t  ac;
+#     int16_t  threshold;
+#     uint8_t  beat;
+#     uint8_t  flags;      // cadangan
+#     uint16_t crc;        // CRC-16/CCITT-FALSE atas byte 2..15
+#   };
+FRAME_SYNC = 0xA55A
+FRAME_DTYPE = np.dtype([
+    ('sync', '<u2'),
+    ('seq', '<u2'),
+    ('t_us', '<u4'),
+    ('ac', '<i4'),
+    ('threshold', '<i2'),
+    ('beat', 'u1'),
+    ('flags', 'u1'),
+    ('crc', '<u2'),
+])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+FRAME_CRC_START = 2  # CRC dihitung setelah sync word
+FRAME_CRC_END = FRAME_SIZE - 2
+DEVICE_WRAP_MARGIN_US = 10_000_000  # t_us mundur dianggap wrap hanya di sekitar 2^32
+
+def _make_crc16_table():
+    table = np.zeros(256, dtype=np.uint16)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+    return table
+
+CRC16_TABLE = _make_crc16_table()
+
+def crc16_frames(frame_bytes):
+    """CRC-16/CCITT-FALSE untuk banyak frame sekaligus (array uint8 n x panjang)"""
+    crc = np.full(len(frame_bytes), 0xFFFF, dtype=np.uint16)
+    for column in frame_bytes.T:
+        crc = (crc << 8) ^ CRC16_TABLE[(crc >> 8) ^ column]
+    return crc
+
+def encode_frames(seq, t_us, ac, threshold, beat):
+    """Buat byte frame biner (referensi firmware dan pengujian tanpa hardware)"""
+    frames = np.zeros(len(ac), dtype=FRAME_DTYPE)
+    frames['sync'] = FRAME_SYNC
+    frames['seq'] = np.asarray(seq) & 0xFFFF
+    frames['t_us'] = np.asarray(t_us) & 0xFFFFFFFF
+    frames['ac'] = ac
+    frames['threshold'] = threshold
+    frames['beat'] = beat
+    
+    raw = frames.view(np.uint8).reshape(-1, FRAME_SIZE)
+    frames['crc'] = crc16_frames(raw[:, FRAME_CRC_START:FRAME_CRC_END])
+    return frames.tobytes()
+
+class BinaryFrameDecoder:
+    """Decoder frame biner ESP32: sinkronisasi, CRC dan deteksi sampel hilang
+    
+    decode() menerima chunk byte apa adanya dan mengembalikan semua frame valid
+    sebagai structured array FRAME_DTYPE; sisa frame parsial dibawa ke chunk
+    berikutnya. t_us yang mundur jauh dari batas 2^32 berarti device reboot:
+    nomor urut dan jam device dimulai ulang tanpa dihitung sebagai frame hilang.
+    """
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self._pending = bytearray()
+        self._last_seq = None
+        self._seq_wraps = 0
+        self._number_base = 0
+        self._last_number = -1
+        self.sample_numbers = np.empty(0, dtype=np.int64)
+        self._last_t_us = None
+        self._t_wraps = 0
+        self.device_times = np.empty(0)
+        self.frames_ok = 0
+        self.crc_errors = 0
+        self.lost_frames = 0  # Dari celah nomor urut
+        self.skipped_bytes = 0  # Byte di luar frame valid (resync)
+        self.device_resets = 0  # Reboot device terdeteksi dari t_us
+    
+    def decode(self, chunk):
+        self._pending += chunk
+        buf = np.frombuffer(bytes(self._pending), dtype=np.uint8)
+        if len(buf) < FRAME_SIZE:
+            return np.empty(0, dtype=FRAME_DTYPE)
+        
+        # Kandidat awal frame: semua posisi sync word yang muat satu frame penuh
+        starts = np.flatnonzero((buf[:-1] == 0x5A) & (buf[1:] == 0xA5))
+        starts = starts[starts + FRAME_SIZE <= len(buf)]
+        
+        raw = buf[starts[:, None] + np.arange(FRAME_SIZE)]
+        frames = np.ascontiguousarray(raw).view(FRAME_DTYPE).reshape(-1)
+        valid = crc16_frames(raw[:, FRAME_CRC_START:FRAME_CRC_END]) == frames['crc']
+        failed = starts[~valid]
+        starts, frames = starts[valid], frames[valid]
+        
+        # Buang frame yang tumpang tindih (sync palsu di dalam payload yang lolos CRC)
+        if len(starts) > 1 and np.any(np.diff(starts) < FRAME_SIZE):
+            keep = []
+            next_free = 0
+            for i, start in enumerate(starts):
+                if start >= next_free:
+                    keep.append(i)
+                    next_free = start + FRAME_SIZE
+            starts, frames = starts[keep], frames[keep]
+        
+        # Kandidat gagal CRC di dalam frame yang diterima hanyalah byte payload
+        # yang kebetulan mirip sync word, bukan frame rusak
+        if len(starts):
+            owner = np.searchsorted(starts, failed, side='right') - 1
+            failed = failed[(owner < 0) | (failed >= starts[np.maximum(owner, 0)] + FRAME_SIZE)]
+        self.crc_errors += len(failed)
+        
+        # Simpan ekor yang mungkin berisi frame belum lengkap
+        consumed = len(buf) - FRAME_SIZE + 1
+        if len(starts):
+            consumed = max(consumed, int(starts[-1]) + FRAME_SIZE)
+        self.skipped_bytes += int(consumed - FRAME_SIZE * len(starts))
+        del self._pending[:consumed]
+        
+        if len(frames):
+            self._track(frames)
+            self.frames_ok += len(frames)
+        return frames
+    
+    def _track(self, frames):
+        """Isi sample_numbers dan device_times, dipotong per segmen antar reboot"""
+        t = frames['t_us'].astype(np.int64)
+        previous = np.concatenate(([t[0] if self._last_t_us is None else self._last_t_us], t[:-1]))
+        backward = t < previous
+        wrapped = backward & (previous >= 2**32 - DEVICE_WRAP_MARGIN_US) & (t < DEVICE_WRAP_MARGIN_US)
+        resets = np.flatnonzero(backward & ~wrapped)
+        
+        numbers, seconds = [], []
+        bounds = np.unique(np.concatenate(([0], resets, [len(frames)])))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if start in resets:
+                self._restart()
+            numbers.append(self._track_sequence(frames['seq'][start:stop]))
+            seconds.append(self._device_seconds(t[start:stop]))
+        self.sample_numbers = np.concatenate(numbers)
+        self.device_times = np.concatenate(seconds)
+    
+    def _restart(self):
+        """Device reboot: nomor urut & jam mulai ulang, sample number tetap monoton"""
+        self._number_base = self._last_number + 1
+        self._last_seq = None
+        self._seq_wraps = 0
+        self._last_t_us = None
+        self._t_wraps = 0
+        self.device_resets += 1
+    
+    def _track_sequence(self, seq):
+        """Hitung frame hilang dari celah nomor urut (modulo 65536)"""
+        seq = seq.astype(np.int64)
+        previous = seq[0] - 1 if self._last_seq is None else self._last_seq
+        steps = np.diff(seq, prepend=previous)
+        gaps = (steps - 1) % 65536
+        self.lost_frames += int(gaps.sum())
+        self._last_seq = int(seq[-1])
+        
+        # Nomor urut monoton (unwrap) untuk time base
+        wraps = self._seq_wraps + np.cumsum(steps <= 0)
+        self._seq_wraps = int(wraps[-1])
+        numbers = self._number_base + seq + wraps * 65536
+        self._last_number = int(numbers[-1])
+        return numbers
+    
+    def _device_seconds(self, t):
+        """Timestamp device (mikrodetik) → detik monoton dalam satu segmen, wrap 2^32 ditangani"""
+        previous = t[0] if self._last_t_us is None else self._last_t_us
+        wraps = self._t_wraps + np.cumsum(np.diff(t, prepend=previous) < 0)
+        self._last_t_us = int(t[-1])
+        self._t_wraps = int(wraps[-1])
+        return (t + wraps * 2**32) / 1e6
+
+frame_decoder = BinaryFrameDecoder()
+
+def decode_binary_chunk(chunk):
+    """Decode chunk frame biner → (blok SAMPLE_DTYPE, waktu device (detik), nomor urut)"""
+    frames = frame_decoder.decode(chunk)
+    block = np.zeros(len(frames), dtype=SAMPLE_DTYPE)
+    if len(frames) == 0:
+        return block, np.empty(0), np.empty(0, dtype=np.int64)
+    
+    block['ac'] = frames['ac']
+    block['threshold'] = frames['threshold']
+    block['beat'] = frames['beat']
+    return block, frame_decoder.device_times, frame_decoder.sample_numbers
+
+def parse_serial_lines(lines):
+    """Parse baris "AC THRESHOLD BEAT_MARKER" menjadi blok SAMPLE_DTYPE (tanpa waktu)"""
+    rows = []
+    for raw_line in lines:
+        line = raw_line.decode('utf-8', errors='ignore').strip()
+        if not line:
+            continue
+        
+        parts = line.split()
+        if len(parts) >= 3:
+            try:
+                ac, threshold, beat = int(parts[0]), int(parts[1]), int(parts[2])
+            except ValueError as e:
+                print(f"⚠️ Parse error: {line} -> {e}")
+                continue
+            # Nilai di luar rentang kolom akan overflow saat dikonversi ke SAMPLE_DTYPE
+            if not (abs(ac) <= SAMPLE_VALUE_MAX and abs(threshold) <= SAMPLE_VALUE_MAX and 0 <= beat <= SAMPLE_BEAT_MAX):
+                print(f"⚠️ Parse error: {line} -> nilai di luar rentang")
+                continue
+            rows.append((0.0, ac, threshold, beat, 0.0))
+    
+    return np.array(rows, dtype=SAMPLE_DTYPE)
+
+def process_sample_block(block):
+    """DSP atas satu blok sampel: settling, filter, deteksi puncak, agregasi, HR ESP32
+    
+    Dipanggil dengan dsp_lock dipegang. Mengisi kolom 'filtered' di blok.
+    """
+    global is_settling, settling_done_pending, last_esp32_beat_time
+    
+    times = block['time']
+    
+    # ===== CEK SETTLING PERIOD =====
+    if is_settling and times[-1] >= SETTLING_DURATION:
+        is_settling = False
+        settling_done_pending = True
+        print("✅ Settling done! Beat detection active.")
+    ready = times >= SETTLING_DURATION
+    
+    # Filter streaming: hanya sampel baru yang difilter
+    block['filtered'] = live_filter.process(block['ac'])
+    signal_stats.update(block['ac'])
+    
+    # Deteksi puncak online (hanya sampel baru, hasil ke peak_index)
+    _, _, rr = peak_detector.update(times, block['filtered'])
+    beat_stats.update(rr)
+    
+    # ===== BUFFER HANYA DATA READY (setelah settling) =====
+    add_to_buffer(block[ready])
+    if DB_STREAM_SAMPLES == "raw":
+        ready_block = block[ready]
+        timeseries_streamer.add('measurement_samples', {name: ready_block[name] for name in RAW_DOWNSAMPLED_FIELDS})
+    
+    # Calculate heart rate from ESP32 beat markers
+    # HANYA PROSES BEAT SETELAH SETTLING!
+    beat_times = times[np.flatnonzero((block['beat'] > 0) & ready)]
+    if len(beat_times):
+        intervals = np.diff(beat_times, prepend=last_esp32_beat_time)
+        bpm = heart_rates_from_intervals(intervals).compressed()
+        for value in bpm:
+            print(f"💓 Beat! BPM: {value:.1f} (ESP32)")
+        last_esp32_beat_time = beat_times[-1]
+
+# ============= TIME BASE SAMPEL =============
+RATE_FIT_SECONDS = 30.0  # Jendela observasi untuk estimasi laju sampling
+RATE_UPDATE_INTERVAL = 1.0  # Detik antar estimasi ulang
+CLOCK_RESYNC_THRESHOLD = 0.5  # Detik; selisih lebih besar = sampel hilang / jeda
+
+class SampleClock:
+    """Time base sampel pada laju tetap, dengan estimasi laju & drift online
+    
+    Mode counter (ASCII): waktu = waktu sampel sebelumnya + k / laju terukur,
+    laju diperoleh dari regresi jam host terhadap jumlah sampel. Jitter jam host
+    (buffer serial, GIL) tidak masuk ke waktu sampel, hanya ke estimasi laju.
+    Mode device (frame biner): waktu = jam device yang disejajarkan sekali ke
+    sesi (dan ulang setelah device reboot); laju dari nomor urut terhadap jam
+    device, drift dari jam device terhadap jam host.
+    
+    Blok pertama berakhir pada jam host tetapi tidak pernah dimulai sebelum
+    awal sesi (waktu 0). host_time=None (sumber non-realtime) berarti tanpa
+    jam host: waktu hanya menyambung pada laju nominal, tanpa estimasi laju.
+    """
+    
+    def __init__(self, nominal_rate=SAMPLING_RATE):
+        self.nominal_rate = float(nominal_rate)
+        self._observations = deque()
+        self.reset()
+    
+    def reset(self):
+        self._observations.clear()
+        self._last_time = None
+        self._sample_count = 0
+        self._device_offset = None
+        self._last_device_time = None
+        self._next_fit = 0.0
+        self.measured_rate = self.nominal_rate
+        self.drift_ppm = 0.0
+        self.resyncs = 0
+    
+    def stamp_counter(self, n, host_time):
+        """Waktu untuk n sampel baru yang tiba pada host_time (detik sesi)"""
+        if self._last_time is None:
+            first = 0.0 if host_time is None else max(host_time - (n - 1) / self.nominal_rate, 0.0)
+            times = first + np.arange(n) / self.nominal_rate
+        else:
+            times = self._last_time + np.arange(1, n + 1) / self.measured_rate
+            if host_time is not None and abs(host_time - times[-1]) > CLOCK_RESYNC_THRESHOLD:
+                # Celah besar (sampel hilang / jeda / laju salah): sejajarkan ulang
+                # ke jam host dan estimasi ulang laju saat observasi ini masuk
+                times += host_time - times[-1]
+                self.resyncs += 1
+                self._next_fit = host_time
+        
+        self._sample_count += n
+        self._last_time = times[-1]
+        if host_time is not None:
+            self._observe(self._sample_count, None, host_time)
+        return times
+    
+    def stamp_device(self, device_seconds, sample_numbers, host_time):
+        """Waktu sampel dari jam device (detik) dengan nomor urut yang sudah di-unwrap"""
+        previous = device_seconds[0] if self._last_device_time is None else self._last_device_time
+        restarts = np.flatnonzero(np.diff(device_seconds, prepend=previous) < 0)
+        if len(restarts):
+            # Jam device mulai ulang (reboot): sejajarkan ulang ke jam host,
+            # observasi lama tidak lagi sebanding dengan jam device baru
+            self._observations.clear()
+            self.resyncs += 1
+        
+        # Segmen sebelum reboot terakhir di blok ini memakai offset lama
+        times = np.empty(len(device_seconds))
+        earliest = 0.0 if self._last_time is None else self._last_time + 1.0 / self.nominal_rate
+        start = int(restarts[-1]) if len(restarts) else 0
+        if start > 0:
+            if self._device_offset is None:
+                self._device_offset = earliest - device_seconds[0]
+            times[:start] = device_seconds[:start] + self._device_offset
+            earliest = times[start - 1] + 1.0 / self.nominal_rate
+        if len(restarts) or self._device_offset is None:
+            # Sampel terakhir pada host_time, tapi tidak sebelum awal sesi / sampel sebelumnya
+            self._device_offset = earliest - device_seconds[start]
+            if host_time is not None:
+                self._device_offset = max(self._device_offset, host_time - device_seconds[-1])
+        times[start:] = device_seconds[start:] + self._device_offset
+        
+        self._sample_count += len(times)
+        self._last_time = times[-1]
+        self._last_device_time = device_seconds[-1]
+        if host_time is not None:
+            self._observe(sample_numbers[-1], device_seconds[-1], host_time)
+        return times
+    
+    def _observe(self, sample_number, device_time, host_time):
+        self._observations.append((sample_number, device_time, host_time))
+        while self._observations and host_time - self._observations[0][2] > RATE_FIT_SECONDS:
+            self._observations.popleft()
+        
+        if host_time >= self._next_fit:
+            self._next_fit = host_time + RATE_UPDATE_INTERVAL
+            self._fit()
+    
+    def _fit(self):
+        """Estimasi ulang laju sampling dan drift dari jendela observasi"""
+        if len(self._observations) < 3:
+            return
+        
+        samples, device, host = (np.array(column, dtype=float) for column in zip(*self._observations))
+        if host[-1] - host[0] < 5.0:
+            return  # Rentang terlalu pendek untuk estimasi stabil
+        
+        if self._device_offset is None:
+            host_per_sample = np.polyfit(samples, host, 1)[0]
+            rate = 1.0 / host_per_sample
+            drift = (rate / self.nominal_rate - 1.0) * 1e6
+        else:
+            samples_per_device_s = np.polyfit(device, samples, 1)[0]
+            device_per_host_s = np.polyfit(host, device, 1)[0]
+            rate = samples_per_device_s / device_per_host_s
+            drift = (device_per_host_s - 1.0) * 1e6
+        
+        # Laju jauh dari nominal tetap dipakai (perangkat dengan laju lain);
+        # hanya hasil regresi yang rusak yang diabaikan
+        if np.isfinite(rate) and rate > 0:
+            self.measured_rate = float(rate)
+            self.drift_ppm = float(drift)
+
+sample_clock = SampleClock()
+
+def process_serial_data():
+    """Stage 2: parse batch mentah + DSP, kirim blok sampel ke block_queue"""
+    global start_time, settling_start_time, is_settling, dropped_samples
+    
+    print("🔄 Parser/DSP thread started")
+    
+    while serial_running:
+        batches = raw_queue.wait_drain(timeout=0.1)
+        
+        for arrival_time, source, chunk in batches:
+            if chunk is None:
+                # Penanda akhir sumber: blok sebelumnya sudah ada di block_queue
+                dispatch(on_source_finished)
+                continue
+            
+            try:
+                with dsp_lock:
+                    device_times = None
+                    if source.protocol == "samples":
+                        block = chunk  # Waktu sudah terisi (replay/simulator)
+                    elif source.protocol == "binary":
+                        block, device_times, sample_numbers = decode_binary_chunk(chunk)
+                    else:
+                        block = parse_serial_chunk(split_serial_lines(serial_pending, chunk))
+                    if len(block) == 0 or not collecting:
+                        continue
+                    
+                    # Initialize start time
+                    if start_time is None:
+                        start_time = arrival_time - (len(block) - 1) / sample_rate
+                        settling_start_time = start_time
+                        is_settling = True
+                        print("⏳ Settling period started (4 detik)...")
+                    
+                    # Waktu sampel dari time base (penghitung sampel / jam device),
+                    # bukan dari jam host per baris; sumber non-realtime (simulator
+                    # tanpa pacing) tidak punya hubungan dengan jam host
+                    host_time = arrival_time - start_time if source.realtime else None
+                    if device_times is not None:
+                        block['time'] = sample_clock.stamp_device(device_times, sample_numbers, host_time)
+                    elif source.protocol != "samples":
+                        block['time'] = sample_clock.stamp_counter(len(block), host_time)
+                    
+                    # Buang sebelum DSP: blok yang tidak sampai ke GUI juga tidak
+                    # masuk agregat, indeks peak maupun streaming database
+                    if source.realtime and block_queue.full():
+                        block_queue.dropped += 1
+                        dropped_samples += len(block)
+                        continue
+                    
+                    process_sample_block(block)
+                
+                # Di luar lock: GUI perlu dsp_lock untuk menguras block_queue.
+                # Hanya thread ini yang mengisi antrian, jadi tempat di atas masih ada
+                if source.realtime:
+                    block_queue.put(block)
+                else:
+                    block_queue.put_wait(block, lambda: serial_running)
+            
+            except Exception as e:
+                # Satu batch rusak tidak boleh menghentikan thread DSP
+                print(f"❌ DSP error (batch dilewati): {e}")
+    
+    print("🛑 Parser/DSP thread stopped")
+
+def drain_sample_blocks():
+    """Stage 3 (thread klien): pindahkan semua blok yang siap ke sample_store
+    
+    Kembalikan daftar blok yang dipindahkan (kosong jika belum ada).
+    """
+    blocks = block_queue.drain()
+    for block in blocks:
+        sample_store.extend(block)
+    return blocks
+
+def consume_settling_done():
+    """True sekali setelah periode settling selesai (notifikasi ke klien)"""
+    global settling_done_pending
+    done, settling_done_pending = settling_done_pending, False
+    return done
+
+# ============= REPLAY SESI REKAMAN =============
+REPLAY_SPEED = 1.0  # Default dialog: 1 = waktu nyata, N = N kali, 0 = secepat mungkin
+REPLAY_BLOCK_SECONDS = 0.2  # Ukuran blok replay berpacing (waktu rekaman)
+REPLAY_FAST_BLOCK_SECONDS = 10.0  # Ukuran blok saat secepat mungkin (tanpa sleep)
+RATE_ESTIMATE_SAMPLES = 1000  # Sampel awal rekaman untuk menaksir laju nominalnya
+
+def load_recorded_samples(path):
+    """Sampel rekaman (direktori arsip sesi atau file .npy) sebagai memmap read-only"""
+    if os.path.isdir(path):
+        samples = open_session_archive(path)['samples']
+    else:
+        samples = np.load(path, mmap_mode='r')
+    
+    missing = {'time', 'ac', 'threshold', 'beat'} - set(samples.dtype.names or ())
+    if missing:
+        raise ValueError(f"Kolom tidak ada di rekaman: {', '.join(sorted(missing))}")
+    return samples
+
+def recorded_rate(samples):
+    """Laju nominal rekaman (Hz) dari median selang waktu sampel-sampel awal"""
+    steps = np.diff(np.asarray(samples['time'][:RATE_ESTIMATE_SAMPLES], dtype=float))
+    steps = steps[steps > 0]
+    return 1.0 / float(np.median(steps)) if len(steps) else float(SAMPLING_RATE)
+
+class ReplaySource(DataSource):
+    """Putar ulang sampel rekaman sebagai sumber data
+    
+    speed 1 = waktu nyata, N = N kali lebih cepat, 0/None = secepat mungkin.
+    Waktu sampel rekaman dipakai apa adanya sehingga hasilnya deterministik;
+    pipeline menunggu (tidak membuang) saat antrian penuh.
+    """
+    
+    protocol = "samples"
+    realtime = False
+    
+    def __init__(self, samples, speed=1.0, name="rekaman"):
+        self.samples = samples
+        self.speed = speed
+        self.name = name
+        self.rate = recorded_rate(samples)
+        block_seconds = REPLAY_BLOCK_SECONDS if speed else REPLAY_FAST_BLOCK_SECONDS
+        self.block_size = max(1, int(block_seconds * self.rate))
+        self._position = None
+    
+    def open(self):
+        self._position = 0
+        self._wall_start = None
+    
+    def close(self):
+        self._position = None
+    
+    @property
+    def is_open(self):
+        return self._position is not None
+    
+    def read(self):
+        if self._position >= len(self.samples):
+            return None
+        
+        chunk = self.samples[self._position:self._position + self.block_size]
+        self._position += len(chunk)
+        block = np.zeros(len(chunk), dtype=SAMPLE_DTYPE)
+        for name in ('time', 'ac', 'threshold', 'beat'):
+            block[name] = chunk[name]
+        
+        if self.speed:
+            # Tunggu sampai sampel terakhir blok "jatuh tempo" pada kecepatan ini
+            if self._wall_start is None:
+                self._wall_start = time.perf_counter()
+                self._record_start = float(block['time'][0])
+            delay = self._wall_start + (block['time'][-1] - self._record_start) / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return block
+    
+    def describe(self):
+        speed_text = f"{self.speed:g}×" if self.speed else "maks"
+        return f"Replay {self.name} ({speed_text})"
+
+def replay_samples(samples, speed=1.0, sink=None, should_continue=None):
+    """Replay langsung tanpa thread: sampel rekaman → DSP → sink
+    
+    Untuk re-analisis dan benchmark tanpa GUI. Blok hasil DSP diteruskan ke
+    sink (default: langsung ke sample_store). Kembalikan jumlah sampel.
+    """
+    if sink is None:
+        sink = sample_store.extend
+    source = ReplaySource(samples, speed)
+    source.open()
+    replayed = 0
+    
+    while should_continue is None or should_continue():
+        block = source.read()
+        if block is None:
+            break
+        with dsp_lock:
+            process_sample_block(block)
+        sink(block)
+        replayed += len(block)
+    
+    return replayed
+
+def on_source_finished():
+    """Sumber data habis (mis. replay selesai); dijalankan di thread klien"""
+    print(f"⏹️ Sumber data selesai: {active_source.describe()}")
+    if source_finished_hook is not None:
+        source_finished_hook()  # Klien juga memanggil release_finished_source()
+        return
+    if collecting:
+        stop_session()  # Agregasi sisa + sync arsip
+    release_finished_source()
+
+# ============= FILTER & DETEKSI DETAK =============
+FilterDesign = namedtuple('FilterDesign', ['sos', 'zi'])
+
+@lru_cache(maxsize=FILTER_DESIGN_CACHE_SIZE)
+def get_filter_design(lowcut, highcut, fs, order):
+    """Desain bandpass Butterworth (SOS + zi steady-state), di-cache per parameter
+    
+    Array yang dikembalikan dipakai bersama oleh semua pemanggil: jangan diubah.
+    """
+    nyq = 0.5 * fs
+    sos = butter(order, [lowcut / nyq, highcut / nyq], btype='band', output='sos')
+    return FilterDesign(sos, sosfilt_zi(sos))
+
+class StreamingBandpass:
+    """Bandpass Butterworth kausal untuk data live.
+    
+    Memakai desain dari get_filter_design() yang sama dengan bandpass_filter(),
+    dengan state zi yang dibawa antar pemanggilan, sehingga setiap tick hanya
+    memfilter sampel yang baru datang.
+    """
+    
+    def __init__(self, lowcut=None, highcut=None, fs=SAMPLING_RATE, order=None):
+        self.design = get_filter_design(
+            filter_lowcut if lowcut is None else lowcut,
+            filter_highcut if highcut is None else highcut,
+            fs,
+            filter_order if order is None else order
+        )
+        self.sos = self.design.sos
+        self._zi = None
+    
+    def process(self, samples):
+        """Filter blok sampel baru dan simpan state untuk blok berikutnya"""
+        x = np.asarray(samples, dtype=float)
+        if len(x) == 0:
+            return x
+        
+        # Mulai dari kondisi steady-state untuk sampel pertama (tanpa transien DC)
+        if self._zi is None:
+            self._zi = self.design.zi * x[0]
+        
+        y, self._zi = sosfilt(self.sos, x, zi=self._zi)
+        return y
+    
+    def reset(self):
+        self._zi = None
+
+# Filter live untuk plotting/deteksi real-time
+live_filter = StreamingBandpass(fs=SAMPLING_RATE)
+
+# Analisis akhir: filtfilt zero-phase atas riwayat lengkap (offline)
+OFFLINE_ZERO_PHASE = True
+
+def bandpass_filter(data, lowcut=None, highcut=None, fs=SAMPLING_RATE, order=None):
+    """Apply zero-phase bandpass filter to PPG signal (0.5-5 Hz, offline pass)"""
+    if lowcut is None:
+        lowcut = filter_lowcut
+    if highcut is None:
+        highcut = filter_highcut
+    if order is None:
+        order = filter_order
+    
+    min_length = max(order * 6, 20)
+    if len(data) < min_length:
+        return data
+    
+    try:
+        design = get_filter_design(lowcut, highcut, fs, order)
+        return sosfiltfilt(design.sos, data)
+    except ValueError as e:
+        print(f"Filter error: {e}")
+        return data
+
+def samples_at_rate(samples, fs):
+    """Jumlah sampel yang dinyatakan pada SAMPLING_RATE, dikonversi ke laju fs"""
+    return max(1, int(round(samples * fs / SAMPLING_RATE)))
+
+def heart_rates_from_intervals(intervals):
+    """BPM dari RR interval (detik) sebagai masked array; HR di luar batas valid di-mask"""
+    intervals = np.asarray(intervals, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bpm = 60.0 / intervals
+    invalid = ~((intervals > 0) & (bpm >= min_heart_rate) & (bpm <= max_heart_rate))
+    return np.ma.masked_array(bpm, mask=invalid)
+
+def empty_heartbeats():
+    """Hasil deteksi kosong dengan tipe yang sama seperti detect_heartbeats"""
+    return np.empty(0), np.empty(0), heart_rates_from_intervals(np.empty(0))
+
+def detect_heartbeats(ppg_data, time_data, min_height=None, min_distance=None, prefiltered=False, fs=SAMPLING_RATE):
+    """Detect heartbeat peaks from PPG signal (prefiltered: sinyal sudah difilter)
+    
+    Returns (peak_times, peak_values, heart_rates) as float arrays; heart_rates
+    is a masked array with one entry per RR interval, invalid HR masked.
+    """
+    if len(ppg_data) < 50:
+        return empty_heartbeats()
+    
+    if min_height is None:
+        min_height = min_peak_height
+    if min_distance is None:
+        min_distance = samples_at_rate(min_peak_distance, fs)
+    
+    try:
+        # Apply bandpass filter
+        filtered_ppg = ppg_data if prefiltered else bandpass_filter(ppg_data, fs=fs)
+        
+        # Find peaks in PPG signal
+        peaks, properties = find_peaks(filtered_ppg, 
+                                     height=min_height,
+                                     distance=min_distance,
+                                     prominence=min_peak_prominence)
+        
+        peak_times = np.asarray(time_data, dtype=float)[peaks]
+        peak_values = np.asarray(filtered_ppg, dtype=float)[peaks]
+        
+        # Calculate heart rate from peak intervals (seconds)
+        heart_rates = heart_rates_from_intervals(np.diff(peak_times))
+        
+        print(f"Detected {len(peaks)} heartbeats, valid HR: {heart_rates.count()}")
+        
+        return peak_times, peak_values, heart_rates
+    except Exception as e:
+        print(f"Heartbeat detection error: {e}")
+        return empty_heartbeats()
+
+class PeakIndex:
+    """Indeks detak bersama: waktu, nilai dan RR setiap puncak terdeteksi
+    
+    Diisi oleh OnlinePeakDetector (atau dibangun ulang oleh analisis offline)
+    dan dibaca oleh plot, panel analisis dan calculate_heart_rate_statistics.
+    """
+    
+    def __init__(self, initial_capacity=1024):
+        self._times = np.empty(initial_capacity)
+        self._values = np.empty(initial_capacity)
+        self._rr = np.empty(initial_capacity)  # Detik; NaN untuk detak pertama
+        self.count = 0
+        self.generation = 0  # Naik setiap isi diganti/dikosongkan (lihat SessionArchive)
+    
+    def _grow(self, needed):
+        capacity = len(self._times)
+        while capacity < needed:
+            capacity *= 2
+        for name in ('_times', '_values', '_rr'):
+            old = getattr(self, name)
+            new = np.empty(capacity)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+    
+    def append(self, times, values):
+        """Tambah puncak baru (terurut waktu), kembalikan RR interval-nya"""
+        times = np.asarray(times, dtype=float)
+        values = np.asarray(values, dtype=float)
+        
+        # Abaikan puncak yang tidak lebih baru dari isi indeks
+        if self.count > 0:
+            keep = times > self._times[self.count - 1]
+            times, values = times[keep], values[keep]
+        
+        n = len(times)
+        if n == 0:
+            return np.empty(0)
+        if self.count + n > len(self._times):
+            self._grow(self.count + n)
+        
+        previous = self._times[self.count - 1] if self.count > 0 else np.nan
+        rr = np.diff(times, prepend=previous)
+        
+        start = self.count
+        self._times[start:start + n] = times
+        self._values[start:start + n] = values
+        self._rr[start:start + n] = rr
+        self.count += n
+        return rr
+    
+    def replace(self, times, values):
+        """Ganti seluruh isi indeks (mis. hasil analisis offline zero-phase)"""
+        self.clear()
+        self.append(times, values)
+    
+    def clear(self):
+        self.count = 0
+        self.generation += 1
+    
+    @property
+    def times(self):
+        return self._times[:self.count]
+    
+    @property
+    def values(self):
+        return self._values[:self.count]
+    
+    @property
+    def rr_intervals(self):
+        """RR interval (detik) antar puncak berurutan"""
+        return self._rr[1:self.count]
+    
+    def snapshot(self):
+        """(peak_times, peak_values, heart_rates) dengan format sama seperti detect_heartbeats"""
+        return self.times, self.values, heart_rates_from_intervals(self.rr_intervals)
+
+class OnlinePeakDetector:
+    """Deteksi puncak inkremental: find_peaks hanya atas jendela lookback kecil
+    
+    Puncak baru dilaporkan setelah min_distance sampel berikutnya tiba. Ini
+    pendekatan dari find_peaks atas seluruh sinyal, bukan padanan persis:
+    aturan distance (rantai puncak yang lebih tinggi) dan basis prominence bisa
+    bergantung pada sampel di luar jendela. Pada sinyal sintetis berderau
+    selisihnya ~0.1-0.6% puncak, terbanyak saat HR mendekati batas distance;
+    analisis akhir (OFFLINE_ZERO_PHASE) membangun ulang indeks dari sinyal utuh.
+    """
+    
+    def __init__(self, peak_index, lookback=PEAK_LOOKBACK_SAMPLES, fs=SAMPLING_RATE):
+        self.peak_index = peak_index
+        self.fs = fs
+        self.lookback = samples_at_rate(lookback, fs)
+        self.reset()
+    
+    def reset(self):
+        self._times = np.empty(0)
+        self._values = np.empty(0)
+        self._offset = 0  # Indeks absolut sampel pertama di jendela
+        self._last_peak = None  # Indeks absolut puncak terakhir yang dilaporkan
+    
+    def update(self, times, values, min_height=None, min_distance=None):
+        """Proses sampel baru (sudah difilter); kembalikan (waktu, nilai, RR) puncak baru"""
+        if min_height is None:
+            min_height = min_peak_height
+        if min_distance is None:
+            min_distance = samples_at_rate(min_peak_distance, self.fs)
+        
+        self._times = np.concatenate((self._times, np.asarray(times, dtype=float)))
+        self._values = np.concatenate((self._values, np.asarray(values, dtype=float)))
+        
+        peaks, _ = find_peaks(self._values,
+                              height=min_height,
+                              distance=min_distance,
+                              prominence=min_peak_prominence)
+        
+        # Hanya puncak yang sudah terkonfirmasi dan belum pernah dilaporkan
+        confirmed_until = len(self._values) - min_distance
+        new_peaks = []
+        for p in peaks:
+            absolute = self._offset + p
+            if p > confirmed_until:
+                break
+            if self._last_peak is not None and absolute - self._last_peak < min_distance:
+                continue
+            new_peaks.append(p)
+            self._last_peak = absolute
+        
+        new_times = self._times[new_peaks]
+        new_values = self._values[new_peaks]
+        rr = self.peak_index.append(new_times, new_values)
+        new_times, new_values = new_times[len(new_times) - len(rr):], new_values[len(new_values) - len(rr):]
+        
+        # Pangkas jendela lookback
+        excess = len(self._values) - self.lookback
+        if excess > 0:
+            self._times = self._times[excess:]
+            self._values = self._values[excess:]
+            self._offset += excess
+        
+        return new_times, new_values, rr
+
+# Indeks detak tunggal yang dipakai bersama semua tampilan/analisis
+peak_index = PeakIndex()
+peak_detector = OnlinePeakDetector(peak_index)
+
+# ============= STATISTIK BERJALAN (WELFORD) =============
+HRV_WINDOW_BEATS = 60  # Jendela RMSSD/SDNN bergulir (jumlah detak)
+
+StatsSnapshot = namedtuple('StatsSnapshot', ['count', 'mean', 'm2', 'min', 'max'])
+
+class RunningStats:
+    """Mean/varians Welford + min/max berjalan; query O(1)
+    
+    update() menerima blok sekaligus (digabung dengan rumus paralel Chan),
+    merge() menggabungkan statistik blok/thread lain tanpa data mentah.
+    """
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Jumlah kuadrat deviasi dari mean
+        self.min = np.inf
+        self.max = -np.inf
+    
+    def update(self, values):
+        """Tambah satu blok nilai"""
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        block_mean = values.mean()
+        self.merge(StatsSnapshot(len(values), block_mean, float(((values - block_mean) ** 2).sum()),
+                                 float(values.min()), float(values.max())))
+    
+    def merge(self, other):
+        """Gabungkan RunningStats atau StatsSnapshot lain ke statistik ini"""
+        if isinstance(other, RunningStats):
+            other = other.snapshot()
+        if other.count == 0:
+            return self
+        
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+    
+    def snapshot(self):
+        return StatsSnapshot(self.count, float(self.mean), float(self.m2), float(self.min), float(self.max))
+    
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls().merge(snapshot)
+    
+    @property
+    def variance(self):
+        """Varians populasi (ddof=0, sama dengan np.var)"""
+        return self.m2 / self.count if self.count else 0.0
+    
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+class RollingRMSSD:
+    """RMSSD atas selisih RR berurutan; window=None berarti seluruh sesi"""
+    
+    def __init__(self, window=None):
+        self.window = window
+        self.reset()
+    
+    def reset(self):
+        self._squares = deque(maxlen=self.window) if self.window else None
+        self._sum = 0.0
+        self._count = 0
+        self._last_rr = np.nan
+    
+    def update(self, rr_ms):
+        rr_ms = np.asarray(rr_ms, dtype=float)
+        if len(rr_ms) == 0:
+            return
+        squares = np.diff(rr_ms, prepend=self._last_rr) ** 2
+        self._last_rr = rr_ms[-1]
+        squares = squares[np.isfinite(squares)]
+        
+        if self._squares is None:
+            self._sum += float(squares.sum())
+            self._count += len(squares)
+            return
+        
+        for square in squares.tolist():
+            if len(self._squares) == self.window:
+                self._sum -= self._squares[0]
+            self._squares.append(square)
+            self._sum += square
+        self._count = len(self._squares)
+    
+    @property
+    def value(self):
+        return float(np.sqrt(max(self._sum, 0.0) / self._count)) if self._count else 0.0
+
+class SlidingSDNN:
+    """SDNN (std populasi RR) atas window detak terakhir, O(1) per detak
+    
+    Jumlah dihitung relatif terhadap RR pertama agar tidak kehilangan presisi.
+    """
+    
+    def __init__(self, window=HRV_WINDOW_BEATS):
+        self.window = window
+        self.reset()
+    
+    def reset(self):
+        self._values = deque(maxlen=self.window)
+        self._shift = None
+        self._sum = 0.0
+        self._sumsq = 0.0
+    
+    def update(self, rr_ms):
+        for rr in np.asarray(rr_ms, dtype=float).tolist():
+            if self._shift is None:
+                self._shift = rr
+            if len(self._values) == self.window:
+                old = self._values[0] - self._shift
+                self._sum -= old
+                self._sumsq -= old * old
+            self._values.append(rr)
+            shifted = rr - self._shift
+            self._sum += shifted
+            self._sumsq += shifted * shifted
+    
+    @property
+    def value(self):
+        n = len(self._values)
+        if n == 0:
+            return 0.0
+        mean = self._sum / n
+        return float(np.sqrt(max(self._sumsq / n - mean * mean, 0.0)))
+
+class BeatStats:
+    """Statistik per detak: HR, RR, RMSSD dan SDNN (sesi + window bergulir)"""
+    
+    def __init__(self, window=HRV_WINDOW_BEATS):
+        self.hr = RunningStats()  # BPM, hanya HR valid
+        self.rr = RunningStats()  # ms, SDNN sesi = rr.std
+        self.rmssd = RollingRMSSD()
+        self.rolling_rmssd = RollingRMSSD(window)
+        self.rolling_sdnn = SlidingSDNN(window)
+    
+    def reset(self):
+        for stats in (self.hr, self.rr, self.rmssd, self.rolling_rmssd, self.rolling_sdnn):
+            stats.reset()
+    
+    def update(self, rr_seconds):
+        """Tambah RR interval (detik, NaN untuk detak pertama) dari detektor"""
+        rr_seconds = np.asarray(rr_seconds, dtype=float)
+        rr_seconds = rr_seconds[np.isfinite(rr_seconds)]
+        if len(rr_seconds) == 0:
+            return
+        rr_ms = rr_seconds * 1000
+        self.hr.update(heart_rates_from_intervals(rr_seconds).compressed())
+        self.rr.update(rr_ms)
+        self.rmssd.update(rr_ms)
+        self.rolling_rmssd.update(rr_ms)
+        self.rolling_sdnn.update(rr_ms)
+    
+    def summary(self):
+        """Nilai siap pakai untuk GUI, ekspor dan database"""
+        return {
+            'valid_beats': self.hr.count,
+            'avg_hr': self.hr.mean,
+            'min_hr': self.hr.min if self.hr.count else 0.0,
+            'max_hr': self.hr.max if self.hr.count else 0.0,
+            'std_hr': self.hr.std,
+            'avg_rr': self.rr.mean,
+            'sdnn': self.rr.std,
+            'rmssd': self.rmssd.value,
+            'rolling_sdnn': self.rolling_sdnn.value,
+            'rolling_rmssd': self.rolling_rmssd.value,
+        }
+
+# Diisi di stage DSP (process_sample_block), dibaca GUI lewat live_stats_snapshot()
+signal_stats = RunningStats()  # Sinyal AC mentah, per sampel
+beat_stats = BeatStats()  # Per detak dari detektor online
+
+def live_stats_snapshot():
+    """(StatsSnapshot sinyal AC, ringkasan detak) yang konsisten antar thread"""
+    with dsp_lock:
+        return signal_stats.snapshot(), beat_stats.summary()
+
+# ============= SESI & ANALISIS (API ENGINE) =============
+MIN_ANALYSIS_SAMPLES = 100  # Minimum titik data untuk analisis (2 detik @ 50Hz)
+
+class EngineError(Exception):
+    """Operasi engine tidak bisa dijalankan; pesan siap ditampilkan ke pengguna"""
+
+AnalysisResult = namedtuple('AnalysisResult', [
+    'summary',  # dict HR/HRV + klasifikasi (kolom analysis_results)
+    'peak_times',  # Waktu detak (detik)
+    'total_samples',
+    'duration',  # Detik
+    'measured_rate',  # Hz
+    'drift_ppm',
+    'aggregate_count',
+    'raw_downsampled_count',
+    'finished_at',  # time.time() saat analisis selesai
+])
+
+def classify_heart_rate(avg_hr):
+    """(klasifikasi, kondisi) dari detak jantung rata-rata"""
+    if avg_hr < 60:
+        return "Bradikardia (Lambat)", "Di bawah normal"
+    if avg_hr <= 100:
+        return "Normal", "Sehat"
+    return "Takikardia (Cepat)", "Di atas normal"
+
+def summarize_beats(beat_summary, beats_detected):
+    """Ringkasan BeatStats + jumlah detak dan klasifikasi (format database)"""
+    classification, condition = classify_heart_rate(beat_summary['avg_hr'])
+    return {
+        'avg_hr': beat_summary['avg_hr'],
+        'min_hr': beat_summary['min_hr'],
+        'max_hr': beat_summary['max_hr'],
+        'std_hr': beat_summary['std_hr'],
+        'beats_detected': beats_detected,
+        'valid_beats': beat_summary['valid_beats'],
+        'rmssd': beat_summary['rmssd'],  # Root Mean Square of Successive Differences
+        'sdnn': beat_summary['sdnn'],  # Standard Deviation of NN intervals
+        'avg_rr': beat_summary['avg_rr'],
+        'classification': classification,
+        'condition': condition
+    }
+
+def analyze_samples(time_data, ppg_data, min_height=None, min_distance=None, fs=SAMPLING_RATE):
+    """Analisis offline murni atas satu rekaman (tanpa menyentuh state sesi)
+    
+    Kembalikan (peak_times, peak_values, summary).
+    """
+    peak_times, peak_values, _ = detect_heartbeats(ppg_data, time_data, min_height, min_distance, fs=fs)
+    stats = BeatStats()
+    stats.update(np.diff(peak_times))
+    return peak_times, peak_values, summarize_beats(stats.summary(), len(peak_times))
+
+def analyze_session():
+    """Analisis akhir sesi atas riwayat lengkap (file spill), bukan hanya jendela live
+    
+    Raise EngineError jika data atau detak valid belum cukup.
+    """
+    global latest_analysis
+    
+    if sample_store.total_count < MIN_ANALYSIS_SAMPLES:
+        raise EngineError(f"Tidak cukup data untuk analisis\n"
+                          f"Minimum diperlukan: {MIN_ANALYSIS_SAMPLES} titik data (2 detik)")
+    
+    samples = sample_store.history()
+    if OFFLINE_ZERO_PHASE:
+        # Pass offline zero-phase membangun ulang indeks detak bersama
+        peak_times, peak_values, summary = analyze_samples(samples['time'], samples['ac'], fs=session_rate)
+        with dsp_lock:
+            peak_index.replace(peak_times, peak_values)
+    else:
+        # Indeks live: statistik berjalan sudah lengkap (query O(1))
+        _, beat_summary = live_stats_snapshot()
+        summary = summarize_beats(beat_summary, peak_index.count)
+    
+    with dsp_lock:
+        peak_times = peak_index.times.copy()
+    
+    if summary['valid_beats'] < 2:
+        raise EngineError(f"Perlu setidaknya 2 detak jantung untuk analisis\n"
+                          f"Saat ini terdeteksi: {len(peak_times)} detak\n"
+                          f"Valid HR: {summary['valid_beats']}\n"
+                          f"Coba sesuaikan pengaturan deteksi")
+    
+    latest_analysis = AnalysisResult(
+        summary=summary,
+        peak_times=peak_times,
+        total_samples=len(samples),
+        duration=sample_store.last_time(),
+        measured_rate=sample_clock.measured_rate,
+        drift_ppm=sample_clock.drift_ppm,
+        aggregate_count=len(aggregated_data),
+        raw_downsampled_count=len(raw_downsampled),
+        finished_at=time.time(),
+    )
+    if session_archive is not None:
+        session_archive.sync(force=True)  # Simpan indeks detak offline + ringkasan
+    return latest_analysis
+
+def format_analysis_report(result, subject):
+    """Laporan teks lengkap (panel analisis, file .txt dan kolom database)"""
+    s = result.summary
+    peak_times = result.peak_times
+    avg_hr, min_hr, max_hr, rmssd = s['avg_hr'], s['min_hr'], s['max_hr'], s['rmssd']
+    total = result.total_samples
+    efficiency = (1 - result.aggregate_count / max(1, total)) * 100
+    
+    # RR intervals (ms) untuk ditampilkan (10 pertama)
+    rr_intervals = np.diff(peak_times[:11]) * 1000
+    
+    return f"""
+{'='*60}
+    ANALISIS DETAK JANTUNG - {subject.upper()}
+{'='*60}
+
+INFORMASI PENGUKURAN:
+  • Subjek                       : {subject}
+  • Durasi Pengukuran            : {result.duration:.2f} detik
+  • Total Titik Data             : {total}
+  • Data Agregat Tersimpan       : {result.aggregate_count} records
+  • Sampling Rate (terukur)      : {result.measured_rate:.2f} Hz (drift {result.drift_ppm:+.0f} ppm)
+  • Efisiensi Penyimpanan        : {efficiency:.1f}%
+
+{'─'*60}
+HASIL DETEKSI DETAK JANTUNG:
+  • Jumlah Detak Terdeteksi      : {len(peak_times)}
+  • Detak Valid                  : {s['valid_beats']}
+  • Waktu Detak (s)              : {', '.join([f'{t:.2f}' for t in peak_times[:10]])}{'...' if len(peak_times) > 10 else ''}
+  • RR Intervals (ms)            : {', '.join([f'{rr:.0f}' for rr in rr_intervals[:10]])}{'...' if len(peak_times) > 11 else ''}
+
+{'─'*60}
+STATISTIK DETAK JANTUNG:
+  • Detak Jantung Rata-rata      : {avg_hr:.1f} BPM
+  • Detak Jantung Minimum        : {min_hr:.1f} BPM
+  • Detak Jantung Maksimum       : {max_hr:.1f} BPM
+  • Standar Deviasi              : {s['std_hr']:.2f} BPM
+  • Rentang                      : {max_hr - min_hr:.1f} BPM
+
+{'─'*60}
+HEART RATE VARIABILITY (HRV):
+  • SDNN (Standar Deviasi RR)    : {s['sdnn']:.2f} ms
+  • RMSSD (Root Mean Square)     : {rmssd:.2f} ms
+  • Rata-rata RR Interval        : {s['avg_rr']:.1f} ms
+
+INTERPRETASI HRV:
+  • RMSSD Tinggi (>50ms)         : Sistem saraf parasimpatik aktif (relaks)
+  • RMSSD Rendah (<20ms)         : Stres atau kelelahan
+  • Anda                         : {rmssd:.1f} ms ({'Baik' if rmssd > 50 else 'Perhatian' if rmssd > 20 else 'Rendah'})
+
+{'─'*60}
+KLASIFIKASI DETAK JANTUNG:
+  • Kategori                     : {s['classification']}
+  • Kondisi                      : {s['condition']}
+  • Status Kesehatan             : {'Normal' if 60 <= avg_hr <= 100 else 'Perlu Perhatian'}
+
+{'─'*60}
+DATA STORAGE INFO (BUFFERED):
+  • Total Data Asli              : {total} points
+  • Data Agregat                 : {result.aggregate_count} records
+  • Raw Downsampled              : {result.raw_downsampled_count} samples
+  • Efisiensi                    : {efficiency:.1f}% pengurangan spam!
+
+{'='*60}
+Analisis {subject} selesai pada: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(result.finished_at))}
+Durasi: 0.00 - {result.duration:.2f} detik
+{'='*60}
+"""
+
+def start_session(subject, record=True):
+    """Mulai pengukuran dari sumber aktif
+    
+    record=False (mis. replay) tidak membuat arsip sesi dan tidak streaming
+    ke database. Raise EngineError jika belum ada sumber data.
+    """
+    global collecting, start_time, is_settling, settling_start_time, session_rate
+    
+    if active_source is None or not active_source.is_open:
+        raise EngineError("Tidak ada sumber data!\n\nHubungkan serial, jaringan atau simulator terlebih dahulu.")
+    
+    with dsp_lock:
+        serial_pending.clear()  # Buang baris parsial dari sebelum pengukuran
+        frame_decoder.reset()
+        sample_clock.reset()
+        session_rate = sample_rate
+        collecting = True
+        start_time = time.time()
+        settling_start_time = start_time
+        is_settling = True  # ← Reset settling flag
+    
+    if record:
+        start_session_archive(subject)
+        timeseries_streamer.start(subject, start_time)
+
+def stop_session():
+    """Hentikan pengukuran: kuras pipeline, agregasi sisa buffer, sync arsip"""
+    global collecting
+    collecting = False
+    
+    # Agregasi sisa buffer (setelah blok terakhir dari pipeline diambil)
+    with dsp_lock:
+        drain_sample_blocks()
+        if len(data_buffer) > 0:
+            aggregate_buffer()
+            print(f"✅ Final buffer agregasi: {len(aggregated_data)} total records")
+    timeseries_streamer.stop()
+    if session_archive is not None:
+        session_archive.sync(force=True)
+
+def reset_session():
+    """Kosongkan semua data sesi dan state DSP (arsip aktif ditutup)"""
+    global start_time, is_settling, settling_start_time, latest_analysis
+    global dropped_samples, last_esp32_beat_time, settling_done_pending
+    
+    close_session_archive()
+    
+    # Stage DSP dihentikan sebentar agar state-nya direset secara konsisten
+    with dsp_lock:
+        raw_queue.drain()
+        block_queue.drain()
+        raw_queue.reset_counters()
+        block_queue.reset_counters()
+        dropped_samples = 0
+        
+        sample_store.reset(spill_path=DEFAULT_SPILL_PATH)
+        timeseries_streamer.reset()
+        signal_stats.reset()
+        beat_stats.reset()
+        live_filter.reset()
+        peak_detector.reset()
+        peak_index.clear()
+        last_esp32_beat_time = np.nan
+        sample_clock.reset()
+        serial_pending.clear()
+        frame_decoder.reset()
+        settling_done_pending = False
+        start_time = None
+        settling_start_time = None  # ← RESET settling
+        is_settling = False  # ← RESET settling
+        latest_analysis = None
+        
+        # Reset buffer data
+        data_buffer.clear()
+        aggregate_pyramid.clear()  # Termasuk aggregated_data (level 0)
+        raw_downsampled.clear()
@@ -3,60 +3,23 @@ from tkinter import filedialog, messagebox, simpledialog, ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 import pandas as pd
-from scipy.signal import butter, filtfilt, find_peaks
 import numpy as np
 import time
 import serial
-import serial.tools.list_ports
-import threading
 import psycopg2
-from psycopg2 import sql
-import json
-
-# Global variables
-time_data = []
-ppg_data = []  # PhotoPlethysmoGram data (AC signal)
-ir_data = []   # Threshold values
-beat_markers = []  # Beat detection markers
-heart_rate_data = []  # Heart rate values
-collecting = False
-start_time = None
+import os
+from collections import deque
+
+# Semua pemrosesan ada di engine headless; modul ini hanya klien GUI Tk.
+# Nama engine (fungsi, konstanta dan state yang di-rebind seperti collecting,
+# is_settling, active_source) selalu diakses lewat engine.<nama>.
+import hr_engine as engine
+
+# Global variables (GUI); state pemrosesan ada di hr_engine
 update_needed = False
 selected_subject = ""  # Default subject
 patient_button = None
 
-# Serial connection
-ser = None
-serial_thread = None
-serial_running = False
-
-# Serial Configuration - EDIT DI SINI!
-DEFAULT_PORT = "COM3"  # ← GANTI SESUAI PORT KAMU
-DEFAULT_BAUDRATE = 115200
-
-# PostgreSQL Configuration - EDIT DI SINI!
-DB_CONFIG = {
-    "host": "localhost",
-    "port": 5432,
-    "database": "heart_rate_db",
-    "user": "postgres",
-    "password": "marcellganteng"
-}
-
-# Database connection
-db_conn = None
-
-# Heart rate detection parameters
-min_peak_height = 80  # Minimum peak height for AC signal
-min_peak_distance = 15  # Minimum distance between peaks (data points) ~0.4s at 50Hz
-max_heart_rate = 200  # Maximum realistic heart rate (BPM)
-min_heart_rate = 40   # Minimum realistic heart rate (BPM)
-
-# Settling detection - ESP32 butuh 4 detik settling
-SETTLING_DURATION = 4.0  # detik
-is_settling = False
-settling_start_time = None
-
 # GUI components
 root = None
 fig = None
@@ -67,6 +30,7 @@ status_label = None
 data_count_label = None
 latest_data_label = None
 data_tree = None
+table_range_label = None
 analysis_text = None
 port_label = None
 db_status_label = None
@@ -77,155 +41,51 @@ db_status_label = None
 latest_analysis_text = ""
 latest_analysis_data = {}
 
-# ============= SISTEM BUFFERING & AGREGASI DATA =============
-# Konfigurasi buffering
-BUFFER_SIZE = 50  # Buffer 50 data points sebelum agregasi (~1 detik @ 50Hz)
-DOWNSAMPLE_RATE = 10  # Ambil 1 dari setiap 10 data untuk raw data
-
-# Data buffer untuk agregasi
-data_buffer = {
-    'time': [],
-    'ac': [],
-    'threshold': [],
-    'beat': []
-}
-
-# Data teragregasi (lebih ringkas untuk save)
-aggregated_data = []  # Format: [{time_avg, ac_avg, ac_min, ac_max, threshold_avg, beat_count, duration}]
-raw_downsampled = []  # Raw data yang di-downsample
-
-def aggregate_buffer():
-    """Agregasi data dari buffer menjadi summary per interval"""
-    global data_buffer, aggregated_data, raw_downsampled
-    
-    if len(data_buffer['time']) == 0:
-        return
-    
-    # Hitung statistik agregat
-    time_start = data_buffer['time'][0]
-    time_end = data_buffer['time'][-1]
-    time_avg = np.mean(data_buffer['time'])
-    
-    ac_avg = np.mean(data_buffer['ac'])
-    ac_min = np.min(data_buffer['ac'])
-    ac_max = np.max(data_buffer['ac'])
-    ac_std = np.std(data_buffer['ac'])
-    
-    threshold_avg = np.mean(data_buffer['threshold'])
-    
-    # Hitung jumlah beat dalam interval ini
-    beat_count = sum(1 for b in data_buffer['beat'] if b > 0)
-    
-    duration = time_end - time_start
-    
-    # Simpan data agregat
-    aggregated_data.append({
-        'time_start': time_start,
-        'time_end': time_end,
-        'time_avg': time_avg,
-        'duration': duration,
-        'ac_avg': ac_avg,
-        'ac_min': ac_min,
-        'ac_max': ac_max,
-        'ac_std': ac_std,
-        'threshold_avg': threshold_avg,
-        'beat_count': beat_count,
-        'sample_count': len(data_buffer['time'])
-    })
-    
-    # Simpan beberapa raw data (downsampled) untuk referensi
-    for i in range(0, len(data_buffer['time']), DOWNSAMPLE_RATE):
-        if i < len(data_buffer['time']):
-            raw_downsampled.append({
-                'time': data_buffer['time'][i],
-                'ac': data_buffer['ac'][i],
-                'threshold': data_buffer['threshold'][i],
-                'beat': data_buffer['beat'][i]
-            })
-    
-    # Kosongkan buffer
-    data_buffer['time'].clear()
-    data_buffer['ac'].clear()
-    data_buffer['threshold'].clear()
-    data_buffer['beat'].clear()
-
-def add_to_buffer(timestamp, ac, threshold, beat):
-    """Tambahkan data ke buffer dan agregasi jika sudah penuh"""
-    global data_buffer
-    
-    data_buffer['time'].append(timestamp)
-    data_buffer['ac'].append(ac)
-    data_buffer['threshold'].append(threshold)
-    data_buffer['beat'].append(beat)
-    
-    # Jika buffer sudah penuh, lakukan agregasi
-    if len(data_buffer['time']) >= BUFFER_SIZE:
-        aggregate_buffer()
-
-# ===================== DATABASE FUNCTIONS =====================
-
 def connect_database():
-    """Connect to PostgreSQL database"""
-    global db_conn, DB_CONFIG
+    """Connect to PostgreSQL database (di thread writer, GUI tidak menunggu)"""
+    db_status_label.config(text="Database: Menghubungkan...", fg="orange")
+    config = dict(engine.DB_CONFIG)
     
-    try:
-        # Close existing connection
-        if db_conn and not db_conn.closed:
-            db_conn.close()
-        
-        # Connect to database
-        db_conn = psycopg2.connect(**DB_CONFIG)
-        
-        # Test connection
-        cur = db_conn.cursor()
-        cur.execute("SELECT version();")
-        version = cur.fetchone()
-        cur.close()
-        
-        db_status_label.config(text=f"Database: Terhubung ({DB_CONFIG['database']})", fg="green")
-        
-        # Create tables if not exist
-        create_tables()
-        
+    def on_connected(version):
+        db_status_label.config(text=f"Database: Terhubung ({config['database']})", fg="green")
         messagebox.showinfo("Berhasil", 
                           f"Terhubung ke database PostgreSQL\n\n"
-                          f"Host: {DB_CONFIG['host']}\n"
-                          f"Database: {DB_CONFIG['database']}\n"
-                          f"User: {DB_CONFIG['user']}\n\n"
+                          f"Host: {config['host']}\n"
+                          f"Database: {config['database']}\n"
+                          f"User: {config['user']}\n\n"
                           f"Versi: {version[0][:50]}...")
-        
-        print(f"✅ Connected to PostgreSQL: {DB_CONFIG['database']}")
-        return True
-        
-    except psycopg2.Error as e:
+        print(f"✅ Connected to PostgreSQL: {config['database']} (pool {engine.DB_POOL_MIN}-{engine.DB_POOL_MAX})")
+    
+    def on_failed(e):
         db_status_label.config(text="Database: Gagal Terhubung", fg="red")
         messagebox.showerror("Error Database", 
                            f"Gagal terhubung ke PostgreSQL:\n\n{str(e)}\n\n"
                            f"Pastikan:\n"
                            f"1. PostgreSQL sudah berjalan\n"
-                           f"2. Database '{DB_CONFIG['database']}' sudah dibuat\n"
+                           f"2. Database '{config['database']}' sudah dibuat\n"
                            f"3. Username dan password benar\n"
                            f"4. Host dan port sesuai")
         print(f"❌ Database connection failed: {e}")
-        return False
+    
+    engine.db_writer.connect(config, engine.setup_database, on_success=on_connected, on_error=on_failed)
 
 def disconnect_database():
     """Disconnect from PostgreSQL database"""
-    global db_conn
+    if not engine.db_writer.connected:
+        return
     
-    try:
-        if db_conn and not db_conn.closed:
-            db_conn.close()
-            db_status_label.config(text="Database: Terputus", fg="orange")
-            messagebox.showinfo("Info", "Koneksi database terputus")
-            print("🔌 Database disconnected")
-    except Exception as e:
+    def on_disconnected(_):
+        db_status_label.config(text="Database: Terputus", fg="orange")
+        messagebox.showinfo("Info", "Koneksi database terputus")
+        print("🔌 Database disconnected")
+    
+    def on_failed(e):
         messagebox.showerror("Error", f"Gagal memutus koneksi database:\n{str(e)}")
+    
+    engine.db_writer.disconnect(on_success=on_disconnected, on_error=on_failed)
 
 def configure_database():
     """Configure database connection settings"""
-    global DB_CONFIG
-    
     dialog = tk.Toplevel(root)
     dialog.title("Konfigurasi Database PostgreSQL")
     dialog.geometry("450x400")
@@ -241,43 +101,42 @@ def configure_database():
     
     # Host
     tk.Label(frame, text="Host:", font=("Arial", 10)).pack(anchor='w')
-    host_var = tk.StringVar(value=DB_CONFIG['host'])
+    host_var = tk.StringVar(value=engine.DB_CONFIG['host'])
     host_entry = tk.Entry(frame, textvariable=host_var, font=("Arial", 10), width=40)
     host_entry.pack(pady=(0, 10))
     
     # Port
     tk.Label(frame, text="Port:", font=("Arial", 10)).pack(anchor='w')
-    port_var = tk.StringVar(value=str(DB_CONFIG['port']))
+    port_var = tk.StringVar(value=str(engine.DB_CONFIG['port']))
     port_entry = tk.Entry(frame, textvariable=port_var, font=("Arial", 10), width=40)
     port_entry.pack(pady=(0, 10))
     
     # Database
     tk.Label(frame, text="Database:", font=("Arial", 10)).pack(anchor='w')
-    database_var = tk.StringVar(value=DB_CONFIG['database'])
+    database_var = tk.StringVar(value=engine.DB_CONFIG['database'])
     database_entry = tk.Entry(frame, textvariable=database_var, font=("Arial", 10), width=40)
     database_entry.pack(pady=(0, 10))
     
     # User
     tk.Label(frame, text="User:", font=("Arial", 10)).pack(anchor='w')
-    user_var = tk.StringVar(value=DB_CONFIG['user'])
+    user_var = tk.StringVar(value=engine.DB_CONFIG['user'])
     user_entry = tk.Entry(frame, textvariable=user_var, font=("Arial", 10), width=40)
     user_entry.pack(pady=(0, 10))
     
     # Password
     tk.Label(frame, text="Password:", font=("Arial", 10)).pack(anchor='w')
-    password_var = tk.StringVar(value=DB_CONFIG['password'])
+    password_var = tk.StringVar(value=engine.DB_CONFIG['password'])
     password_entry = tk.Entry(frame, textvariable=password_var, font=("Arial", 10), 
                              width=40, show="*")
     password_entry.pack(pady=(0, 20))
     
     def apply_config():
-        global DB_CONFIG
         try:
-            DB_CONFIG['host'] = host_var.get()
-            DB_CONFIG['port'] = int(port_var.get())
-            DB_CONFIG['database'] = database_var.get()
-            DB_CONFIG['user'] = user_var.get()
-            DB_CONFIG['password'] = password_var.get()
+            engine.DB_CONFIG['host'] = host_var.get()
+            engine.DB_CONFIG['port'] = int(port_var.get())
+            engine.DB_CONFIG['database'] = database_var.get()
+            engine.DB_CONFIG['user'] = user_var.get()
+            engine.DB_CONFIG['password'] = password_var.get()
             
             messagebox.showinfo("Berhasil", "Konfigurasi database disimpan!\n\nKlik 'Hubungkan Database' untuk menerapkan.")
             dialog.destroy()
@@ -316,92 +175,24 @@ def configure_database():
     tk.Button(button_frame, text="Batal", command=dialog.destroy, 
              bg="lightcoral", width=12, font=("Arial", 10)).pack(side=tk.LEFT)
 
-def create_tables():
-    """Create database tables - SIMPLIFIED (no raw data tables!)"""
-    global db_conn
-    
-    if not db_conn or db_conn.closed:
-        print("⚠️ Database not connected")
-        return False
-    
-    try:
-        cur = db_conn.cursor()
-        
-        # Table for measurements (metadata pengukuran)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS measurements (
-                id SERIAL PRIMARY KEY,
-                subject_name VARCHAR(100) NOT NULL,
-                measurement_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                duration_seconds FLOAT,
-                total_data_points INTEGER,
-                sampling_rate FLOAT,
-                notes TEXT
-            )
-        """)
-        
-        # Table for analysis results (HANYA HASIL AKHIR!)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS analysis_results (
-                id SERIAL PRIMARY KEY,
-                measurement_id INTEGER REFERENCES measurements(id) ON DELETE CASCADE,
-                subject_name VARCHAR(100) NOT NULL,
-                avg_heart_rate FLOAT,
-                min_heart_rate FLOAT,
-                max_heart_rate FLOAT,
-                std_heart_rate FLOAT,
-                beats_detected INTEGER,
-                valid_beats INTEGER,
-                hrv_rmssd FLOAT,
-                hrv_sdnn FLOAT,
-                avg_rr_interval FLOAT,
-                classification VARCHAR(100),
-                condition VARCHAR(100),
-                analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                full_analysis_text TEXT
-            )
-        """)
-        
-        # Create index for better performance
-        cur.execute("""
-            CREATE INDEX IF NOT EXISTS idx_analysis_measurement 
-            ON analysis_results(measurement_id)
-        """)
-        
-        cur.execute("""
-            CREATE INDEX IF NOT EXISTS idx_measurements_date 
-            ON measurements(measurement_date DESC)
-        """)
-        
-        db_conn.commit()
-        cur.close()
-        
-        print("✅ Database tables created/verified (ANALYSIS ONLY - NO RAW DATA)")
-        return True
-        
-    except psycopg2.Error as e:
-        db_conn.rollback()
-        print(f"❌ Error creating tables: {e}")
-        messagebox.showerror("Error", f"Gagal membuat tabel database:\n{str(e)}")
-        return False
-
 def save_to_database():
-    """Save HANYA HASIL ANALISIS ke database - NO RAW DATA!"""
-    global db_conn, latest_analysis_data
+    """Save HANYA HASIL ANALISIS ke database - NO RAW DATA! (lewat thread writer)"""
+    global latest_analysis_data
     
-    if not db_conn or db_conn.closed:
+    if not engine.db_writer.connected:
         messagebox.showwarning("Peringatan", 
                              "Tidak terhubung ke database!\n\n"
                              "Klik 'Hubungkan Database' terlebih dahulu.")
         return
     
-    if not time_data or not ppg_data:
+    if engine.sample_store.total_count == 0:
         messagebox.showwarning("Peringatan", "Tidak ada data untuk disimpan!")
         return
     
     # Agregasi sisa buffer (untuk perhitungan, tapi tidak disimpan)
-    if len(data_buffer['time']) > 0:
-        aggregate_buffer()
+    with engine.dsp_lock:
+        if len(engine.data_buffer) > 0:
+            engine.aggregate_buffer()
     
     if not latest_analysis_data:
         response = messagebox.askyesno("Konfirmasi", 
@@ -414,156 +205,139 @@ def save_to_database():
         else:
             return
     
-    try:
-        cur = db_conn.cursor()
-        
-        # 1. Insert measurement record (metadata saja)
-        cur.execute("""
-            INSERT INTO measurements 
-            (subject_name, duration_seconds, total_data_points, sampling_rate, notes)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id
-        """, (
-            selected_subject,
-            max(time_data) if time_data else 0,
-            len(ppg_data),
-            50.0,
-            f"Pengukuran detak jantung - HASIL ANALISIS ONLY (no raw data)"
-        ))
-        
-        measurement_id = cur.fetchone()[0]
-        
-        # 2. Insert HANYA analysis results (NO RAW DATA!)
-        cur.execute("""
-            INSERT INTO analysis_results 
-            (measurement_id, subject_name, avg_heart_rate, min_heart_rate, 
-             max_heart_rate, std_heart_rate, beats_detected, valid_beats,
-             hrv_rmssd, hrv_sdnn, avg_rr_interval, classification, 
-             condition, full_analysis_text)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            measurement_id,
-            selected_subject,
-            latest_analysis_data.get('avg_hr', 0),
-            latest_analysis_data.get('min_hr', 0),
-            latest_analysis_data.get('max_hr', 0),
-            latest_analysis_data.get('std_hr', 0),
-            latest_analysis_data.get('beats_detected', 0),
-            latest_analysis_data.get('valid_beats', 0),
-            latest_analysis_data.get('rmssd', 0),
-            latest_analysis_data.get('sdnn', 0),
-            latest_analysis_data.get('avg_rr', 0),
-            latest_analysis_data.get('classification', ''),
-            latest_analysis_data.get('condition', ''),
-            latest_analysis_text
-        ))
-        
-        db_conn.commit()
-        cur.close()
-        
+    # Sesi yang di-stream sudah punya baris measurements: baris itu dilengkapi
+    engine.timeseries_streamer.flush(force=True)
+    streamed_id = engine.timeseries_streamer.measurement_id
+    
+    # Nilai diambil di thread GUI; job writer hanya memakai salinan ini
+    subject = selected_subject
+    duration = engine.sample_store.last_time()
+    measurement = (
+        subject,
+        duration,
+        engine.sample_store.total_count,
+        engine.sample_clock.measured_rate,
+        f"Pengukuran detak jantung - HASIL ANALISIS ONLY (no raw data)"
+    )
+    analysis = dict(latest_analysis_data)
+    analysis_text_snapshot = latest_analysis_text
+    
+    def insert_analysis(conn):
+        return engine.store_analysis(conn, measurement, analysis, analysis_text_snapshot, streamed_id)
+    
+    def on_saved(measurement_id):
+        db_status_label.config(text=f"Database: Terhubung ({engine.DB_CONFIG['database']})", fg="green")
         messagebox.showinfo("Berhasil", 
                           f"✅ Hasil analisis berhasil disimpan ke database!\n\n"
                           f"Measurement ID: {measurement_id}\n"
-                          f"Subjek: {selected_subject}\n"
+                          f"Subjek: {subject}\n"
                           f"─────────────────────────\n"
-                          f"Durasi: {max(time_data):.2f} detik\n"
-                          f"Detak terdeteksi: {latest_analysis_data.get('beats_detected', 0)}\n"
-                          f"HR rata-rata: {latest_analysis_data.get('avg_hr', 0):.1f} BPM\n"
-                          f"Klasifikasi: {latest_analysis_data.get('classification', '')}\n"
-                          f"HRV (RMSSD): {latest_analysis_data.get('rmssd', 0):.1f} ms\n\n"
+                          f"Durasi: {duration:.2f} detik\n"
+                          f"Detak terdeteksi: {analysis.get('beats_detected', 0)}\n"
+                          f"HR rata-rata: {analysis.get('avg_hr', 0):.1f} BPM\n"
+                          f"Klasifikasi: {analysis.get('classification', '')}\n"
+                          f"HRV (RMSSD): {analysis.get('rmssd', 0):.1f} ms\n\n"
                           f"📌 CATATAN:\n"
-                          f"Hanya hasil analisis yang disimpan.\n"
-                          f"Raw data TIDAK disimpan ke database.")
+                          + (f"Time-series sesi ini sudah di-stream ke database.\n"
+                             f"Hasil analisis ditautkan ke measurement yang sama."
+                             if streamed_id is not None else
+                             f"Hanya hasil analisis yang disimpan.\n"
+                             f"Raw data TIDAK disimpan ke database."))
         
         print(f"✅ Analysis saved to database (ID: {measurement_id})")
         print(f"   📊 HASIL ANALISIS ONLY - No raw data spam!")
-        
-    except psycopg2.Error as e:
-        db_conn.rollback()
+    
+    def on_failed(e):
+        db_status_label.config(text="Database: Gagal Menyimpan", fg="red")
         messagebox.showerror("Error", f"Gagal menyimpan ke database:\n\n{str(e)}")
         print(f"❌ Database save error: {e}")
+    
+    db_status_label.config(text="Database: Menyimpan...", fg="orange")
+    engine.db_writer.submit(insert_analysis, on_success=on_saved, on_error=on_failed, description="simpan analisis")
 
 def view_database_records():
-    """View saved records from database"""
-    global db_conn
-    
-    if not db_conn or db_conn.closed:
+    """Browser riwayat: filter subjek/tanggal, paging keyset, detail dimuat saat dibuka"""
+    if not engine.db_writer.connected:
         messagebox.showwarning("Peringatan", "Tidak terhubung ke database!")
         return
     
-    try:
-        cur = db_conn.cursor()
-        
-        # Get recent measurements with analysis
-        cur.execute("""
-            SELECT 
-                m.id,
-                m.subject_name,
-                m.measurement_date,
-                m.duration_seconds,
-                m.total_data_points,
-                a.avg_heart_rate,
-                a.beats_detected,
-                a.classification,
-                a.condition
-            FROM measurements m
-            LEFT JOIN analysis_results a ON m.id = a.measurement_id
-            ORDER BY m.measurement_date DESC
-            LIMIT 50
-        """)
-        
-        records = cur.fetchall()
-        cur.close()
-        
-        if not records:
-            messagebox.showinfo("Info", "Belum ada data tersimpan di database")
+    # Create dialog to show records
+    dialog = tk.Toplevel(root)
+    dialog.title("Hasil Analisis Tersimpan di Database")
+    dialog.geometry("1300x600")
+    dialog.transient(root)
+    
+    # Filter (diproses di server, memakai indeks subject_name + measurement_date)
+    filter_frame = tk.Frame(dialog)
+    filter_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+    
+    tk.Label(filter_frame, text="Subjek:", font=("Arial", 10)).pack(side=tk.LEFT)
+    subject_var = tk.StringVar()
+    tk.Entry(filter_frame, textvariable=subject_var, font=("Arial", 10), width=20).pack(side=tk.LEFT, padx=(2, 10))
+    tk.Label(filter_frame, text="Dari (YYYY-MM-DD):", font=("Arial", 10)).pack(side=tk.LEFT)
+    from_var = tk.StringVar()
+    tk.Entry(filter_frame, textvariable=from_var, font=("Arial", 10), width=12).pack(side=tk.LEFT, padx=(2, 10))
+    tk.Label(filter_frame, text="Sampai:", font=("Arial", 10)).pack(side=tk.LEFT)
+    to_var = tk.StringVar()
+    tk.Entry(filter_frame, textvariable=to_var, font=("Arial", 10), width=12).pack(side=tk.LEFT, padx=(2, 10))
+    
+    frame = tk.Frame(dialog)
+    frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+    
+    # Create treeview
+    columns = ('ID', 'Subjek', 'Tanggal', 'Durasi', 'Data Points', 'HR Avg', 'Beats', 'Klasifikasi', 'Kondisi')
+    tree = ttk.Treeview(frame, columns=columns, show='headings', height=20)
+    
+    tree.heading('ID', text='ID')
+    tree.heading('Subjek', text='Subjek')
+    tree.heading('Tanggal', text='Tanggal & Waktu')
+    tree.heading('Durasi', text='Durasi (s)')
+    tree.heading('Data Points', text='Data Points')
+    tree.heading('HR Avg', text='HR Avg (BPM)')
+    tree.heading('Beats', text='Beats')
+    tree.heading('Klasifikasi', text='Klasifikasi')
+    tree.heading('Kondisi', text='Kondisi')
+    
+    tree.column('ID', width=50)
+    tree.column('Subjek', width=100)
+    tree.column('Tanggal', width=180)
+    tree.column('Durasi', width=80)
+    tree.column('Data Points', width=100)
+    tree.column('HR Avg', width=100)
+    tree.column('Beats', width=80)
+    tree.column('Klasifikasi', width=150)
+    tree.column('Kondisi', width=120)
+    
+    scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    
+    scrollbar.pack(side="right", fill="y")
+    tree.pack(side="left", fill="both", expand=True)
+    
+    button_frame = tk.Frame(dialog)
+    button_frame.pack(fill=tk.X, padx=10, pady=10)
+    
+    page_label = tk.Label(button_frame, text="Memuat...", font=("Arial", 10))
+    page_label.pack(side=tk.LEFT)
+    
+    # State paging: kursor awal tiap halaman yang sudah dilihat (untuk tombol kembali)
+    state = {'filters': {}, 'cursors': [None], 'rows': [], 'analysis_ids': {}}
+    
+    def load_page(after):
+        page_label.config(text="Memuat...")
+        engine.db_writer.submit(lambda conn: engine.fetch_history_page(conn, after=after, **state['filters']),
+                         on_success=show_page, on_error=on_failed, description="baca riwayat")
+    
+    def show_page(records):
+        if not dialog.winfo_exists():
             return
-        
-        # Create dialog to show records
-        dialog = tk.Toplevel(root)
-        dialog.title("Hasil Analisis Tersimpan di Database")
-        dialog.geometry("1300x600")
-        dialog.transient(root)
-        
-        frame = tk.Frame(dialog)
-        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        tk.Label(frame, text="50 Hasil Analisis Terakhir (HASIL AKHIR ONLY - No Raw Data)", 
-                font=("Arial", 12, "bold")).pack(pady=(0, 10))
-        
-        # Create treeview
-        columns = ('ID', 'Subjek', 'Tanggal', 'Durasi', 'Data Points', 'HR Avg', 'Beats', 'Klasifikasi', 'Kondisi')
-        tree = ttk.Treeview(frame, columns=columns, show='headings', height=20)
-        
-        tree.heading('ID', text='ID')
-        tree.heading('Subjek', text='Subjek')
-        tree.heading('Tanggal', text='Tanggal & Waktu')
-        tree.heading('Durasi', text='Durasi (s)')
-        tree.heading('Data Points', text='Data Points')
-        tree.heading('HR Avg', text='HR Avg (BPM)')
-        tree.heading('Beats', text='Beats')
-        tree.heading('Klasifikasi', text='Klasifikasi')
-        tree.heading('Kondisi', text='Kondisi')
-        
-        tree.column('ID', width=50)
-        tree.column('Subjek', width=100)
-        tree.column('Tanggal', width=180)
-        tree.column('Durasi', width=80)
-        tree.column('Data Points', width=100)
-        tree.column('HR Avg', width=100)
-        tree.column('Beats', width=80)
-        tree.column('Klasifikasi', width=150)
-        tree.column('Kondisi', width=120)
-        
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
-        
-        scrollbar.pack(side="right", fill="y")
-        tree.pack(side="left", fill="both", expand=True)
+        tree.delete(*tree.get_children())
+        state['rows'] = records
+        state['analysis_ids'] = {}
         
         # Insert data
         for record in records:
-            tree.insert('', 'end', values=(
+            item = tree.insert('', 'end', values=(
                 record[0],  # ID
                 record[1],  # Subject
                 record[2].strftime('%Y-%m-%d %H:%M:%S') if record[2] else '-',
@@ -574,56 +348,127 @@ def view_database_records():
                 record[7] if record[7] else '-',
                 record[8] if record[8] else '-'
             ))
+            state['analysis_ids'][item] = record[9]
         
-        button_frame = tk.Frame(dialog)
-        button_frame.pack(fill=tk.X, padx=10, pady=10)
-        
-        tk.Label(button_frame, text=f"Total: {len(records)} hasil analisis | HASIL AKHIR ONLY (no raw data)", 
-                font=("Arial", 10)).pack(side=tk.LEFT)
-        
-        tk.Button(button_frame, text="Tutup", command=dialog.destroy, 
-                 bg="lightgray", width=10).pack(side=tk.RIGHT)
-        
-    except psycopg2.Error as e:
+        page = len(state['cursors'])
+        page_label.config(text=f"Halaman {page} | {len(records)} hasil analisis | Klik dua kali untuk detail")
+        prev_button.config(state=tk.NORMAL if page > 1 else tk.DISABLED)
+        next_button.config(state=tk.NORMAL if len(records) == engine.HISTORY_PAGE_SIZE else tk.DISABLED)
+    
+    def on_failed(e):
+        page_label.config(text="Gagal membaca database")
         messagebox.showerror("Error", f"Gagal membaca database:\n{str(e)}")
+    
+    def search():
+        try:
+            state['filters'] = {
+                'subject': subject_var.get().strip() or None,
+                'date_from': engine.parse_history_date(from_var.get()),
+                'date_to': engine.parse_history_date(to_var.get()),
+            }
+        except ValueError:
+            messagebox.showerror("Error", "Format tanggal harus YYYY-MM-DD")
+            return
+        state['cursors'] = [None]
+        load_page(None)
+    
+    def next_page():
+        if not state['rows']:
+            return
+        last = state['rows'][-1]
+        state['cursors'].append((last[2], last[0]))
+        load_page(state['cursors'][-1])
+    
+    def prev_page():
+        if len(state['cursors']) > 1:
+            state['cursors'].pop()
+            load_page(state['cursors'][-1])
+    
+    def open_detail(event):
+        item = tree.focus()
+        analysis_id = state['analysis_ids'].get(item)
+        if analysis_id is None:
+            messagebox.showinfo("Info", "Pengukuran ini belum memiliki hasil analisis")
+            return
+        
+        def show_detail(text):
+            detail = tk.Toplevel(dialog)
+            detail.title(f"Detail Analisis #{analysis_id}")
+            detail.geometry("700x600")
+            detail_text = tk.Text(detail, font=("Courier", 9), wrap=tk.WORD)
+            detail_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            detail_text.insert(1.0, text or "(teks analisis kosong)")
+            detail_text.config(state=tk.DISABLED)
+        
+        engine.db_writer.submit(lambda conn: engine.fetch_analysis_text(conn, analysis_id),
+                         on_success=show_detail, on_error=on_failed, description="baca detail analisis")
+    
+    tree.bind('<Double-1>', open_detail)
+    
+    tk.Button(filter_frame, text="Cari", command=search, bg="lightblue", width=10).pack(side=tk.LEFT)
+    tk.Button(button_frame, text="Tutup", command=dialog.destroy, 
+             bg="lightgray", width=10).pack(side=tk.RIGHT)
+    next_button = tk.Button(button_frame, text="Berikutnya ▶", command=next_page, width=12, state=tk.DISABLED)
+    next_button.pack(side=tk.RIGHT, padx=5)
+    prev_button = tk.Button(button_frame, text="◀ Sebelumnya", command=prev_page, width=12, state=tk.DISABLED)
+    prev_button.pack(side=tk.RIGHT, padx=5)
+    
+    search()
+
+def export_database():
+    """Ekspor semua hasil analisis tersimpan (CSV, atau Parquet jika pyarrow terpasang)"""
+    if not engine.db_writer.connected:
+        messagebox.showwarning("Peringatan", "Tidak terhubung ke database!")
+        return
+    
+    filetypes = [("File CSV", "*.csv")]
+    if engine.pyarrow is not None:
+        filetypes.append(("File Parquet", "*.parquet"))
+    file_path = filedialog.asksaveasfilename(
+        defaultextension=".csv",
+        filetypes=filetypes,
+        title="Ekspor Database",
+        initialfile=f"Export_HR_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    )
+    if not file_path:
+        return
+    
+    fmt = "parquet" if file_path.lower().endswith(".parquet") else "csv"
+    if fmt == "parquet" and engine.pyarrow is None:
+        messagebox.showerror("Error", "Ekspor Parquet membutuhkan pyarrow (pip install pyarrow)")
+        return
+    
+    def on_exported(rows):
+        db_status_label.config(text=f"Database: Terhubung ({engine.DB_CONFIG['database']})", fg="green")
+        messagebox.showinfo("Berhasil", f"✅ {rows} hasil analisis diekspor ke:\n{file_path}")
+        print(f"✅ Database export: {rows} rows -> {file_path}")
+    
+    def on_failed(e):
+        db_status_label.config(text="Database: Ekspor Gagal", fg="red")
+        messagebox.showerror("Error", f"Gagal mengekspor database:\n\n{str(e)}")
+    
+    db_status_label.config(text="Database: Mengekspor...", fg="orange")
+    engine.db_writer.run_detached(lambda conn: engine.export_analyses(conn, file_path, fmt),
+                           on_success=on_exported, on_error=on_failed, description="ekspor")
 
 # ===================== ORIGINAL FUNCTIONS (dengan modifikasi buffering) =====================
 
-def list_serial_ports():
-    """List all available serial ports"""
-    ports = serial.tools.list_ports.comports()
-    available_ports = []
-    for port in ports:
-        available_ports.append(port.device)
-    return available_ports
+def connect_source(source, park_current=False):
+    """Buka sumber lewat engine lalu perbarui label status
+    
+    Exception dari source.open() diteruskan ke pemanggil (pesan error di GUI).
+    """
+    engine.open_source(source, park_current)
+    status_label.config(text=f"Status: Terhubung ke {source.describe()}", fg="green")
+    port_label.config(text=f"Sumber: {source.describe()}")
 
 def connect_serial_auto():
     """Auto connect to default port"""
-    global ser, serial_running, serial_thread
-    
-    port = DEFAULT_PORT
-    baudrate = DEFAULT_BAUDRATE
+    port = engine.DEFAULT_PORT
+    baudrate = engine.DEFAULT_BAUDRATE
     
     try:
-        # Close existing connection
-        if ser and ser.is_open:
-            ser.close()
-            time.sleep(0.5)
-        
-        # Open new connection
-        ser = serial.Serial(port, baudrate, timeout=1)
-        time.sleep(2)  # Wait for Arduino to reset
-        
-        # Clear buffer
-        ser.reset_input_buffer()
-        
-        status_label.config(text=f"Status: Terhubung ke {port}", fg="green")
-        port_label.config(text=f"Port: {port} @ {baudrate} baud")
-        
-        # Start serial reading thread
-        serial_running = True
-        serial_thread = threading.Thread(target=read_serial_data, daemon=True)
-        serial_thread.start()
+        connect_source(engine.SerialSource(port, baudrate))
         
         print(f"✅ Auto-connected to {port} @ {baudrate} baud")
         messagebox.showinfo("Berhasil", f"Terhubung otomatis ke {port}\nBaudrate: {baudrate}\n\nSiap untuk pengukuran!")
@@ -633,13 +478,13 @@ def connect_serial_auto():
     except serial.SerialException as e:
         print(f"❌ Gagal terhubung ke {port}: {e}")
         status_label.config(text="Status: Koneksi Gagal", fg="red")
-        port_label.config(text="Port: Tidak Terhubung")
+        port_label.config(text="Sumber: Tidak Terhubung")
         messagebox.showerror("Error", f"Gagal terhubung ke {port}:\n{str(e)}\n\nPastikan:\n1. ESP32 terhubung ke {port}\n2. Arduino IDE Serial Monitor sudah ditutup\n3. Port tidak digunakan aplikasi lain")
         return False
 
 def select_serial_port():
     """Select serial port from available ports"""
-    ports = list_serial_ports()
+    ports = engine.list_serial_ports()
     
     if not ports:
         messagebox.showerror("Error", "Tidak ada port serial yang tersedia!\n\nPastikan ESP32 terhubung ke komputer.")
@@ -659,7 +504,7 @@ def select_serial_port():
              font=("Arial", 11, "bold")).pack(pady=(0, 10))
     
     # Set default to COM3 if available, otherwise first port
-    default_port = DEFAULT_PORT if DEFAULT_PORT in ports else ports[0]
+    default_port = engine.DEFAULT_PORT if engine.DEFAULT_PORT in ports else ports[0]
     port_var = tk.StringVar(value=default_port)
     
     port_dropdown = ttk.Combobox(frame, textvariable=port_var, 
@@ -676,7 +521,7 @@ def select_serial_port():
     ports_text.config(state=tk.DISABLED)
     
     tk.Label(frame, text="Baudrate:", font=("Arial", 10)).pack(pady=(10, 5))
-    baudrate_var = tk.StringVar(value=str(DEFAULT_BAUDRATE))
+    baudrate_var = tk.StringVar(value=str(engine.DEFAULT_BAUDRATE))
     baudrate_entry = tk.Entry(frame, textvariable=baudrate_var, 
                              font=("Arial", 10), width=15)
     baudrate_entry.pack(pady=(0, 20))
@@ -712,212 +557,166 @@ def select_serial_port():
 
 def connect_serial():
     """Connect to serial port (manual selection)"""
-    global ser, serial_running, serial_thread
-    
     port, baudrate = select_serial_port()
     
     if not port:
         return
     
     try:
-        # Close existing connection
-        if ser and ser.is_open:
-            ser.close()
-            time.sleep(0.5)
-        
-        # Open new connection
-        ser = serial.Serial(port, baudrate, timeout=1)
-        time.sleep(2)  # Wait for Arduino to reset
-        
-        # Clear buffer
-        ser.reset_input_buffer()
-        
-        status_label.config(text=f"Status: Terhubung ke {port}", fg="green")
-        port_label.config(text=f"Port: {port} @ {baudrate} baud")
-        
-        # Start serial reading thread
-        serial_running = True
-        serial_thread = threading.Thread(target=read_serial_data, daemon=True)
-        serial_thread.start()
-        
+        connect_source(engine.SerialSource(port, baudrate))
         messagebox.showinfo("Berhasil", f"Terhubung ke {port}\nBaudrate: {baudrate}")
         
     except serial.SerialException as e:
         messagebox.showerror("Error", f"Gagal terhubung ke {port}:\n{str(e)}")
         status_label.config(text="Status: Koneksi Gagal", fg="red")
-        port_label.config(text="Port: Tidak Terhubung")
+        port_label.config(text="Sumber: Tidak Terhubung")
+
+def connect_network():
+    """Connect ke ESP32 lewat jaringan (ws://host:port atau tcp://host:port)"""
+    uri = simpledialog.askstring("Sumber Jaringan",
+                                 "Alamat sumber (ws://host:port atau tcp://host:port):",
+                                 initialvalue=engine.NETWORK_DEFAULT_URI)
+    if not uri:
+        return
+    
+    try:
+        if uri.startswith("tcp://"):
+            host, _, port = uri[len("tcp://"):].rpartition(":")
+            source = engine.TcpSource(host, int(port))
+        else:
+            source = engine.WebSocketSource(uri)
+        connect_source(source)
+        messagebox.showinfo("Berhasil", f"Terhubung ke {uri}")
+    except (OSError, ValueError, RuntimeError) as e:
+        messagebox.showerror("Error", f"Gagal terhubung ke {uri}:\n{str(e)}")
+        status_label.config(text="Status: Koneksi Gagal", fg="red")
+        port_label.config(text="Sumber: Tidak Terhubung")
 
-def disconnect_serial():
-    """Disconnect from serial port"""
-    global ser, serial_running
+def connect_simulator():
+    """Jalankan generator PPG sintetis sebagai sumber data (tanpa hardware)"""
+    dialog = tk.Toplevel(root)
+    dialog.title("Simulator PPG")
+    dialog.geometry("380x420")
+    dialog.resizable(False, False)
+    dialog.transient(root)
+    dialog.grab_set()
+    
+    frame = tk.Frame(dialog)
+    frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
     
-    serial_running = False
+    tk.Label(frame, text="Parameter Sinyal Sintetis", 
+             font=("Arial", 12, "bold")).pack(pady=(0, 15))
     
-    if ser and ser.is_open:
+    variables = {}
+    for key, label in (('heart_rate', "Detak jantung (BPM):"),
+                       ('hrv_ms', "HRV, std RR (ms):"),
+                       ('noise', "Noise (std AC):"),
+                       ('motion_per_minute', "Artefak gerak (per menit):"),
+                       ('rate', "Sampling rate (Hz):")):
+        tk.Label(frame, text=label, font=("Arial", 10)).pack(anchor='w')
+        variables[key] = tk.StringVar(value=str(engine.SIMULATOR_DEFAULTS[key]))
+        tk.Entry(frame, textvariable=variables[key], font=("Arial", 10), width=30).pack(pady=(0, 8))
+    
+    def apply_simulator():
         try:
-            ser.close()
+            params = {key: float(var.get()) for key, var in variables.items()}
+            connect_source(engine.SyntheticPPGSource(**params))
+        except ValueError as e:
+            messagebox.showerror("Error", f"Parameter tidak valid:\n{str(e)}")
+            return
+        dialog.destroy()
+    
+    button_frame = tk.Frame(frame)
+    button_frame.pack(fill=tk.X, pady=(10, 0))
+    
+    tk.Button(button_frame, text="Mulai Simulator", command=apply_simulator, 
+             bg="lightgreen", width=14, font=("Arial", 10)).pack(side=tk.LEFT, padx=(0, 10))
+    tk.Button(button_frame, text="Batal", command=dialog.destroy, 
+             bg="lightcoral", width=10, font=("Arial", 10)).pack(side=tk.LEFT)
+
+def disconnect_source():
+    """Disconnect sumber data aktif"""
+    source = engine.active_source
+    if source is not None and source.is_open:
+        try:
+            engine.close_active_source()
             status_label.config(text="Status: Terputus", fg="orange")
-            port_label.config(text="Port: Tidak Terhubung")
-            messagebox.showinfo("Info", "Koneksi serial terputus")
+            port_label.config(text="Sumber: Tidak Terhubung")
+            messagebox.showinfo("Info", f"Koneksi {source.describe()} terputus")
         except Exception as e:
             messagebox.showerror("Error", f"Gagal memutus koneksi:\n{str(e)}")
 
-def read_serial_data():
-    """Read data from serial port - OPTIMIZED UNTUK ESP32 BARU!"""
-    global time_data, ppg_data, ir_data, beat_markers, heart_rate_data
-    global collecting, start_time, update_needed, ser
-    global is_settling, settling_start_time
+def poll_samples():
+    """Stage 3 (GUI thread): ambil blok dari engine lalu perbarui label (sekali per tick)"""
+    global update_needed
     
-    print("🔄 Serial reading thread started (ESP32 OPTIMIZED)")
+    blocks = engine.drain_sample_blocks()
+    if not blocks:
+        return 0
+    update_needed = True
     
-    while serial_running:
-        if not ser or not ser.is_open:
-            break
-            
-        try:
-            if ser.in_waiting > 0:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                
-                if not line or not collecting:
-                    continue
-                
-                # Parse data: "AC THRESHOLD BEAT_MARKER"
-                parts = line.split()
-                
-                if len(parts) >= 3:
-                    try:
-                        ac = int(parts[0])
-                        threshold = int(parts[1])
-                        beat_marker = int(parts[2])
-                        
-                        # Initialize start time
-                        if start_time is None:
-                            start_time = time.time()
-                            settling_start_time = start_time
-                            is_settling = True
-                            print("⏳ Settling period started (4 detik)...")
-                        
-                        current_time = time.time() - start_time
-                        
-                        # ===== CEK SETTLING PERIOD =====
-                        if is_settling and (current_time >= SETTLING_DURATION):
-                            is_settling = False
-                            print("✅ Settling done! Beat detection active.")
-                            root.after(0, lambda: status_label.config(
-                                text=f"Status: Ready - {selected_subject}", 
-                                fg="green"
-                            ))
-                        
-                        # Store data ke array asli (untuk plotting real-time)
-                        time_data.append(float(current_time))
-                        ppg_data.append(float(ac))
-                        ir_data.append(float(threshold))
-                        beat_markers.append(float(beat_marker))
-                        
-                        # ===== BUFFER HANYA DATA READY (setelah settling) =====
-                        if not is_settling:  # ← FILTER settling data!
-                            add_to_buffer(current_time, ac, threshold, beat_marker)
-                        
-                        # Calculate heart rate from ESP32 beat markers
-                        # HANYA PROSES BEAT SETELAH SETTLING!
-                        if beat_marker > 0 and not is_settling:  # ← TAMBAH check settling!
-                            # Find recent beats
-                            recent_beats = []
-                            for i in range(len(beat_markers) - 1, max(0, len(beat_markers) - 10), -1):
-                                if beat_markers[i] > 0:
-                                    recent_beats.append(time_data[i])
-                            
-                            # Calculate BPM from last 2 beats
-                            if len(recent_beats) >= 2:
-                                interval = recent_beats[0] - recent_beats[1]
-                                if interval > 0:
-                                    bpm = 60.0 / interval
-                                    if min_heart_rate <= bpm <= max_heart_rate:
-                                        heart_rate_data.append(bpm)
-                                        print(f"💓 Beat! BPM: {bpm:.1f} (ESP32)")
-                        
-                        update_needed = True
-                        
-                        # Update GUI labels
-                        if len(ppg_data) % 10 == 0:
-                            settling_status = "SETTLING..." if is_settling else "READY"
-                            root.after(0, lambda: data_count_label.config(
-                                text=f"Data: {len(ppg_data)} | Buffer: {len(data_buffer['time'])} | Agregat: {len(aggregated_data)} | {settling_status}"
-                            ))
-                            root.after(0, lambda: latest_data_label.config(
-                                text=f"AC: {ac}, Beat: {'YA' if beat_marker > 0 else 'TIDAK'}, Time: {current_time:.2f}s"
-                            ))
-                        
-                    except ValueError as e:
-                        print(f"⚠️ Parse error: {line} -> {e}")
-                        continue
-                
-        except Exception as e:
-            print(f"❌ Serial read error: {e}")
-            if not serial_running:
-                break
-            time.sleep(0.01)
+    if engine.consume_settling_done():
+        status_label.config(text=f"Status: Ready - {selected_subject}", fg="green")
+    
+    # Update GUI labels (sekali per tick, bukan per sampel)
+    last = blocks[-1][-1]
+    settling_status = "SETTLING..." if engine.is_settling else "READY"
+    drop_info = ""
+    if engine.raw_queue.dropped or engine.dropped_samples:
+        drop_info = f" | Drop: {engine.raw_queue.dropped} batch, {engine.dropped_samples} sampel"
+    if engine.frame_decoder.lost_frames or engine.frame_decoder.crc_errors:
+        drop_info += f" | Frame hilang: {engine.frame_decoder.lost_frames}, CRC error: {engine.frame_decoder.crc_errors}"
+    data_count_label.config(
+        text=f"Data: {engine.sample_store.total_count} | Buffer: {len(engine.data_buffer)} | Agregat: {len(engine.aggregated_data)} | {settling_status}{drop_info}"
+    )
+    latest_data_label.config(
+        text=f"AC: {last['ac']:.0f}, Beat: {'YA' if last['beat'] > 0 else 'TIDAK'}, Time: {last['time']:.2f}s"
+    )
+    return sum(len(block) for block in blocks)
+
+def finish_source():
+    """Hook engine saat sumber habis (mis. replay selesai): akhiri seperti biasa"""
+    if engine.collecting:
+        stop_collection()  # Agregasi sisa + analisis akhir
+    
+    # Replay ditutup; port serial yang ditahan selama replay dibaca lagi
+    source = engine.release_finished_source()
+    port_label.config(text=f"Sumber: {source.describe()}" if source is not None else "Sumber: Tidak Terhubung")
+
+def start_replay():
+    """Pilih rekaman lalu putar ulang lewat pipeline (tanpa hardware)"""
+    global update_needed
     
-    print("🛑 Serial reading thread stopped")
-
-def bandpass_filter(data, lowcut=0.5, highcut=5.0, fs=50, order=4):
-    """Apply bandpass filter to PPG signal (0.5-5 Hz for heart rate)"""
-    min_length = max(order * 6, 20)
-    if len(data) < min_length:
-        return data
+    if engine.collecting:
+        messagebox.showwarning("Peringatan", "Hentikan pengukuran terlebih dahulu!")
+        return
     
-    try:
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band', analog=False)
-        return filtfilt(b, a, data)
-    except ValueError as e:
-        print(f"Filter error: {e}")
-        return data
-
-def detect_heartbeats(ppg_data, time_data, min_height=None, min_distance=None):
-    """Detect heartbeat peaks from PPG signal"""
-    if len(ppg_data) < 50:
-        return [], [], []
-    
-    if min_height is None:
-        min_height = min_peak_height
-    if min_distance is None:
-        min_distance = min_peak_distance
+    path = filedialog.askopenfilename(
+        title="Pilih Rekaman (samples.npy di arsip sesi)",
+        initialdir=engine.ARCHIVE_DIR if os.path.isdir(engine.ARCHIVE_DIR) else None,
+        filetypes=[("Sampel NumPy", "*.npy")]
+    )
+    if not path:
+        return
+    speed = simpledialog.askfloat("Kecepatan Replay",
+                                  "Kecepatan (1 = waktu nyata, 10 = 10×, 0 = secepat mungkin):",
+                                  initialvalue=engine.REPLAY_SPEED, minvalue=0)
+    if speed is None:
+        return
     
     try:
-        # Apply bandpass filter
-        filtered_ppg = bandpass_filter(ppg_data)
-        
-        # Find peaks in PPG signal
-        peaks, properties = find_peaks(filtered_ppg, 
-                                     height=min_height,
-                                     distance=min_distance,
-                                     prominence=10)
-        
-        peak_times = [time_data[p] for p in peaks if p < len(time_data)]
-        peak_values = [filtered_ppg[p] for p in peaks if p < len(filtered_ppg)]
-        
-        # Calculate heart rate from peak intervals
-        heart_rates = []
-        if len(peak_times) >= 2:
-            for i in range(1, len(peak_times)):
-                interval = peak_times[i] - peak_times[i-1]  # seconds
-                if interval > 0:
-                    bpm = 60.0 / interval
-                    # Validate heart rate
-                    if min_heart_rate <= bpm <= max_heart_rate:
-                        heart_rates.append(bpm)
-                    else:
-                        heart_rates.append(None)
-        
-        print(f"Detected {len(peaks)} heartbeats, valid HR: {len([h for h in heart_rates if h is not None])}")
-        
-        return peak_times, peak_values, heart_rates
-    except Exception as e:
-        print(f"Heartbeat detection error: {e}")
-        return [], [], []
+        samples = engine.load_recorded_samples(path)
+        reset_data()
+        connect_source(engine.ReplaySource(samples, speed, name=os.path.basename(os.path.dirname(path))), park_current=True)
+        engine.start_session(selected_subject, record=False)
+    except (OSError, ValueError, engine.EngineError) as e:
+        messagebox.showerror("Error", f"Rekaman tidak bisa dibuka:\n{str(e)}")
+        return
+    update_needed = True
+    
+    source = engine.active_source
+    status_label.config(text=f"Status: {source.describe()}", fg="purple")
+    print(f"▶️ {source.describe()}: {len(samples)} sampel dari {path}")
 
 def set_subject():
     """Set subject dengan input manual (bukan dropdown)"""
@@ -986,161 +785,44 @@ def calculate_heart_rate_statistics():
     """Calculate heart rate statistics and variability"""
     global latest_analysis_text, latest_analysis_data
     
-    if len(ppg_data) < 100:
-        messagebox.showwarning("Peringatan", "Tidak cukup data untuk analisis\nMinimum diperlukan: 100 titik data (2 detik)")
-        return
-    
     try:
-        peak_times, peak_values, heart_rates = detect_heartbeats(ppg_data, time_data)
-        
-        valid_heart_rates = [hr for hr in heart_rates if hr is not None]
-        
-        if len(valid_heart_rates) < 2:
-            messagebox.showwarning("Peringatan", 
-                                 f"Perlu setidaknya 2 detak jantung untuk analisis\n"
-                                 f"Saat ini terdeteksi: {len(peak_times)} detak\n"
-                                 f"Valid HR: {len(valid_heart_rates)}\n"
-                                 f"Coba sesuaikan pengaturan deteksi")
-            return
-        
-        # Calculate statistics
-        avg_hr = np.mean(valid_heart_rates)
-        std_hr = np.std(valid_heart_rates)
-        min_hr = np.min(valid_heart_rates)
-        max_hr = np.max(valid_heart_rates)
-        
-        # Calculate RR intervals (time between heartbeats in ms)
-        rr_intervals = []
-        if len(peak_times) >= 2:
-            for i in range(1, len(peak_times)):
-                rr = (peak_times[i] - peak_times[i-1]) * 1000  # convert to ms
-                rr_intervals.append(rr)
-        
-        # Heart Rate Variability (HRV) metrics
-        if len(rr_intervals) >= 2:
-            rmssd = np.sqrt(np.mean(np.diff(rr_intervals)**2))  # Root Mean Square of Successive Differences
-            sdnn = np.std(rr_intervals)  # Standard Deviation of NN intervals
-        else:
-            rmssd = 0
-            sdnn = 0
-        
-        avg_rr = np.mean(rr_intervals) if rr_intervals else 0
-        
-        # Classify heart rate
-        if avg_hr < 60:
-            hr_classification = "Bradikardia (Lambat)"
-            condition = "Di bawah normal"
-        elif 60 <= avg_hr <= 100:
-            hr_classification = "Normal"
-            condition = "Sehat"
-        else:
-            hr_classification = "Takikardia (Cepat)"
-            condition = "Di atas normal"
-        
-        # Store analysis data for database
-        latest_analysis_data = {
-            'avg_hr': avg_hr,
-            'min_hr': min_hr,
-            'max_hr': max_hr,
-            'std_hr': std_hr,
-            'beats_detected': len(peak_times),
-            'valid_beats': len(valid_heart_rates),
-            'rmssd': rmssd,
-            'sdnn': sdnn,
-            'avg_rr': avg_rr,
-            'classification': hr_classification,
-            'condition': condition
-        }
-        
-        # Format comprehensive results
-        latest_analysis_text = f"""
-{'='*60}
-    ANALISIS DETAK JANTUNG - {selected_subject.upper()}
-{'='*60}
-
-INFORMASI PENGUKURAN:
-  • Subjek                       : {selected_subject}
-  • Durasi Pengukuran            : {max(time_data):.2f} detik
-  • Total Titik Data             : {len(ppg_data)}
-  • Data Agregat Tersimpan       : {len(aggregated_data)} records
-  • Sampling Rate                : ~50 Hz
-  • Efisiensi Penyimpanan        : {(1 - len(aggregated_data)/max(1, len(ppg_data)))*100:.1f}%
-
-{'─'*60}
-HASIL DETEKSI DETAK JANTUNG:
-  • Jumlah Detak Terdeteksi      : {len(peak_times)}
-  • Detak Valid                  : {len(valid_heart_rates)}
-  • Waktu Detak (s)              : {', '.join([f'{t:.2f}' for t in peak_times[:10]])}{'...' if len(peak_times) > 10 else ''}
-  • RR Intervals (ms)            : {', '.join([f'{rr:.0f}' for rr in rr_intervals[:10]])}{'...' if len(rr_intervals) > 10 else ''}
-
-{'─'*60}
-STATISTIK DETAK JANTUNG:
-  • Detak Jantung Rata-rata      : {avg_hr:.1f} BPM
-  • Detak Jantung Minimum        : {min_hr:.1f} BPM
-  • Detak Jantung Maksimum       : {max_hr:.1f} BPM
-  • Standar Deviasi              : {std_hr:.2f} BPM
-  • Rentang                      : {max_hr - min_hr:.1f} BPM
-
-{'─'*60}
-HEART RATE VARIABILITY (HRV):
-  • SDNN (Standar Deviasi RR)    : {sdnn:.2f} ms
-  • RMSSD (Root Mean Square)     : {rmssd:.2f} ms
-  • Rata-rata RR Interval        : {avg_rr:.1f} ms
-
-INTERPRETASI HRV:
-  • RMSSD Tinggi (>50ms)         : Sistem saraf parasimpatik aktif (relaks)
-  • RMSSD Rendah (<20ms)         : Stres atau kelelahan
-  • Anda                         : {rmssd:.1f} ms ({'Baik' if rmssd > 50 else 'Perhatian' if rmssd > 20 else 'Rendah'})
-
-{'─'*60}
-KLASIFIKASI DETAK JANTUNG:
-  • Kategori                     : {hr_classification}
-  • Kondisi                      : {condition}
-  • Status Kesehatan             : {'Normal' if 60 <= avg_hr <= 100 else 'Perlu Perhatian'}
-
-{'─'*60}
-DATA STORAGE INFO (BUFFERED):
-  • Total Data Asli              : {len(ppg_data)} points
-  • Data Agregat                 : {len(aggregated_data)} records
-  • Raw Downsampled              : {len(raw_downsampled)} samples
-  • Efisiensi                    : {(1 - len(aggregated_data)/max(1, len(ppg_data)))*100:.1f}% pengurangan spam!
-
-{'='*60}
-Analisis {selected_subject} selesai pada: {time.strftime('%Y-%m-%d %H:%M:%S')}
-Durasi: 0.00 - {max(time_data):.2f} detik
-{'='*60}
-"""
-        
-        update_analysis_display()
-        
-        messagebox.showinfo("Berhasil", 
-                          f"Analisis detak jantung {selected_subject} selesai!\n\n"
-                          f"Detak terdeteksi: {len(peak_times)}\n"
-                          f"Detak jantung rata-rata: {avg_hr:.1f} BPM\n"
-                          f"Kategori: {hr_classification}\n"
-                          f"HRV (RMSSD): {rmssd:.1f} ms\n"
-                          f"Durasi: {max(time_data):.2f} detik\n\n"
-                          f"📊 Data Buffering:\n"
-                          f"Asli: {len(ppg_data)} → Agregat: {len(aggregated_data)}\n"
-                          f"Efisiensi: {(1-len(aggregated_data)/max(1,len(ppg_data)))*100:.1f}% lebih ringkas!\n\n"
-                          f"Hasil lengkap di panel Analisis")
-        
+        result = engine.analyze_session()
+    except engine.EngineError as e:
+        messagebox.showwarning("Peringatan", str(e))
+        return
     except Exception as e:
         messagebox.showerror("Error", f"Error analisis:\n{str(e)}")
         print(f"Calculation error: {e}")
+        return
+    
+    # Store analysis data for database
+    latest_analysis_data = result.summary
+    latest_analysis_text = engine.format_analysis_report(result, selected_subject)
+    update_analysis_display(force=True)
+    
+    summary = result.summary
+    efficiency = (1 - result.aggregate_count / max(1, result.total_samples)) * 100
+    messagebox.showinfo("Berhasil", 
+                      f"Analisis detak jantung {selected_subject} selesai!\n\n"
+                      f"Detak terdeteksi: {summary['beats_detected']}\n"
+                      f"Detak jantung rata-rata: {summary['avg_hr']:.1f} BPM\n"
+                      f"Kategori: {summary['classification']}\n"
+                      f"HRV (RMSSD): {summary['rmssd']:.1f} ms\n"
+                      f"Durasi: {result.duration:.2f} detik\n\n"
+                      f"📊 Data Buffering:\n"
+                      f"Asli: {result.total_samples} → Agregat: {result.aggregate_count}\n"
+                      f"Efisiensi: {efficiency:.1f}% lebih ringkas!\n\n"
+                      f"Hasil lengkap di panel Analisis")
 
 def start_collection():
     """Start data collection"""
-    global collecting, start_time, update_needed, is_settling, settling_start_time
+    global update_needed
     
-    if not ser or not ser.is_open:
-        messagebox.showwarning("Peringatan", "Tidak terhubung ke port serial!\n\nKlik 'Hubungkan Serial' terlebih dahulu.")
+    try:
+        engine.start_session(selected_subject)
+    except engine.EngineError as e:
+        messagebox.showwarning("Peringatan", str(e))
         return
-    
-    collecting = True
-    start_time = time.time()
-    settling_start_time = start_time
-    is_settling = True  # ← Reset settling flag
     update_needed = True
     
     status_label.config(text="Status: Settling Period (4s) - Tunggu...", fg="orange")
@@ -1149,86 +831,128 @@ def start_collection():
 
 def stop_collection():
     """Stop data collection"""
-    global collecting, update_needed
-    collecting = False
-    update_needed = True
+    global update_needed
     
-    # Agregasi sisa buffer
-    if len(data_buffer['time']) > 0:
-        aggregate_buffer()
-        print(f"✅ Final buffer agregasi: {len(aggregated_data)} total records")
+    engine.stop_session()
+    update_needed = True
     
     status_label.config(text="Status: Berhenti", fg="red")
     print("⏸️ Pengumpulan data dihentikan")
     
-    if len(ppg_data) >= 100:
+    if engine.sample_store.total_count >= engine.MIN_ANALYSIS_SAMPLES:
         root.after(1000, calculate_heart_rate_statistics)
 
 def reset_data():
     """Reset all collected data"""
-    global time_data, ppg_data, ir_data, beat_markers, heart_rate_data, start_time, update_needed
-    global latest_analysis_text, latest_analysis_data
-    global data_buffer, aggregated_data, raw_downsampled
-    global is_settling, settling_start_time  # ← TAMBAH ini
-    
-    time_data.clear()
-    ppg_data.clear()
-    ir_data.clear()
-    beat_markers.clear()
-    heart_rate_data.clear()
-    start_time = None
-    settling_start_time = None  # ← RESET settling
-    is_settling = False  # ← RESET settling
+    global update_needed, latest_analysis_text, latest_analysis_data
+    
+    engine.reset_session()
+    decimation_cache.clear()
     update_needed = True
     latest_analysis_text = ""
     latest_analysis_data = {}
     
-    # Reset buffer data
-    data_buffer['time'].clear()
-    data_buffer['ac'].clear()
-    data_buffer['threshold'].clear()
-    data_buffer['beat'].clear()
-    aggregated_data.clear()
-    raw_downsampled.clear()
-    
     data_count_label.config(text="Data: 0 | Buffer: 0 | Agregat: 0")
     latest_data_label.config(text="Terbaru: -")
     status_label.config(text="Status: Data Direset", fg="blue")
     update_plot()
-    update_analysis_display()
+    update_analysis_display(force=True)
     print("🔄 Data direset (termasuk settling period)")
 
-def update_data_table():
-    """Update the data table"""
-    global data_tree
-    
-    try:
-        for item in data_tree.get_children():
-            data_tree.delete(item)
-        
-        if not time_data or not ppg_data:
+TABLE_VIEW_ROWS = 50  # Baris maksimum di Treeview (jendela virtual)
+
+class DataTableModel:
+    """Model tabel virtual: hanya baris baru yang di-insert, baris lama dibuang dari depan
+    
+    Mode live mengikuti sampel terbaru. Tombol paging berpindah ke mode riwayat
+    dan mengambil satu halaman dari sample_store sesuai kebutuhan.
+    """
+    
+    def __init__(self, view_rows=TABLE_VIEW_ROWS):
+        self.view_rows = view_rows
+        self.items = deque()  # Item id Treeview, urut indeks sampel
+        self.first = 0  # Indeks absolut baris pertama yang tampil
+        self.stop = 0  # Indeks absolut setelah baris terakhir
+        self.follow = True  # True = ikuti data live
+    
+    @staticmethod
+    def _format_rows(start, rows):
+        beats = np.where(rows['beat'] > 0, "YA", "TIDAK").tolist()
+        return [
+            (start + i + 1, f"{t:.2f}", f"{ppg:.0f}", f"{threshold:.0f}", beat)
+            for i, (t, ppg, threshold, beat) in enumerate(zip(
+                rows['time'].tolist(), rows['ac'].tolist(), rows['threshold'].tolist(), beats))
+        ]
+    
+    def clear(self):
+        if self.items:
+            data_tree.delete(*self.items)
+        self.items.clear()
+        self.first = self.stop = 0
+    
+    def _show(self, start, stop):
+        """Ganti isi tabel dengan satu halaman riwayat"""
+        self.clear()
+        start = max(start, engine.sample_store.first_index())
+        rows = engine.sample_store.rows(start, stop)
+        for values in self._format_rows(start, rows):
+            self.items.append(data_tree.insert('', 'end', values=values))
+        self.first, self.stop = start, start + len(rows)
+    
+    def sync(self):
+        """Mode live: append baris baru saja, evict dari depan"""
+        total = engine.sample_store.total_count
+        if total < self.stop:
+            self.clear()  # Store di-reset: kembali ke mode live
+            self.follow = True
+        if not self.follow or total == self.stop:
             return
         
-        start_idx = max(0, len(time_data) - 50)
+        start = max(self.stop, total - self.view_rows)
+        if start > self.stop:
+            self.clear()  # Celah lebih besar dari jendela: mulai dari start
+            self.first = start
         
-        for i in range(start_idx, len(time_data)):
-            if i < len(time_data) and i < len(ppg_data):
-                t = time_data[i]
-                ppg = ppg_data[i]
-                threshold = ir_data[i] if i < len(ir_data) else 0
-                beat = "YA" if (i < len(beat_markers) and beat_markers[i] > 0) else "TIDAK"
-                
-                data_tree.insert('', 'end', values=(
-                    i + 1,
-                    f"{float(t):.2f}",
-                    f"{float(ppg):.0f}",
-                    f"{float(threshold):.0f}",
-                    beat
-                ))
+        for values in self._format_rows(start, engine.sample_store.rows(start, total)):
+            self.items.append(data_tree.insert('', 'end', values=values))
+        self.stop = total
         
-        if data_tree.get_children():
-            data_tree.see(data_tree.get_children()[-1])
-            
+        excess = len(self.items) - self.view_rows
+        if excess > 0:
+            data_tree.delete(*[self.items.popleft() for _ in range(excess)])
+            self.first += excess
+        
+        if self.items:
+            data_tree.see(self.items[-1])
+    
+    def page_older(self):
+        self.follow = False
+        stop = max(self.first, engine.sample_store.first_index() + min(self.view_rows, engine.sample_store.total_count))
+        self._show(stop - self.view_rows, stop)
+    
+    def page_newer(self):
+        stop = self.stop + self.view_rows
+        if stop >= engine.sample_store.total_count:
+            self.follow_live()
+            return
+        self._show(stop - self.view_rows, stop)
+    
+    def follow_live(self):
+        self.follow = True
+        self.clear()
+        self.sync()
+
+table_model = DataTableModel()
+
+def update_data_table():
+    """Update the data table (incremental, lihat DataTableModel)"""
+    try:
+        table_model.sync()
+        if table_range_label is not None:
+            mode = "LIVE" if table_model.follow else "RIWAYAT"
+            table_range_label.config(
+                text=f"{mode}: #{table_model.first + 1}-{table_model.stop} dari {engine.sample_store.total_count}"
+            )
     except Exception as e:
         print(f"Error updating table: {e}")
 
@@ -1261,21 +985,50 @@ def save_analysis_to_file():
     except Exception as e:
         messagebox.showerror("Error", f"Gagal menyimpan:\n{str(e)}")
 
-def update_analysis_display():
-    """Update analysis display"""
-    global analysis_text, latest_analysis_text, is_settling
+# ============= PANEL ANALISIS LIVE =============
+ANALYSIS_REFRESH_HZ = 2.0  # Laju refresh panel analisis live (Hz)
+
+analysis_panel_state = {
+    'last_refresh': 0.0,
+    'lines': [],  # Baris yang sedang tampil di widget
+}
+
+def render_analysis_lines(lines):
+    """Tulis ke widget hanya baris yang berubah (full replace jika jumlah baris beda)"""
+    shown = analysis_panel_state['lines']
+    
+    analysis_text.config(state=tk.NORMAL)
+    if len(lines) != len(shown):
+        analysis_text.delete(1.0, tk.END)
+        analysis_text.insert(1.0, "\n".join(lines))
+    else:
+        for row, (old, line) in enumerate(zip(shown, lines), start=1):
+            if old != line:
+                analysis_text.delete(f"{row}.0", f"{row}.end")
+                analysis_text.insert(f"{row}.0", line)
+    analysis_text.config(state=tk.DISABLED)
+    
+    analysis_panel_state['lines'] = lines
+
+def update_analysis_display(force=False):
+    """Update analysis display (dibatasi ANALYSIS_REFRESH_HZ, kecuali force)"""
+    global analysis_text, latest_analysis_text
+    
+    now = time.monotonic()
+    if not force and now - analysis_panel_state['last_refresh'] < 1.0 / ANALYSIS_REFRESH_HZ:
+        return
+    analysis_panel_state['last_refresh'] = now
     
-    if len(ppg_data) < 2:
+    if engine.sample_store.total_count < 2:
         analysis_info = "Tidak ada data untuk analisis"
     else:
         if latest_analysis_text:
             analysis_info = latest_analysis_text
         else:
-            peak_times, peak_values, heart_rates = detect_heartbeats(ppg_data, time_data)
-            valid_hrs = [hr for hr in heart_rates if hr is not None]
+            ac, beats = engine.live_stats_snapshot()
             
             # ← TAMBAH status settling
-            settling_status = "⏳ SETTLING (tunggu 4s)" if is_settling else "✅ READY"
+            settling_status = "⏳ SETTLING (tunggu 4s)" if engine.is_settling else "✅ READY"
             
             analysis_info = f"""ANALISIS REAL-TIME - {selected_subject.upper()}
 {"="*30}
@@ -1284,148 +1037,227 @@ STATUS: {settling_status}  # ← TAMPILKAN SETTLING!
 SUBJEK: {selected_subject}
 
 STATISTIK DATA:
-- Jumlah Data Total: {len(ppg_data)}
-- Data Ready (post-settling): {len(aggregated_data) * BUFFER_SIZE}
-- Data Agregat: {len(aggregated_data)}
-- Buffer Aktif: {len(data_buffer['time'])}
-- Durasi: {max(time_data) if time_data else 0:.1f}s
-- AC Min: {min(ppg_data) if ppg_data else 0:.0f}
-- AC Max: {max(ppg_data) if ppg_data else 0:.0f}
-- AC Rata-rata: {np.mean(ppg_data) if ppg_data else 0:.0f}
+- Jumlah Data Total: {engine.sample_store.total_count}
+- Data Ready (post-settling): {len(engine.aggregated_data) * engine.BUFFER_SIZE}
+- Data Agregat: {len(engine.aggregated_data)}
+- Buffer Aktif: {len(engine.data_buffer)}
+- Durasi: {engine.sample_store.last_time():.1f}s
+- AC Min: {ac.min:.0f}
+- AC Max: {ac.max:.0f}
+- AC Rata-rata: {ac.mean:.0f}
+- AC Std: {engine.RunningStats.from_snapshot(ac).std:.1f}
 
 EFISIENSI BUFFERING:
-- Pengurangan: {(1 - len(aggregated_data)/max(1, len(ppg_data)))*100:.1f}%
-- Raw Downsampled: {len(raw_downsampled)}
+- Pengurangan: {(1 - len(engine.aggregated_data)/max(1, engine.sample_store.total_count))*100:.1f}%
+- Raw Downsampled: {len(engine.raw_downsampled)}
 
 DETEKSI DETAK (ESP32):
-- Detak Terdeteksi: {len(peak_times)}
-- HR Valid: {len(valid_hrs)}
-- HR Rata-rata: {np.mean(valid_hrs) if valid_hrs else 0:.1f} BPM
+- Detak Terdeteksi: {engine.peak_index.count}
+- HR Valid: {beats['valid_beats']}
+- HR Rata-rata: {beats['avg_hr']:.1f} BPM
+- RMSSD ({engine.HRV_WINDOW_BEATS} detak): {beats['rolling_rmssd']:.1f} ms
+- SDNN ({engine.HRV_WINDOW_BEATS} detak): {beats['rolling_sdnn']:.1f} ms
 - Threshold ESP32: 80
 
 PENGATURAN:
-- Buffer Size: {BUFFER_SIZE}
-- Downsample Rate: 1/{DOWNSAMPLE_RATE}
-- Settling: {'AKTIF' if is_settling else 'SELESAI'}
-- Status: {'Collecting' if collecting else 'Stopped'}
+- Buffer Size: {engine.BUFFER_SIZE}
+- Downsample Rate: 1/{engine.DOWNSAMPLE_RATE}
+- Settling: {'AKTIF' if engine.is_settling else 'SELESAI'}
+- Status: {'Collecting' if engine.collecting else 'Stopped'}
 
 CATATAN:
-{'⚠️ Data settling (4s pertama) tidak disimpan ke buffer!' if is_settling else '✅ Data ready untuk analisis!'}
+{'⚠️ Data settling (4s pertama) tidak disimpan ke buffer!' if engine.is_settling else '✅ Data ready untuk analisis!'}
 
 Klik "Analisis Detak Jantung" 
 untuk hasil lengkap
 """
     
-    analysis_text.config(state=tk.NORMAL)
-    analysis_text.delete(1.0, tk.END)
-    analysis_text.insert(1.0, analysis_info)
-    analysis_text.config(state=tk.DISABLED)
+    render_analysis_lines(analysis_info.split("\n"))
+
+# ============= DECIMASI TAMPILAN (MIN/MAX) =============
+DECIMATION_FACTOR = 2  # Titik per piksel lebar axes (min + max per bucket)
+
+decimation_cache = {}  # nama trace -> (kunci zoom, x, y)
+
+def decimate_minmax(x, y, n_out):
+    """Kurangi trace menjadi ~n_out titik: min dan max tiap bucket, urut waktu
+    
+    Puncak dan lembah tetap terlihat karena ekstrem tiap bucket selalu ikut.
+    """
+    n = len(y)
+    buckets = n_out // 2
+    if n <= n_out or buckets < 1:
+        return x, y
+    
+    size = -(-n // buckets)  # Ceil
+    full = n // size * size
+    blocks = y[:full].reshape(-1, size)
+    offsets = np.arange(0, full, size)
+    parts = [offsets + blocks.argmin(axis=1), offsets + blocks.argmax(axis=1)]
+    if full < n:
+        tail = y[full:]
+        parts.append(np.array([full + tail.argmin(), full + tail.argmax()]))
+    
+    idx = np.unique(np.concatenate(parts))  # Terurut, tanpa duplikat
+    return x[idx], y[idx]
+
+def decimate_for_axes(name, ax, x, y):
+    """Decimasi trace ke ~DECIMATION_FACTOR x lebar piksel axes, di-cache per zoom
+    
+    Kunci cache: rentang data, jumlah sampel total dan lebar piksel, sehingga
+    redraw tanpa data baru (refresh, resize balik, simpan PNG) tidak menghitung ulang.
+    """
+    if len(x) == 0:
+        return x, y
+    
+    n_out = max(2, int(ax.bbox.width) * DECIMATION_FACTOR)
+    key = (x[0], x[-1], len(x), engine.sample_store.total_count, n_out)
+    cached = decimation_cache.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1], cached[2]
+    
+    x_out, y_out = decimate_minmax(x, y, n_out)
+    decimation_cache[name] = (key, x_out, y_out)
+    return x_out, y_out
+
+# ============= PLOT CEPAT (BLIT) =============
+FAST_PLOT = True  # Mode cepat saat pengukuran: artist persisten + blitting
+LIVE_PLOT_WINDOW = 10.0  # Detik data yang ditampilkan di mode cepat
+
+live_artists = {}  # Line2D persisten mode cepat (kosong = perlu dibuat ulang)
+blit_state = {
+    'backgrounds': None,  # Background ax1/ax2 tanpa artist animasi
+    'xlim': None,
+    'ylim': None,
+    'titles': None,
+    'hr_count': -1,
+}
 
-def update_plot():
-    """Update matplotlib plots - FULL VERSION with SETTLING indicator"""
-    global is_settling
+def init_live_artists():
+    """Buat axes statis dan artist animasi mode cepat (sekali, bukan tiap tick)"""
+    ax1.clear()
+    ax2.clear()
+    live_artists.clear()
+    
+    live_artists['signal'], = ax1.plot([], [], 'r-', label="Sinyal AC (Filtered)", linewidth=1.5, animated=True)
+    live_artists['threshold'], = ax1.plot([], [], 'b--', label="Threshold (80)", linewidth=1, alpha=0.7, animated=True)
+    live_artists['esp32_beats'], = ax1.plot([], [], "go", label="Beat ESP32", markersize=8,
+                                           markeredgecolor='black', markeredgewidth=1, animated=True)
+    live_artists['python_peaks'], = ax1.plot([], [], "m^", label="Detak Python", markersize=6, alpha=0.7, animated=True)
+    live_artists['heart_rate'], = ax2.plot([], [], 'b-o', label="Detak Jantung", linewidth=2, markersize=4, animated=True)
+    
+    # Elemen statis: ikut tergambar di background
+    ax1.axvspan(0, engine.SETTLING_DURATION, alpha=0.2, color='yellow', label='Settling Zone')
+    live_artists['ready_line'] = ax1.axvline(x=engine.SETTLING_DURATION, color='green', linestyle=':', linewidth=2, label='Ready!')
+    ax2.axvspan(0, engine.SETTLING_DURATION, alpha=0.2, color='yellow')
+    ax2.axhline(y=60, color='g', linestyle='--', alpha=0.5, label='Normal Min (60)')
+    ax2.axhline(y=100, color='r', linestyle='--', alpha=0.5, label='Normal Max (100)')
+    
+    ax1.set_xlabel("Waktu (detik)", fontsize=10)
+    ax1.set_ylabel("Amplitudo AC", fontsize=10)
+    ax1.legend(loc='upper right', fontsize=8)
+    ax1.grid(True, alpha=0.3)
+    ax2.set_xlabel("Waktu (detik)", fontsize=10)
+    ax2.set_ylabel("Detak Jantung (BPM)", fontsize=10)
+    ax2.legend(loc='upper right', fontsize=8)
+    ax2.grid(True, alpha=0.3)
+    ax2.set_ylim(30, 120)
+    
+    blit_state.update(backgrounds=None, xlim=None, ylim=None, titles=None, hr_count=-1)
+
+def on_canvas_draw(event):
+    """Setelah full draw (termasuk resize): simpan background dan gambar artist animasi"""
+    if not live_artists:
+        blit_state['backgrounds'] = None
+        return
+    
+    blit_state['backgrounds'] = (canvas.copy_from_bbox(ax1.bbox), canvas.copy_from_bbox(ax2.bbox))
+    for name in ('signal', 'threshold', 'esp32_beats', 'python_peaks'):
+        ax1.draw_artist(live_artists[name])
+    ax2.draw_artist(live_artists['heart_rate'])
+
+def update_plot_fast():
+    """Update plot live via set_data + blit; full redraw hanya saat skala/judul berubah"""
+    if not live_artists:
+        init_live_artists()
+    
+    latest_time = engine.sample_store.last_time()
+    
+    # Jendela waktu bergeser per setengah halaman, agar background tetap valid di antaranya
+    xlim = blit_state['xlim']
+    if xlim is None or latest_time > xlim[1] or latest_time < xlim[0]:
+        start = max(0.0, latest_time - LIVE_PLOT_WINDOW / 2)
+        xlim = (start, start + LIVE_PLOT_WINDOW)
+    
+    # Hanya sampel dalam jendela (searchsorted atas view zero-copy)
+    samples = engine.sample_store.view()
+    first = np.searchsorted(samples['time'], xlim[0])
+    visible = samples[first:]
+    time_data = visible['time']
+    filtered_ppg = visible['filtered']
+    
+    # Trace kontinu didecimasi; marker beat/puncak tetap utuh
+    live_artists['signal'].set_data(*decimate_for_axes('signal', ax1, time_data, filtered_ppg))
+    live_artists['threshold'].set_data(*decimate_for_axes('threshold', ax1, time_data, visible['threshold']))
+    beat_idx = np.flatnonzero(visible['beat'])
+    live_artists['esp32_beats'].set_data(time_data[beat_idx], filtered_ppg[beat_idx])
+    
+    peak_times, peak_values, heart_rates = engine.peak_index.snapshot()
+    in_window = peak_times >= xlim[0]
+    live_artists['python_peaks'].set_data(peak_times[in_window], peak_values[in_window])
+    
+    hr_valid = ~np.ma.getmaskarray(heart_rates)
+    live_artists['heart_rate'].set_data(peak_times[1:][hr_valid], heart_rates.compressed())
+    
+    # Skala Y: ubah hanya jika data keluar batas atau rentang jauh menyusut
+    ylim = blit_state['ylim']
+    if len(time_data):
+        low = min(filtered_ppg.min(), visible['threshold'].min())
+        high = max(filtered_ppg.max(), visible['threshold'].max())
+        span = max(high - low, 1.0)
+        if ylim is None or low < ylim[0] or high > ylim[1] or span < 0.4 * (ylim[1] - ylim[0]):
+            ylim = (low - 0.15 * span, high + 0.15 * span)
+    
+    title_suffix = " [⏳ SETTLING...]" if engine.is_settling else " [✅ READY]"
+    hr_title = f"Detak Jantung Real-time [{len(engine.aggregated_data) // 10 * 10}+ agregat]"
+    if engine.is_settling:
+        hr_title += " [⏳ WAITING...]"
+    titles = (f"Sinyal AC - {selected_subject}{title_suffix}", hr_title)
+    
+    backgrounds = blit_state['backgrounds']
+    if (backgrounds is None or xlim != blit_state['xlim'] or ylim != blit_state['ylim']
+            or titles != blit_state['titles']):
+        # Full redraw: background baru di-cache oleh on_canvas_draw
+        ax1.set_xlim(*xlim)
+        ax2.set_xlim(*xlim)
+        if ylim is not None:
+            ax1.set_ylim(*ylim)
+        ax1.set_title(titles[0], fontsize=11, fontweight='bold')
+        ax2.set_title(titles[1], fontsize=11, fontweight='bold')
+        live_artists['ready_line'].set_visible(latest_time >= engine.SETTLING_DURATION)
+        blit_state.update(xlim=xlim, ylim=ylim, titles=titles, hr_count=engine.peak_index.count)
+        canvas.draw()
+        return
     
+    # Blit: hanya axes yang berubah
+    canvas.restore_region(backgrounds[0])
+    for name in ('signal', 'threshold', 'esp32_beats', 'python_peaks'):
+        ax1.draw_artist(live_artists[name])
+    canvas.blit(ax1.bbox)
+    
+    if engine.peak_index.count != blit_state['hr_count']:
+        blit_state['hr_count'] = engine.peak_index.count
+        canvas.restore_region(backgrounds[1])
+        ax2.draw_artist(live_artists['heart_rate'])
+        canvas.blit(ax2.bbox)
+
+def update_plot():
+    """Update plot: mode cepat (blit) saat pengukuran, versi lengkap selain itu"""
     try:
-        if len(time_data) == 0:
-            ax1.clear()
-            ax2.clear()
-            ax1.set_xlabel("Waktu (detik)")
-            ax1.set_ylabel("Amplitudo AC")
-            ax1.set_title(f"Sinyal AC (Filtered) - {selected_subject}")
-            ax1.grid(True, alpha=0.3)
-            
-            ax2.set_xlabel("Waktu (detik)")
-            ax2.set_ylabel("Detak Jantung (BPM)")
-            ax2.set_title("Detak Jantung Real-time")
-            ax2.grid(True, alpha=0.3)
-            canvas.draw_idle()
-            return
-        
-        # ============= PLOT 1: AC SIGNAL =============
-        ax1.clear()
-        
-        # Apply filter if enough data
-        if len(ppg_data) > 50:
-            filtered_ppg = bandpass_filter(ppg_data)
+        if FAST_PLOT and engine.collecting and engine.sample_store.total_count > 0:
+            update_plot_fast()
         else:
-            filtered_ppg = ppg_data
-        
-        # Plot AC signal
-        ax1.plot(time_data, filtered_ppg, 'r-', label="Sinyal AC (Filtered)", linewidth=1.5)
-        
-        # Plot threshold line
-        if ir_data:
-            ax1.plot(time_data, ir_data[:len(time_data)], 'b--', label="Threshold (80)", linewidth=1, alpha=0.7)
-        
-        # ===== VISUAL SETTLING ZONE =====
-        if is_settling or (len(time_data) > 0 and max(time_data) < SETTLING_DURATION):
-            settling_end = min(SETTLING_DURATION, max(time_data) if time_data else 0)
-            ax1.axvspan(0, settling_end, alpha=0.2, color='yellow', label='Settling Zone')
-            if max(time_data) >= SETTLING_DURATION:
-                ax1.axvline(x=SETTLING_DURATION, color='green', linestyle=':', linewidth=2, label='Ready!')
-        
-        # Mark beats from ESP32
-        beat_times = [time_data[i] for i in range(len(beat_markers)) 
-                     if i < len(time_data) and beat_markers[i] > 0]
-        beat_values = [filtered_ppg[i] for i in range(len(beat_markers)) 
-                      if i < len(filtered_ppg) and beat_markers[i] > 0]
-        
-        if beat_times and beat_values:
-            ax1.plot(beat_times, beat_values, "go", label="Beat ESP32", markersize=8, 
-                    markeredgecolor='black', markeredgewidth=1)
-        
-        # Detect and mark peaks using Python (optional, for comparison)
-        if len(filtered_ppg) > 50:
-            peak_times, peak_values, heart_rates = detect_heartbeats(filtered_ppg, time_data)
-            if peak_times and peak_values:
-                ax1.plot(peak_times, peak_values, "m^", label="Detak Python", markersize=6, alpha=0.7)
-        
-        # Title dengan status settling
-        title_suffix = " [⏳ SETTLING...]" if is_settling else " [✅ READY]"
-        ax1.set_xlabel("Waktu (detik)", fontsize=10)
-        ax1.set_ylabel("Amplitudo AC", fontsize=10)
-        ax1.set_title(f"Sinyal AC - {selected_subject}{title_suffix}", fontsize=11, fontweight='bold')
-        ax1.legend(loc='upper right', fontsize=8)
-        ax1.grid(True, alpha=0.3)
-        
-        # ============= PLOT 2: HEART RATE =============
-        ax2.clear()
-        
-        if len(filtered_ppg) > 50:
-            peak_times, peak_values, heart_rates = detect_heartbeats(filtered_ppg, time_data)
-            valid_hrs = [(peak_times[i+1], hr) for i, hr in enumerate(heart_rates) if hr is not None]
-            
-            if valid_hrs:
-                hr_times = [t for t, hr in valid_hrs]
-                hr_values = [hr for t, hr in valid_hrs]
-                ax2.plot(hr_times, hr_values, 'b-o', label="Detak Jantung", linewidth=2, markersize=4)
-                
-                # Add reference lines
-                ax2.axhline(y=60, color='g', linestyle='--', alpha=0.5, label='Normal Min (60)')
-                ax2.axhline(y=100, color='r', linestyle='--', alpha=0.5, label='Normal Max (100)')
-                
-                # Settling zone di plot HR juga
-                if is_settling or (len(time_data) > 0 and max(time_data) < SETTLING_DURATION):
-                    settling_end = min(SETTLING_DURATION, max(time_data) if time_data else 0)
-                    ax2.axvspan(0, settling_end, alpha=0.2, color='yellow')
-                    if max(time_data) >= SETTLING_DURATION:
-                        ax2.axvline(x=SETTLING_DURATION, color='green', linestyle=':', linewidth=2)
-        
-        ax2.set_xlabel("Waktu (detik)", fontsize=10)
-        ax2.set_ylabel("Detak Jantung (BPM)", fontsize=10)
-        
-        # Title dengan info agregat
-        hr_title = f"Detak Jantung Real-time [{len(aggregated_data)} agregat]"
-        if is_settling:
-            hr_title += " [⏳ WAITING...]"
-        ax2.set_title(hr_title, fontsize=11, fontweight='bold')
-        
-        ax2.legend(loc='upper right', fontsize=8)
-        ax2.grid(True, alpha=0.3)
-        ax2.set_ylim(30, 120)
-        
-        # Draw canvas
-        canvas.draw_idle()
+            update_plot_full()
         
         # Update data table dan analysis
         update_data_table()
@@ -1436,12 +1268,137 @@ def update_plot():
         import traceback
         traceback.print_exc()
 
+def update_plot_full():
+    """Update matplotlib plots - FULL VERSION with SETTLING indicator"""
+    # Axes dibersihkan: artist mode cepat harus dibuat ulang
+    live_artists.clear()
+    
+    if engine.sample_store.total_count == 0:
+        ax1.clear()
+        ax2.clear()
+        ax1.set_xlabel("Waktu (detik)")
+        ax1.set_ylabel("Amplitudo AC")
+        ax1.set_title(f"Sinyal AC (Filtered) - {selected_subject}")
+        ax1.grid(True, alpha=0.3)
+        
+        ax2.set_xlabel("Waktu (detik)")
+        ax2.set_ylabel("Detak Jantung (BPM)")
+        ax2.set_title("Detak Jantung Real-time")
+        ax2.grid(True, alpha=0.3)
+        canvas.draw_idle()
+        return
+    
+    # View zero-copy dari jendela live
+    samples = engine.sample_store.view()
+    time_data = samples['time']
+    ir_data = samples['threshold']
+    beat_markers = samples['beat']
+    latest_time = engine.sample_store.last_time()
+    
+    # ============= PLOT 1: AC SIGNAL =============
+    ax1.clear()
+    
+    # Sinyal sudah difilter streaming saat ingest (tanpa filtfilt per tick)
+    filtered_ppg = samples['filtered']
+    
+    # Plot AC signal (didecimasi min/max ke ~2x lebar piksel)
+    ax1.plot(*decimate_for_axes('signal', ax1, time_data, filtered_ppg),
+             'r-', label="Sinyal AC (Filtered)", linewidth=1.5)
+    
+    # Plot threshold line
+    if len(ir_data):
+        ax1.plot(*decimate_for_axes('threshold', ax1, time_data, ir_data),
+                 'b--', label="Threshold (80)", linewidth=1, alpha=0.7)
+    
+    # ===== RINGKASAN SESI PANJANG (PIRAMIDA AGREGAT) =====
+    # Riwayat sebelum jendela live: envelope min/max dari level terkasar yang cukup detail
+    if not engine.collecting and engine.sample_store.total_count > engine.sample_store.capacity and len(engine.aggregated_data):
+        resolution = latest_time / max(1.0, ax1.bbox.width)
+        bucket, summary = engine.aggregate_pyramid.query(resolution, t_end=time_data[0])
+        ax1.fill_between(summary['time_avg'], summary['ac_min'], summary['ac_max'],
+                         color='gray', alpha=0.3, label=f"AC mentah min/max ({bucket:g} s)")
+    
+    # ===== VISUAL SETTLING ZONE =====
+    if engine.is_settling or latest_time < engine.SETTLING_DURATION:
+        settling_end = min(engine.SETTLING_DURATION, latest_time)
+        ax1.axvspan(0, settling_end, alpha=0.2, color='yellow', label='Settling Zone')
+        if latest_time >= engine.SETTLING_DURATION:
+            ax1.axvline(x=engine.SETTLING_DURATION, color='green', linestyle=':', linewidth=2, label='Ready!')
+    
+    # Mark beats from ESP32
+    beat_idx = np.flatnonzero(beat_markers)
+    beat_times = time_data[beat_idx]
+    beat_values = filtered_ppg[beat_idx]
+    
+    if len(beat_idx):
+        ax1.plot(beat_times, beat_values, "go", label="Beat ESP32", markersize=8, 
+                markeredgecolor='black', markeredgewidth=1)
+    
+    # Mark peaks from the shared Python peak index (for comparison)
+    peak_times, peak_values, heart_rates = engine.peak_index.snapshot()
+    in_window = peak_times >= time_data[0]
+    if np.any(in_window):
+        ax1.plot(peak_times[in_window], peak_values[in_window], "m^", label="Detak Python", markersize=6, alpha=0.7)
+    
+    # Title dengan status settling
+    title_suffix = " [⏳ SETTLING...]" if engine.is_settling else " [✅ READY]"
+    ax1.set_xlabel("Waktu (detik)", fontsize=10)
+    ax1.set_ylabel("Amplitudo AC", fontsize=10)
+    ax1.set_title(f"Sinyal AC - {selected_subject}{title_suffix}", fontsize=11, fontweight='bold')
+    ax1.legend(loc='upper right', fontsize=8)
+    ax1.grid(True, alpha=0.3)
+    
+    # ============= PLOT 2: HEART RATE =============
+    ax2.clear()
+    
+    # Pakai snapshot peak_index yang sama dengan plot AC (tanpa deteksi ulang)
+    if len(peak_times) >= 2:
+        # HR ke-i milik interval yang berakhir di puncak i+1
+        hr_times = peak_times[1:][~np.ma.getmaskarray(heart_rates)]
+        hr_values = heart_rates.compressed()
+        
+        if len(hr_values):
+            ax2.plot(hr_times, hr_values, 'b-o', label="Detak Jantung", linewidth=2, markersize=4)
+            
+            # Add reference lines
+            ax2.axhline(y=60, color='g', linestyle='--', alpha=0.5, label='Normal Min (60)')
+            ax2.axhline(y=100, color='r', linestyle='--', alpha=0.5, label='Normal Max (100)')
+            
+            # Settling zone di plot HR juga
+            if engine.is_settling or latest_time < engine.SETTLING_DURATION:
+                settling_end = min(engine.SETTLING_DURATION, latest_time)
+                ax2.axvspan(0, settling_end, alpha=0.2, color='yellow')
+                if latest_time >= engine.SETTLING_DURATION:
+                    ax2.axvline(x=engine.SETTLING_DURATION, color='green', linestyle=':', linewidth=2)
+    
+    ax2.set_xlabel("Waktu (detik)", fontsize=10)
+    ax2.set_ylabel("Detak Jantung (BPM)", fontsize=10)
+    
+    # Title dengan info agregat
+    hr_title = f"Detak Jantung Real-time [{len(engine.aggregated_data)} agregat]"
+    if engine.is_settling:
+        hr_title += " [⏳ WAITING...]"
+    ax2.set_title(hr_title, fontsize=11, fontweight='bold')
+    
+    ax2.legend(loc='upper right', fontsize=8)
+    ax2.grid(True, alpha=0.3)
+    ax2.set_ylim(30, 120)
+    
+    # Draw canvas
+    canvas.draw_idle()
+
 def periodic_update():
     """Periodic update for real-time display"""
     global update_needed
     
     try:
-        if update_needed and len(time_data) >= 0:
+        # Ambil semua blok sampel yang sudah diproses stage DSP
+        poll_samples()
+        engine.timeseries_streamer.flush()
+        if engine.session_archive is not None:
+            engine.session_archive.sync()
+        
+        if update_needed:
             update_plot()
             update_needed = False
         
@@ -1450,18 +1407,19 @@ def periodic_update():
     except Exception as e:
         print(f"Update error: {e}")
     
-    interval = 50 if collecting or len(time_data) > 0 else 200
+    interval = 50 if engine.collecting or engine.sample_store.total_count > 0 else 200
     root.after(interval, periodic_update)
 
 def save_excel():
-    """Save data to Excel - VERSI BUFFERED (DATA AGREGAT)"""
-    if not time_data or not ppg_data:
+    """Save data to Excel - ekspor ringkas (downsampled); data lengkap ada di arsip sesi"""
+    if engine.sample_store.total_count == 0:
         messagebox.showwarning("Peringatan", "Tidak ada data")
         return
     
     # Agregasi sisa buffer jika ada
-    if len(data_buffer['time']) > 0:
-        aggregate_buffer()
+    with engine.dsp_lock:
+        if len(engine.data_buffer) > 0:
+            engine.aggregate_buffer()
     
     try:
         timestamp = time.strftime("%Y%m%d_%H%M%S")
@@ -1477,14 +1435,21 @@ def save_excel():
         
         if file_path:
             # Sheet 1: Data Agregat (lebih ringkas, tidak spam!)
-            df_aggregated = pd.DataFrame(aggregated_data)
+            df_aggregated = pd.DataFrame(engine.aggregated_data.columns(), copy=False)
             df_aggregated['subjek'] = selected_subject
             
-            # Sheet 2: Raw Data Downsampled (untuk referensi)
-            df_raw = pd.DataFrame(raw_downsampled)
+            # Sheet 2: Raw Data Downsampled (untuk referensi, dijarangkan lagi bila terlalu panjang)
+            raw_step = max(1, -(-len(engine.raw_downsampled) // engine.EXCEL_MAX_ROWS))
+            raw_columns = {name: col[::raw_step] for name, col in engine.raw_downsampled.columns().items()}
+            df_raw = pd.DataFrame(raw_columns, copy=False)
             df_raw['subjek'] = selected_subject
             
-            # Sheet 3: Summary
+            # Sheet 3: Ringkasan sesi dari piramida agregat (level terkasar <= resolusi ekspor)
+            summary_bucket, summary_columns = engine.aggregate_pyramid.query(engine.EXPORT_SUMMARY_RESOLUTION)
+            df_pyramid = pd.DataFrame(summary_columns, copy=False)
+            df_pyramid['subjek'] = selected_subject
+            
+            # Sheet 4: Summary
             summary_data = {
                 'Parameter': [
                     'Subjek',
@@ -1498,12 +1463,12 @@ def save_excel():
                 ],
                 'Nilai': [
                     selected_subject,
-                    len(ppg_data),
-                    len(aggregated_data),
-                    len(raw_downsampled),
-                    f"{(1 - len(aggregated_data)/max(1, len(ppg_data)))*100:.1f}",
-                    f"{max(time_data):.2f}" if time_data else "0",
-                    "50",
+                    engine.sample_store.total_count,
+                    len(engine.aggregated_data),
+                    len(engine.raw_downsampled),
+                    f"{(1 - len(engine.aggregated_data)/max(1, engine.sample_store.total_count))*100:.1f}",
+                    f"{engine.sample_store.last_time():.2f}",
+                    f"{engine.sample_clock.measured_rate:.2f}",
                     time.strftime('%Y-%m-%d %H:%M:%S')
                 ]
             }
@@ -1513,16 +1478,19 @@ def save_excel():
             with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
                 df_aggregated.to_excel(writer, sheet_name='Data Agregat', index=False)
                 df_raw.to_excel(writer, sheet_name='Raw Downsampled', index=False)
+                df_pyramid.to_excel(writer, sheet_name=f'Ringkasan {summary_bucket:g}s', index=False)
                 df_summary.to_excel(writer, sheet_name='Summary', index=False)
             
             messagebox.showinfo("Berhasil", 
                               f"✅ Data disimpan ke {file_path}\n\n"
                               f"📊 BUFFERED VERSION:\n"
-                              f"Sheet 1: Data Agregat ({len(aggregated_data)} records)\n"
-                              f"Sheet 2: Raw Downsampled ({len(raw_downsampled)} samples)\n"
-                              f"Sheet 3: Summary\n\n"
-                              f"Efisiensi: {(1-len(aggregated_data)/max(1,len(ppg_data)))*100:.1f}% pengurangan!\n"
-                              f"Dari {len(ppg_data)} → {len(aggregated_data)} records")
+                              f"Sheet 1: Data Agregat ({len(engine.aggregated_data)} records)\n"
+                              f"Sheet 2: Raw Downsampled ({len(df_raw)} samples)\n"
+                              f"Sheet 3: Ringkasan {summary_bucket:g}s ({len(df_pyramid)} records)\n"
+                              f"Sheet 4: Summary\n\n"
+                              f"Efisiensi: {(1-len(engine.aggregated_data)/max(1,engine.sample_store.total_count))*100:.1f}% pengurangan!\n"
+                              f"Dari {engine.sample_store.total_count} → {len(engine.aggregated_data)} records"
+                              + (f"\n\n🗄️ Data lengkap: {engine.session_archive.path}" if engine.session_archive is not None else ""))
             
     except Exception as e:
         messagebox.showerror("Error", f"Gagal menyimpan:\n{str(e)}")
@@ -1555,15 +1523,14 @@ def save_png():
 
 def close_app():
     """Close application"""
-    global serial_running, db_conn
-    
     try:
-        serial_running = False
-        if ser and ser.is_open:
-            ser.close()
+        engine.close_active_source()
+        
+        # Job database yang masih antre diselesaikan dulu, lalu pool ditutup
+        engine.db_writer.stop()
         
-        if db_conn and not db_conn.closed:
-            db_conn.close()
+        engine.close_session_archive()
+        engine.sample_store.close()
     except:
         pass
     
@@ -1577,9 +1544,12 @@ def refresh_plot_manually():
 def setup_gui():
     """Initialize GUI"""
     global root, fig, ax1, ax2, canvas, status_label, data_count_label, latest_data_label
-    global data_tree, analysis_text, port_label, db_status_label
+    global data_tree, table_range_label, analysis_text, port_label, db_status_label
     
     root = tk.Tk()
+    # Callback engine (thread DB / DSP) dijalankan di thread Tk
+    engine.client_dispatch = lambda callback, *args: root.after(0, callback, *args)
+    engine.source_finished_hook = finish_source
     root.title(f"Monitor Detak Jantung MAX30102 + PostgreSQL (BUFFERED) - {selected_subject}")
     root.protocol("WM_DELETE_WINDOW", close_app)
     root.state('zoomed')
@@ -1628,11 +1598,25 @@ def setup_gui():
     
     canvas = FigureCanvasTkAgg(fig, master=plot_frame)
     canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    # Cache background blit setiap full draw (termasuk resize)
+    canvas.mpl_connect('draw_event', on_canvas_draw)
     
     # Data table
-    table_frame = tk.LabelFrame(main_frame, text="Tabel Data (50 Terakhir)", font=("Arial", 12, "bold"))
+    table_frame = tk.LabelFrame(main_frame, text=f"Tabel Data ({TABLE_VIEW_ROWS} Baris)", font=("Arial", 12, "bold"))
     table_frame.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
     
+    # Navigasi riwayat (paging dari sample_store)
+    table_nav = tk.Frame(table_frame)
+    table_nav.pack(side="bottom", fill=tk.X, padx=5, pady=(0, 5))
+    tk.Button(table_nav, text="◀ Lama", command=lambda: (table_model.page_older(), update_data_table()),
+              font=("Arial", 8)).pack(side="left", padx=2)
+    tk.Button(table_nav, text="Baru ▶", command=lambda: (table_model.page_newer(), update_data_table()),
+              font=("Arial", 8)).pack(side="left", padx=2)
+    tk.Button(table_nav, text="⏬ Live", command=lambda: (table_model.follow_live(), update_data_table()),
+              font=("Arial", 8)).pack(side="left", padx=2)
+    table_range_label = tk.Label(table_nav, text="LIVE", font=("Arial", 8), fg="gray")
+    table_range_label.pack(side="right", padx=2)
+    
     table_container = tk.Frame(table_frame)
     table_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
     
@@ -1688,7 +1672,7 @@ def setup_gui():
     status_label = tk.Label(status_frame, text="Status: Tidak Terhubung", font=("Arial", 14, "bold"), fg="red")
     status_label.pack(side=tk.LEFT)
     
-    port_label = tk.Label(status_frame, text=f"Port: {DEFAULT_PORT} (default)", font=("Arial", 12))
+    port_label = tk.Label(status_frame, text=f"Sumber: {engine.DEFAULT_PORT} (default)", font=("Arial", 12))
     port_label.pack(side=tk.LEFT, padx=20)
     
     db_status_label = tk.Label(status_frame, text="Database: Tidak Terhubung", font=("Arial", 12), fg="red")
@@ -1701,14 +1685,18 @@ def setup_gui():
     data_count_label.pack(side=tk.RIGHT)
     
     # Serial connection controls
-    serial_frame = tk.LabelFrame(control_frame, text="Koneksi Serial", font=("Arial", 11, "bold"))
+    serial_frame = tk.LabelFrame(control_frame, text="Sumber Data", font=("Arial", 11, "bold"))
     serial_frame.pack(fill=tk.X, padx=5, pady=3)
     
-    tk.Button(serial_frame, text=f"Auto-Connect ({DEFAULT_PORT})", command=connect_serial_auto, 
+    tk.Button(serial_frame, text=f"Auto-Connect ({engine.DEFAULT_PORT})", command=connect_serial_auto, 
              bg="lightgreen", width=20, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=3, pady=3)
     tk.Button(serial_frame, text="Pilih Port Manual", command=connect_serial, 
              bg="lightblue", width=18, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=3, pady=3)
-    tk.Button(serial_frame, text="Putuskan Serial", command=disconnect_serial, 
+    tk.Button(serial_frame, text="Jaringan (WS/TCP)", command=connect_network, 
+             bg="lightblue", width=16, font=("Arial", 10)).pack(side=tk.LEFT, padx=3, pady=3)
+    tk.Button(serial_frame, text="Simulator PPG", command=connect_simulator, 
+             bg="plum", width=14, font=("Arial", 10)).pack(side=tk.LEFT, padx=3, pady=3)
+    tk.Button(serial_frame, text="Putuskan Sumber", command=disconnect_source, 
              bg="lightcoral", width=15, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=3, pady=3)
     
     # Database controls
@@ -1721,6 +1709,8 @@ def setup_gui():
              bg="lightblue", width=18, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=3, pady=3)
     tk.Button(db_frame, text="Lihat Data Tersimpan", command=view_database_records, 
              bg="lightyellow", width=18, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=3, pady=3)
+    tk.Button(db_frame, text="Ekspor Database", command=export_database, 
+             bg="lightyellow", width=18, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=3, pady=3)
     tk.Button(db_frame, text="Putuskan Database", command=disconnect_database, 
              bg="lightcoral", width=18, font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=3, pady=3)
     
@@ -1734,7 +1724,7 @@ def setup_gui():
             command=set_subject, bg="lightblue", width=25, font=("Arial", 10, "bold"))
     patient_button.pack(side=tk.LEFT, padx=3, pady=3)
 
-    tk.Label(config_frame, text=f"📊 Buffer: {BUFFER_SIZE} | Downsample: 1/{DOWNSAMPLE_RATE}", 
+    tk.Label(config_frame, text=f"📊 Buffer: {engine.BUFFER_SIZE} | Downsample: 1/{engine.DOWNSAMPLE_RATE}", 
             font=("Arial", 10), fg="darkgreen").pack(side=tk.LEFT, padx=20)
     
     # Main controls
@@ -1749,6 +1739,8 @@ def setup_gui():
              bg="lightyellow", width=12, font=("Arial", 10)).pack(side=tk.LEFT, padx=3, pady=3)
     tk.Button(main_control_frame, text="Refresh Grafik", command=refresh_plot_manually, 
              bg="lightcyan", width=12, font=("Arial", 10)).pack(side=tk.LEFT, padx=3, pady=3)
+    tk.Button(main_control_frame, text="▶ Replay Rekaman", command=start_replay, 
+             bg="plum", width=15, font=("Arial", 10)).pack(side=tk.LEFT, padx=3, pady=3)
     
     # Analysis controls
     analysis_control_frame = tk.LabelFrame(control_frame, text="Analisis & Ekspor (BUFFERED)", font=("Arial", 11, "bold"))
@@ -1767,7 +1759,7 @@ def setup_gui():
     tk.Button(analysis_control_frame, text="Keluar", command=close_app, 
              bg="lightgray", width=10, font=("Arial", 10, "bold")).pack(side=tk.RIGHT, padx=3, pady=3)
     
-    update_analysis_display()
+    update_analysis_display(force=True)
 
 def main():
     """Main entry point"""
@@ -1775,16 +1767,16 @@ def main():
     print("  MONITOR DETAK JANTUNG MAX30102 + POSTGRESQL")
     print("  ✨ BUFFERED VERSION - ANTI SPAM! ✨")
     print("="*60)
-    print(f"Serial Port: {DEFAULT_PORT} @ {DEFAULT_BAUDRATE}")
-    print(f"Database: {DB_CONFIG['database']} @ {DB_CONFIG['host']}:{DB_CONFIG['port']}")
-    print(f"Buffer Size: {BUFFER_SIZE} samples (~{BUFFER_SIZE/50:.1f} detik @ 50Hz)")
-    print(f"Downsample Rate: 1/{DOWNSAMPLE_RATE}")
+    print(f"Serial Port: {engine.DEFAULT_PORT} @ {engine.DEFAULT_BAUDRATE}")
+    print(f"Database: {engine.DB_CONFIG['database']} @ {engine.DB_CONFIG['host']}:{engine.DB_CONFIG['port']}")
+    print(f"Buffer Size: {engine.BUFFER_SIZE} samples (~{engine.BUFFER_SIZE/50:.1f} detik @ 50Hz)")
+    print(f"Downsample Rate: 1/{engine.DOWNSAMPLE_RATE}")
     print("="*60)
     
     setup_gui()
     
     # Auto-connect on startup
-    print("\n🔌 Mencoba auto-connect ke", DEFAULT_PORT, "...")
+    print("\n🔌 Mencoba auto-connect ke", engine.DEFAULT_PORT, "...")
     root.after(500, connect_serial_auto)
     
     root.after(100, periodic_update)